@@ -0,0 +1,221 @@
+"""Benchmark of the transport between the trainer and its environment workers.
+
+Starts K synthetic environments whose steps return preallocated observation
+payloads of configurable shape and dtype, so that the measured cost is the IPC
+and batching of ParallelPyEnvironment / TFPyEnvironment and not simulation.
+For every transport (pipe: local worker processes, unix / tcp: workers of a
+RemoteEnvServer on a Unix socket or a localhost TCP port) and batching mode
+(nonblocking, blocking: ParallelPyEnvironment stepping envs concurrently or one
+after another, tf: TFPyEnvironment over the nonblocking batch), reports
+percentiles of the batched step latency, env steps per second, observation
+bytes moved and CPU time of the parent process per batched step. Results are
+written to a JSON file so that they can be compared across commits.
+
+  python -m agent.benchmarks.env_ipc_benchmark --num_envs 4 --steps 500 \
+    --payload rgb:360x640x3:uint8 --payload depth:360x640x1:float32 --output ipc.json
+"""
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from collections import OrderedDict
+
+import gym
+import numpy as np
+import torch
+
+from agent.environments import gym_wrapper
+from agent.environments import tf_py_environment
+from agent.environments.parallel_py_environment import ParallelPyEnvironment
+from agent.environments.remote_py_environment import RemoteEnvServer
+
+TRANSPORTS = ('pipe', 'unix', 'tcp')
+MODES = ('nonblocking', 'blocking', 'tf')
+AUTHKEY = b'env_ipc_benchmark'
+
+
+class SyntheticEnv(gym.Env):
+    """
+    Environment returning preallocated observation payloads, touched every step
+    """
+
+    def __init__(self, payloads):
+        """
+        :param payloads: list of (name, shape, dtype) of the observations
+        """
+        self.observation_space = gym.spaces.Dict(OrderedDict(
+            (name, gym.spaces.Box(low=0, high=1, shape=shape, dtype=np.dtype(dtype)))
+            for name, shape, dtype in payloads))
+        self.action_space = gym.spaces.Box(low=-1.0, high=1.0, shape=(2,), dtype=np.float32)
+        self.state = OrderedDict(
+            (name, np.zeros(shape, dtype=dtype)) for name, shape, dtype in payloads)
+        self.current_step = 0
+
+    def step(self, action):
+        self.current_step += 1
+        for array in self.state.values():
+            array.flat[0] = self.current_step % 2
+        info = {'done': False, 'episode_length': self.current_step}
+        return self.state, 0.0, False, info
+
+    def reset(self):
+        self.current_step = 0
+        return self.state
+
+
+def load_synthetic(payloads):
+    return gym_wrapper.GymWrapper(SyntheticEnv(payloads), match_obs_space_dtype=True,
+                                  auto_reset=True, simplify_box_bounds=True)
+
+
+def serve(address, num_envs, payloads):
+    env_constructors = [functools.partial(load_synthetic, payloads)] * num_envs
+    RemoteEnvServer(address, env_constructors, authkey=AUTHKEY).serve_forever()
+
+
+def parse_payload(value):
+    name, shape, dtype = value.split(':')
+    return name, tuple(int(d) for d in shape.split('x')), np.dtype(dtype).name
+
+
+def observation_bytes(observation):
+    if isinstance(observation, dict):
+        return sum(observation_bytes(value) for value in observation.values())
+    if torch.is_tensor(observation):
+        return observation.element_size() * observation.nelement()
+    return np.asarray(observation).nbytes
+
+
+def make_env(transport, mode, args, payloads):
+    """
+    :return: batched environment, server process or None
+    """
+    server = None
+    if transport == 'pipe':
+        env = ParallelPyEnvironment([functools.partial(load_synthetic, payloads)] * args.num_envs,
+                                    blocking=mode == 'blocking', start_method=args.start_method)
+    else:
+        if transport == 'unix':
+            address = os.path.join(tempfile.mkdtemp(), 'envs.sock')
+            endpoint = address
+        else:
+            address = ('localhost', args.tcp_port)
+            endpoint = 'localhost:{}'.format(args.tcp_port)
+            args.tcp_port += 1
+        server = multiprocessing.Process(target=serve, args=(address, args.num_envs, payloads))
+        server.start()
+        for _ in range(100):
+            if transport == 'tcp' or os.path.exists(address):
+                break
+            time.sleep(0.05)
+        time.sleep(0.2)
+        env = ParallelPyEnvironment(
+            [], blocking=mode == 'blocking',
+            remote_endpoints=['{}#{}'.format(endpoint, i) for i in range(args.num_envs)],
+            remote_authkey=AUTHKEY)
+    if mode == 'tf':
+        env = tf_py_environment.TFPyEnvironment(env)
+    return env, server
+
+
+def run(transport, mode, args, payloads):
+    env, server = make_env(transport, mode, args, payloads)
+    try:
+        actions = np.zeros((args.num_envs, 2), dtype=np.float32)
+        if mode == 'tf':
+            actions = torch.from_numpy(actions)
+        env.reset()
+        for _ in range(args.warmup):
+            env.step(actions)
+
+        latencies = np.empty(args.steps)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        for i in range(args.steps):
+            start = time.perf_counter()
+            time_step = env.step(actions)
+            latencies[i] = time.perf_counter() - start
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        observation = time_step.observation if mode == 'tf' else [t[3] for t in time_step]
+        if isinstance(observation, list):
+            nbytes = sum(observation_bytes(o) for o in observation)
+        else:
+            nbytes = observation_bytes(observation)
+    finally:
+        env.close()
+        if server is not None:
+            server.terminate()
+            server.join()
+
+    return OrderedDict([
+        ('transport', transport),
+        ('mode', mode),
+        ('num_envs', args.num_envs),
+        ('steps', args.steps),
+        ('latency_ms', OrderedDict(
+            ('p{}'.format(q), float(np.percentile(latencies, q) * 1e3)) for q in (50, 90, 99))),
+        ('latency_ms_mean', float(latencies.mean() * 1e3)),
+        ('env_steps_per_s', args.num_envs * args.steps / wall),
+        ('observation_bytes_per_step', int(nbytes)),
+        ('throughput_mb_per_s', nbytes * args.steps / wall / 1e6),
+        ('parent_cpu_ms_per_step', cpu / args.steps * 1e3),
+    ])
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_envs', type=int, default=4)
+    parser.add_argument('--steps', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--payload', type=parse_payload, action='append', default=None,
+                        help='observation name:shape:dtype, e.g. depth:360x640x1:float32; repeatable')
+    parser.add_argument('--transports', type=str, default=','.join(TRANSPORTS))
+    parser.add_argument('--modes', type=str, default=','.join(MODES))
+    parser.add_argument('--start_method', type=str, default=None,
+                        help='multiprocessing start method of the local workers')
+    parser.add_argument('--tcp_port', type=int, default=6200,
+                        help='first localhost port used by the tcp transport')
+    parser.add_argument('--output', type=str, default='env_ipc_benchmark.json')
+    args = parser.parse_args()
+    payloads = args.payload or [parse_payload('rgb:360x640x3:float32'),
+                                parse_payload('depth:360x640x1:float32')]
+
+    results = []
+    for transport in args.transports.split(','):
+        for mode in args.modes.split(','):
+            result = run(transport, mode, args, payloads)
+            results.append(result)
+            print('{:>5} {:>12}  p50 {:8.3f} ms  p99 {:8.3f} ms  {:9.1f} steps/s  {:8.1f} MB/s  '
+                  'parent cpu {:7.3f} ms/step'.format(
+                      transport, mode, result['latency_ms']['p50'], result['latency_ms']['p99'],
+                      result['env_steps_per_s'], result['throughput_mb_per_s'],
+                      result['parent_cpu_ms_per_step']))
+
+    report = OrderedDict([
+        ('git_revision', git_revision()),
+        ('time', time.strftime('%Y-%m-%dT%H:%M:%S')),
+        ('host', platform.node()),
+        ('python', platform.python_version()),
+        ('payloads', [OrderedDict([('name', name), ('shape', list(shape)), ('dtype', dtype)])
+                      for name, shape, dtype in payloads]),
+        ('results', results),
+    ])
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('wrote {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Benchmark and consistency check of the global occupancy map accumulation.
+
+Drives a random trajectory, merges the local grid of a random scan into a
+GlobalOccupancyMap at every step and reads back the ego-centric crop. Reports the
+per-step cost of the update and of the crop next to the local grid rasterization and
+the previous per-cell Python merge loop, and the fraction of observed local cells the
+crop reproduces right after the update (below 1 only through nearest-neighbour
+resampling when the map cells do not line up with the local grid).
+
+  python -m agent.benchmarks.global_occupancy_map_benchmark --steps 200
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from agent.gibson_extension.utils.occupancy_grid_utils import LocalOccupancyGrid, GlobalOccupancyMap, UNKNOWN
+from agent.gibson_extension.utils.scan_utils import laser_unit_vectors, scan_to_base_points
+
+
+def legacy_update(global_grid, local_grid, position, yaw, occupancy_range, grid_resolution):
+    # per-cell merge of the previous ScanSensor.update_global_occupancy_grid
+    global_grid_resolution = global_grid.shape[0]
+    rotation_inv = np.array([[np.cos(yaw), np.sin(yaw)], [-np.sin(yaw), np.cos(yaw)]])
+    global_center_x = int(position[0] / occupancy_range * global_grid_resolution + global_grid_resolution / 2)
+    global_center_y = int(position[1] / occupancy_range * global_grid_resolution + global_grid_resolution / 2)
+    for i in range(grid_resolution):
+        for j in range(grid_resolution):
+            if local_grid[i, j] != UNKNOWN:
+                local_x = i - grid_resolution // 2
+                local_y = j - grid_resolution // 2
+                global_x = int(rotation_inv[0, 0] * local_x + rotation_inv[0, 1] * local_y + global_center_x)
+                global_y = int(rotation_inv[1, 0] * local_x + rotation_inv[1, 1] * local_y + global_center_y)
+                if 0 <= global_x < global_grid_resolution and 0 <= global_y < global_grid_resolution:
+                    global_grid[global_x, global_y] = local_grid[i, j]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_horizontal_rays', type=int, default=228)
+    parser.add_argument('--laser_angular_range', type=float, default=240.0)
+    parser.add_argument('--min_laser_dist', type=float, default=0.05)
+    parser.add_argument('--laser_linear_range', type=float, default=5.6)
+    parser.add_argument('--grid_resolution', type=int, default=128)
+    parser.add_argument('--occupancy_range', type=float, default=5.0)
+    parser.add_argument('--global_grid_resolution', type=int, default=512)
+    parser.add_argument('--global_map_resolution', type=float, default=0.05)
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument('--number', type=int, default=200, help='calls per measurement')
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    unit_vector_base = laser_unit_vectors(args.n_horizontal_rays, args.laser_angular_range)[:, :2]
+    translation_base = np.array([0.05, 0.0])
+    res = args.grid_resolution
+    local = LocalOccupancyGrid(res, args.occupancy_range, 8, (res // 2 + res // 15, res // 2))
+    global_map = GlobalOccupancyMap(args.global_grid_resolution, args.global_map_resolution,
+                                    res, args.occupancy_range)
+
+    def sample_scan():
+        scan = rng.uniform(size=(args.n_horizontal_rays, 1))
+        return scan_to_base_points(scan, unit_vector_base, translation_base,
+                                   args.min_laser_dist, args.laser_linear_range)
+
+    position, yaw = np.zeros(2), 0.0
+    agreement, observed = 0, 0
+    for _ in range(args.steps):
+        yaw += rng.uniform(-0.3, 0.3)
+        position = position + 0.1 * np.array([np.cos(yaw), np.sin(yaw)])
+        rotation = np.array([[np.cos(yaw), -np.sin(yaw)], [np.sin(yaw), np.cos(yaw)]])
+        grid = local.rasterize_scan(sample_scan()).copy()
+        global_map.update(grid, position, rotation)
+        crop = global_map.crop(position, rotation)[:, :, 0]
+        mask = grid != UNKNOWN
+        agreement += int(np.count_nonzero(crop[mask] == grid[mask]))
+        observed += int(np.count_nonzero(mask))
+    print('observed local cells reproduced by the crop: {:.2%}'.format(agreement / float(max(observed, 1))))
+    print('map cells observed after {} steps: {}'.format(
+        args.steps, int(np.count_nonzero(global_map.map != UNKNOWN))))
+
+    scan_local = sample_scan()
+    rotation = np.array([[np.cos(yaw), -np.sin(yaw)], [np.sin(yaw), np.cos(yaw)]])
+    grid = local.rasterize_scan(scan_local).copy()
+    legacy_grid = np.full((args.global_grid_resolution, args.global_grid_resolution), UNKNOWN, dtype=np.uint8)
+
+    def measure(fn, number):
+        return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+    local_time = measure(lambda: local.rasterize(scan_local, np.zeros(2)), args.number)
+    update_time = measure(lambda: global_map.update(grid, position, rotation), args.number)
+    crop_time = measure(lambda: global_map.crop(position, rotation), args.number)
+    legacy_time = measure(lambda: legacy_update(legacy_grid, grid, position, yaw, args.occupancy_range, res), 3)
+    print('local grid {:8.2f} us  map update {:8.2f} us  map crop {:8.2f} us  legacy per-cell merge {:10.2f} us'.format(
+        local_time * 1e6, update_time * 1e6, crop_time * 1e6, legacy_time * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Equivalence check and benchmark of the compiled act path (agent.policy.inference).
+
+Builds a PointNavResNetPolicy from the agent config, runs Policy.act and
+PolicyInference.act from the same RNG state over a sequence of steps (with
+episode ends, and after an update like a PPO epoch: a train-mode forward that
+updates the normalization statistics of the visual inputs, then an in-place
+parameter update like an optimizer step),
+fails if values, actions, log probabilities or hidden states differ by more
+than --atol, and reports the time per act call of both.
+
+  python -m agent.benchmarks.inference_check --num_envs 4 --backend script
+"""
+import argparse
+import os
+import time
+
+from collections import OrderedDict
+
+import numpy as np
+import torch
+from gym import spaces
+
+import agent
+from agent.policy.PointNavPolicy import PointNavResNetPolicy
+from agent.policy.inference import PolicyInference
+from agent.ppo.config.default import get_config
+
+
+def random_inputs(num_envs, image_size, num_recurrent_layers, hidden_size, device, episode_end=0.1):
+    observations = {
+        'task_obs': torch.randn(num_envs, 4, device=device),
+        'depth': torch.rand(num_envs, image_size, image_size, 1, device=device),
+    }
+    hidden_states = torch.randn(num_envs, num_recurrent_layers, hidden_size, device=device)
+    prev_actions = torch.rand(num_envs, 2, device=device) * 2 - 1
+    masks = torch.rand(num_envs, 1, device=device) > episode_end
+    return observations, hidden_states, prev_actions, masks
+
+
+def timed_act(act, inputs, device, repeat, warmup=3):
+    # the TorchScript profiling executor optimizes the graph over the first calls
+    with torch.no_grad():
+        for _ in range(warmup):
+            act(*inputs)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        with torch.no_grad():
+            act(*inputs)
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agent_config_file', type=str,
+                        default=os.path.join(os.path.dirname(agent.__file__), 'configs', 'agent.yaml'))
+    parser.add_argument('--backend', type=str, default='script', choices=('script', 'compile'))
+    parser.add_argument('--backbone', type=str, default=None, help='overrides RL.DDPPO.backbone')
+    parser.add_argument('--num_envs', type=int, default=4)
+    parser.add_argument('--image_size', type=int, default=256)
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--atol', type=float, default=1e-4)
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    device = torch.device(args.device)
+    opts = [] if args.backbone is None else ['RL.DDPPO.backbone', args.backbone]
+    config = get_config(args.agent_config_file, opts)
+    obs_space = spaces.Dict(OrderedDict([
+        ('task_obs', spaces.Box(low=-np.inf, high=np.inf, shape=(4,), dtype=np.float32)),
+        ('depth', spaces.Box(low=0.0, high=1.0, shape=(args.image_size, args.image_size, 1), dtype=np.float32)),
+    ]))
+    action_space = spaces.Box(low=-1.0, high=1.0, shape=(2,), dtype=np.float32)
+    policy = PointNavResNetPolicy.from_config(config, obs_space, action_space).to(device)
+    policy.eval()
+    inference = PolicyInference(policy, backend=args.backend, atol=args.atol)
+
+    num_layers, hidden_size = policy.net.num_recurrent_layers, config.RL.PPO.hidden_size
+    max_error = 0.0
+    eager_hidden = None
+    for step in range(args.steps):
+        if step == args.steps // 2:
+            # the update runs the policy in train mode, updating the running
+            # mean and variance of the visual inputs
+            policy.train()
+            with torch.no_grad():
+                observations, hidden_states, prev_actions, masks = random_inputs(
+                    args.num_envs, args.image_size, num_layers, hidden_size, device)
+                policy.evaluate_actions(observations, hidden_states, prev_actions, masks, prev_actions)
+            policy.eval()
+            # an optimizer step updates the parameters in place
+            with torch.no_grad():
+                for param in policy.parameters():
+                    param.add_(torch.randn_like(param) * 1e-3)
+        observations, hidden_states, prev_actions, masks = random_inputs(
+            args.num_envs, args.image_size, num_layers, hidden_size, device)
+        if eager_hidden is not None:
+            hidden_states = eager_hidden
+
+        with torch.no_grad():
+            torch.manual_seed(step)
+            expected = policy.act(observations, hidden_states, prev_actions, masks)
+            torch.manual_seed(step)
+            actual = inference.act(observations, hidden_states, prev_actions, masks)
+        errors = [(e - a).abs().max().item() for e, a in zip(expected, actual)]
+        max_error = max(max_error, max(errors))
+        eager_hidden = expected[3]
+        print('step {:3d}  max abs difference value {:.2e}  action {:.2e}  log_prob {:.2e}  hidden {:.2e}'.format(
+            step, *errors))
+
+    compiled = [module for module in inference._modules.values() if module is not None]
+    print('compiled signatures: {}, running eagerly: {}'.format(
+        len(compiled), len(inference._modules) - len(compiled)))
+    inputs = random_inputs(args.num_envs, args.image_size, num_layers, hidden_size, device)
+    eager_ms = timed_act(policy.act, inputs, device, args.repeat)
+    inference_ms = timed_act(inference.act, inputs, device, args.repeat)
+    print('ms per act of {} envs: eager {:.3f}  {} {:.3f}'.format(
+        args.num_envs, eager_ms, args.backend, inference_ms))
+
+    if max_error > args.atol or len(compiled) == 0:
+        raise SystemExit('compiled act path does not match the eager policy (max abs difference {:.3g})'.format(
+            max_error))
+    print('compiled act path matches the eager policy (max abs difference {:.3g})'.format(max_error))
+
+
+if __name__ == '__main__':
+    main()
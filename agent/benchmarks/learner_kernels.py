@@ -0,0 +1,280 @@
+"""Micro-benchmarks of the learner hot paths, with a JSON baseline.
+
+Times, at the shapes of a training run (num_steps x num_envs rollouts, the
+agent config's hidden size and recurrent layers, 256x256 depth after the
+observation transforms):
+
+  rollout.compute_returns         RolloutStorage.compute_returns with GAE
+  rollout.recurrent_generator     one pass over the PPO mini batches
+  rnn.build_pack_info             _build_pack_info_from_dones
+  rnn.build_rnn_inputs            build_rnn_inputs
+  obs.batch_obs[_cache]           batch_obs without / with ObservationBatchingCache
+  tensordict.set / .index         TensorDict.set and indexing of the rollout buffers
+  obs.transforms                  apply_obs_transforms_batch on env-sized images
+  net.act[backbone]               PointNavResNetNet.forward on one step of every env
+  net.update[backbone]            PointNavResNetNet.forward on update_steps steps of every env
+
+Defaults run on CPU. Record a baseline on the machine and environment to
+track, e.g. before a change:
+
+  python -m agent.benchmarks.learner_kernels --save_baseline my_machine.json
+
+then pass the recorded file to --baseline to fail on regressions. A baseline is
+only comparable under the torch and python versions, device and thread count it
+was recorded with, and --baseline refuses to compare otherwise.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from collections import OrderedDict
+
+import numpy as np
+import torch
+from gym import spaces
+
+import agent
+from agent.common.common import ObservationBatchingCache, batch_obs
+from agent.common.obs_transformers import apply_obs_transforms_batch, get_active_obs_transforms
+from agent.models.rnn_state_encoder import _build_pack_info_from_dones, build_rnn_inputs
+from agent.policy.PointNavPolicy import PointNavResNetPolicy
+from agent.ppo.config.default import get_config
+from agent.rollout.rollout_storage import RolloutStorage
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(agent.__file__), 'configs', 'agent.yaml')
+
+
+def time_kernel(fn, device, repeat, min_time=0.05):
+    """
+    Time fn, calling it in a loop long enough for the clock resolution
+
+    :return: median and min milliseconds per call
+    """
+    def sync():
+        if device.type == 'cuda':
+            torch.cuda.synchronize(device)
+
+    fn()
+    sync()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        sync()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1024:
+            break
+        number *= 2
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        sync()
+        samples.append((time.perf_counter() - start) / number * 1e3)
+    return float(np.median(samples)), float(np.min(samples))
+
+
+def observation_space(image_size, task_obs_dim=4):
+    return spaces.Dict(OrderedDict([
+        ('task_obs', spaces.Box(low=-np.inf, high=np.inf, shape=(task_obs_dim,), dtype=np.float32)),
+        ('depth', spaces.Box(low=0.0, high=1.0, shape=(image_size, image_size, 1), dtype=np.float32)),
+    ]))
+
+
+def filled_rollouts(config, obs_space, action_space, num_steps, num_envs, num_recurrent_layers, device):
+    rollouts = RolloutStorage(num_steps, num_envs, obs_space, action_space, config.RL.PPO.hidden_size,
+                              num_recurrent_layers=num_recurrent_layers)
+    for name in ('rewards', 'value_preds', 'action_log_probs', 'actions'):
+        rollouts.buffers[name].normal_()
+    rollouts.buffers['masks'].copy_(torch.rand(rollouts.buffers['masks'].shape) > 0.01)
+    for sensor in obs_space.spaces:
+        rollouts.buffers['observations'][sensor].uniform_()
+    rollouts.to(device)
+    rollouts.current_rollout_step_idxs = [num_steps]
+    return rollouts
+
+
+def kernels(args, config, device):
+    """
+    :return: list of (name, callable) to time
+    """
+    num_steps, num_envs = args.num_steps, args.num_envs
+    hidden_size = config.RL.PPO.hidden_size
+    obs_space = observation_space(args.image_size)
+    action_space = spaces.Box(low=-1.0, high=1.0, shape=(2,), dtype=np.float32)
+    nets = OrderedDict()
+    for backbone in args.backbones.split(','):
+        config.defrost()
+        config.RL.DDPPO.backbone = backbone
+        config.freeze()
+        nets[backbone] = PointNavResNetPolicy.from_config(config, obs_space, action_space).net.to(device).eval()
+    # an LSTM stores both of its states per layer
+    num_layers = next(iter(nets.values())).num_recurrent_layers
+    rollouts = filled_rollouts(config, obs_space, action_space, num_steps, num_envs, num_layers, device)
+    next_value = torch.randn(num_envs, 1, device=device)
+    gamma, tau = config.RL.PPO.gamma, config.RL.PPO.tau
+
+    rollouts.compute_returns(next_value, True, gamma, tau)
+    advantages = rollouts.buffers['returns'][:-1] - rollouts.buffers['value_preds'][:-1]
+
+    def recurrent_generator():
+        for _ in rollouts.recurrent_generator(advantages, args.num_mini_batch):
+            pass
+
+    not_dones = (torch.rand(num_steps * num_envs) > 1.0 / args.episode_length)
+    dones = torch.logical_not(not_dones)
+    rnn_x = torch.randn(num_steps * num_envs, hidden_size, device=device)
+    rnn_states = torch.randn(num_layers, num_envs, hidden_size, device=device)
+
+    env_obs = [OrderedDict([
+        ('task_obs', np.random.uniform(size=(4,)).astype(np.float32)),
+        ('depth', np.random.uniform(size=(args.env_image_height, args.env_image_width, 1)).astype(np.float32)),
+    ]) for _ in range(num_envs)]
+    cache = ObservationBatchingCache()
+    obs_transforms = get_active_obs_transforms(config)
+    env_batch = batch_obs(env_obs, device=device)
+    step_batch = rollouts.buffers[1]
+
+    result = [
+        ('rollout.compute_returns', lambda: rollouts.compute_returns(next_value, True, gamma, tau)),
+        ('rollout.recurrent_generator', recurrent_generator),
+        ('rnn.build_pack_info', lambda: _build_pack_info_from_dones(dones, num_steps)),
+        ('rnn.build_rnn_inputs', lambda: build_rnn_inputs(rnn_x, not_dones.to(device), rnn_states)),
+        ('obs.batch_obs', lambda: batch_obs(env_obs, device=device)),
+        ('obs.batch_obs_cache', lambda: batch_obs(env_obs, device=device, cache=cache)),
+        ('tensordict.set', lambda: rollouts.buffers.set(2, step_batch)),
+        ('tensordict.index', lambda: rollouts.buffers[0:num_steps, 0:num_envs // 2]),
+        ('obs.transforms', lambda: apply_obs_transforms_batch(dict(env_batch), obs_transforms)),
+    ]
+
+    hidden_states = rollouts.buffers['recurrent_hidden_states'][0]
+    for backbone, net in nets.items():
+        for name, steps in (('act', 1), ('update', args.update_steps)):
+            batch = rollouts.buffers[0:steps].map(lambda v: v.flatten(0, 1))
+
+            def forward(net=net, batch=batch):
+                with torch.no_grad():
+                    net(batch['observations'], hidden_states, batch['prev_actions'], batch['masks'])
+            result.append(('net.{}[{}]'.format(name, backbone), forward))
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """
+    :return: names of the kernels slower than the baseline by more than tolerance
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline['kernels']:
+            continue
+        ratio = result['median_ms'] / baseline['kernels'][name]['median_ms']
+        flag = ''
+        if ratio > 1.0 + tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('{:<32} {:10.3f} ms  baseline {:10.3f} ms  x{:.2f}{}'.format(
+            name, result['median_ms'], baseline['kernels'][name]['median_ms'], ratio, flag))
+    return regressions
+
+
+def baseline_mismatches(meta, device, num_threads):
+    """
+    :return: descriptions of the settings of this run that differ from the baseline meta
+    """
+    current = OrderedDict([
+        ('torch', torch.__version__),
+        ('python', '.'.join(platform.python_version_tuple()[:2])),
+        ('device', device),
+        ('num_threads', num_threads),
+    ])
+    recorded = dict(meta, python='.'.join(meta['python'].split('.')[:2]))
+    return ['{} {} (baseline {})'.format(key, value, recorded.get(key))
+            for key, value in current.items() if recorded.get(key) != value]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agent_config_file', type=str, default=DEFAULT_CONFIG)
+    parser.add_argument('--device', type=str, default='cpu')
+    parser.add_argument('--num_threads', type=int, default=None)
+    parser.add_argument('--num_steps', type=int, default=512)
+    parser.add_argument('--num_envs', type=int, default=4)
+    parser.add_argument('--num_mini_batch', type=int, default=2)
+    parser.add_argument('--update_steps', type=int, default=32,
+                        help='steps of every env in the net.update forward; num_steps for a full rollout')
+    parser.add_argument('--episode_length', type=int, default=100)
+    parser.add_argument('--image_size', type=int, default=256, help='depth size seen by the policy')
+    parser.add_argument('--env_image_width', type=int, default=640)
+    parser.add_argument('--env_image_height', type=int, default=360)
+    parser.add_argument('--backbones', type=str, default='resnet18,resnet50')
+    parser.add_argument('--filter', type=str, default=None, help='only run kernels containing this string')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--baseline', type=str, default=None, help='baseline JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='relative slowdown of the median reported as a regression')
+    parser.add_argument('--save_baseline', type=str, default=None, help='write the results as a baseline')
+    args = parser.parse_args()
+
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+    torch.manual_seed(0)
+    np.random.seed(0)
+    device = torch.device(args.device)
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        mismatches = baseline_mismatches(baseline['meta'], args.device, torch.get_num_threads())
+        if mismatches:
+            sys.exit('{} was recorded under a different setup: {}. Record a baseline for this '
+                     'setup with --save_baseline.'.format(args.baseline, ', '.join(mismatches)))
+    config = get_config(args.agent_config_file, [
+        'RL.POLICY.OBS_TRANSFORMS.ENABLED_TRANSFORMS', ('ResizeShortestEdge', 'CenterCropper'),
+        'RL.POLICY.OBS_TRANSFORMS.RESIZE_SHORTEST_EDGE.SIZE', args.image_size,
+        'RL.POLICY.OBS_TRANSFORMS.CENTER_CROPPER.HEIGHT', args.image_size,
+        'RL.POLICY.OBS_TRANSFORMS.CENTER_CROPPER.WIDTH', args.image_size,
+    ])
+
+    results = OrderedDict()
+    for name, fn in kernels(args, config, device):
+        if args.filter is not None and args.filter not in name:
+            continue
+        median, best = time_kernel(fn, device, args.repeat)
+        results[name] = OrderedDict([('median_ms', median), ('min_ms', best)])
+        print('{:<32} {:10.3f} ms  (min {:.3f})'.format(name, median, best))
+
+    if args.save_baseline is not None:
+        report = OrderedDict([
+            ('meta', OrderedDict([
+                ('host', platform.node()),
+                ('processor', platform.processor()),
+                ('python', platform.python_version()),
+                ('torch', torch.__version__),
+                ('device', args.device),
+                ('num_threads', torch.get_num_threads()),
+                ('args', OrderedDict(
+                    (key, os.path.relpath(value, os.path.dirname(os.path.dirname(agent.__file__)))
+                     if key == 'agent_config_file' else value)
+                    for key, value in vars(args).items()
+                    if key not in ('filter', 'baseline', 'save_baseline'))),
+            ])),
+            ('kernels', results),
+        ])
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print('wrote {}'.format(args.save_baseline))
+
+    if args.baseline is not None:
+        print('\ncompared with {} (torch {}, {} threads)'.format(
+            args.baseline, baseline['meta']['torch'], baseline['meta']['num_threads']))
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            sys.exit('{} kernels regressed: {}'.format(len(regressions), ', '.join(regressions)))
+
+
+if __name__ == '__main__':
+    main()
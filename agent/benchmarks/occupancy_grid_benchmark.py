@@ -0,0 +1,112 @@
+"""Benchmark and reference check of the local occupancy grid rasterization.
+
+Compares the previous ScanSensor.get_local_occupancy_grid drawing (one cv2.circle per
+scan point, fresh float32 grid) with LocalOccupancyGrid (stencil scatter into a reused
+uint8 buffer). The new grid must be pixel-identical to the reference once both are
+expressed as OccupancyGridState * 2.
+
+  python -m agent.benchmarks.occupancy_grid_benchmark --trials 200
+"""
+import argparse
+import timeit
+
+import cv2
+import numpy as np
+
+from agent.gibson_extension.utils.occupancy_grid_utils import LocalOccupancyGrid, OBSTACLES, UNKNOWN, FREESPACE
+from agent.gibson_extension.utils.scan_utils import laser_unit_vectors, scan_to_base_points
+
+
+def legacy_local_occupancy_grid(scan_local, target_local, grid_resolution, occupancy_range,
+                                robot_footprint_radius_in_map, heading_end_point):
+    scan_local = np.concatenate([np.array([[0, 0]]), scan_local, np.array([[0, 0]])], axis=0)
+    scan_local[:, 1] *= -1
+
+    occupancy_grid = np.zeros((grid_resolution, grid_resolution)).astype(np.uint8)
+    occupancy_grid.fill(UNKNOWN)
+
+    scan_local_in_map = scan_local / occupancy_range * grid_resolution + (grid_resolution / 2)
+    scan_local_in_map = scan_local_in_map.reshape((1, -1, 1, 2)).astype(np.int32)
+    for i in range(scan_local_in_map.shape[1]):
+        cv2.circle(
+            img=occupancy_grid,
+            center=(scan_local_in_map[0, i, 0, 0], scan_local_in_map[0, i, 0, 1]),
+            radius=2,
+            color=OBSTACLES,
+            thickness=-1,
+        )
+    cv2.fillPoly(img=occupancy_grid, pts=scan_local_in_map, color=FREESPACE, lineType=1)
+    center = (grid_resolution // 2, grid_resolution // 2)
+    cv2.circle(
+        img=occupancy_grid,
+        center=center,
+        radius=int(robot_footprint_radius_in_map),
+        color=OBSTACLES,
+        thickness=-1,
+    )
+    cv2.arrowedLine(occupancy_grid, center, heading_end_point, color=UNKNOWN, thickness=2)
+
+    target_local = np.array(target_local[:2], dtype=np.float64)
+    target_local[1] *= -1
+    target_local = target_local / occupancy_range * grid_resolution + (grid_resolution / 2)
+    cv2.circle(
+        img=occupancy_grid,
+        center=(int(target_local[0]), int(target_local[1])),
+        radius=2,
+        color=OBSTACLES,
+        thickness=-1,
+    )
+    return occupancy_grid[:, :, None].astype(np.float32) / 2.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_horizontal_rays', type=int, default=228)
+    parser.add_argument('--laser_angular_range', type=float, default=240.0)
+    parser.add_argument('--min_laser_dist', type=float, default=0.05)
+    parser.add_argument('--laser_linear_range', type=float, default=5.6)
+    parser.add_argument('--grid_resolution', type=int, default=128)
+    parser.add_argument('--occupancy_range', type=float, default=5.0)
+    parser.add_argument('--robot_footprint_radius', type=float, default=0.32)
+    parser.add_argument('--trials', type=int, default=200, help='random scans checked for identity')
+    parser.add_argument('--number', type=int, default=500, help='calls per measurement')
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    footprint = int(args.robot_footprint_radius / args.occupancy_range * args.grid_resolution)
+    heading_end_point = (args.grid_resolution // 2 + args.grid_resolution // 15, args.grid_resolution // 2)
+    unit_vector_base = laser_unit_vectors(args.n_horizontal_rays, args.laser_angular_range)[:, :2]
+    translation_base = np.array([0.05, 0.0])
+    rasterizer = LocalOccupancyGrid(args.grid_resolution, args.occupancy_range, footprint, heading_end_point)
+
+    def sample():
+        scan = rng.uniform(size=(args.n_horizontal_rays, 1))
+        scan_local = scan_to_base_points(scan, unit_vector_base, translation_base,
+                                         args.min_laser_dist, args.laser_linear_range)
+        target_local = rng.uniform(-args.occupancy_range, args.occupancy_range, size=2)
+        return scan_local, target_local
+
+    mismatches = 0
+    for _ in range(args.trials):
+        scan_local, target_local = sample()
+        ref = legacy_local_occupancy_grid(scan_local.copy(), target_local, args.grid_resolution,
+                                          args.occupancy_range, footprint, heading_end_point)
+        new = rasterizer.rasterize(scan_local, target_local)
+        mismatches += int(np.count_nonzero(ref * 2.0 != new))
+    print('pixel mismatches over {} random scans: {}'.format(args.trials, mismatches))
+
+    scan_local, target_local = sample()
+    legacy_time = min(timeit.repeat(
+        lambda: legacy_local_occupancy_grid(scan_local.copy(), target_local, args.grid_resolution,
+                                            args.occupancy_range, footprint, heading_end_point),
+        number=args.number, repeat=5)) / args.number
+    new_time = min(timeit.repeat(
+        lambda: rasterizer.rasterize(scan_local, target_local),
+        number=args.number, repeat=5)) / args.number
+    print('legacy {:8.2f} us  stencil scatter {:8.2f} us  speedup {:5.1f}x  bytes/grid {} -> {}'.format(
+        legacy_time * 1e6, new_time * 1e6, legacy_time / new_time,
+        args.grid_resolution ** 2 * 4, args.grid_resolution ** 2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Reference check and benchmark of the learner-side occupancy grid rasterizer.
+
+Rasterizes random scans with the worker-side LocalOccupancyGrid (what
+ScanSensor.get_local_occupancy_grid returns) and with the batched
+OccupancyGridRasterizer observation transformer, reports the fraction of pixels
+that differ, and fails if it exceeds --tolerance. Also reports the time per batch
+and the bytes each worker sends per step in both modes. The same reference check
+runs as a unit test in agent/common/obs_transformers_test.py.
+
+  python -m agent.benchmarks.occupancy_grid_rasterizer_check --num_envs 16
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from agent.common.obs_transformers import OccupancyGridRasterizer
+from agent.gibson_extension.utils.occupancy_grid_utils import LocalOccupancyGrid
+from agent.gibson_extension.utils.scan_utils import laser_unit_vectors, scan_to_base_points
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_envs', type=int, default=16)
+    parser.add_argument('--batches', type=int, default=20)
+    parser.add_argument('--grid_resolution', type=int, default=128)
+    parser.add_argument('--tolerance', type=float, default=0.001,
+                        help='maximum fraction of differing pixels')
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    args = parser.parse_args()
+
+    n_horizontal_rays, laser_angular_range = 228, 240.0
+    min_laser_dist, laser_linear_range = 0.05, 5.6
+    occupancy_range, robot_footprint_radius = 5.0, 0.32
+    res = args.grid_resolution
+
+    rng = np.random.RandomState(0)
+    footprint = int(robot_footprint_radius / occupancy_range * res)
+    reference = LocalOccupancyGrid(res, occupancy_range, footprint, (res // 2 + res // 15, res // 2))
+    rasterizer = OccupancyGridRasterizer(
+        grid_resolution=res,
+        occupancy_range=occupancy_range,
+        robot_footprint_radius=robot_footprint_radius,
+        n_horizontal_rays=n_horizontal_rays,
+        laser_angular_range=laser_angular_range,
+        min_laser_dist=min_laser_dist,
+        laser_linear_range=laser_linear_range,
+    ).to(args.device)
+    unit_vector_laser = laser_unit_vectors(n_horizontal_rays, laser_angular_range)[:, :2]
+
+    mismatches, total, elapsed = 0, 0, 0.0
+    for _ in range(args.batches):
+        scans = rng.uniform(size=(args.num_envs, n_horizontal_rays, 1)).astype(np.float32)
+        targets = rng.uniform(-occupancy_range, occupancy_range, size=(args.num_envs, 2)).astype(np.float32)
+        yaw = rng.uniform(-0.05, 0.05, size=args.num_envs)
+        extrinsics = np.zeros((args.num_envs, 2, 3), dtype=np.float32)
+        extrinsics[:, 0, 0], extrinsics[:, 0, 1] = np.cos(yaw), -np.sin(yaw)
+        extrinsics[:, 1, 0], extrinsics[:, 1, 1] = np.sin(yaw), np.cos(yaw)
+        extrinsics[:, :, 2] = rng.uniform(-0.1, 0.1, size=(args.num_envs, 2))
+
+        ref = []
+        for scan, target, extrinsic in zip(scans, targets, extrinsics):
+            unit_vector_base = unit_vector_laser.dot(extrinsic[:, :2].astype(np.float64).T)
+            scan_local = scan_to_base_points(scan.astype(np.float64), unit_vector_base,
+                                             extrinsic[:, 2].astype(np.float64),
+                                             min_laser_dist, laser_linear_range)
+            ref.append(reference.rasterize(scan_local, target.astype(np.float64)))
+        ref = np.stack(ref, axis=0)
+
+        inputs = [torch.from_numpy(x).to(args.device) for x in (scans, targets, extrinsics)]
+        if args.device.startswith('cuda'):
+            torch.cuda.synchronize()
+        start = time.time()
+        new = rasterizer.rasterize(*inputs)
+        if args.device.startswith('cuda'):
+            torch.cuda.synchronize()
+        elapsed += time.time() - start
+
+        mismatches += int(np.count_nonzero(new.cpu().numpy() != ref))
+        total += ref.size
+
+    fraction = mismatches / float(total)
+    print('pixels differing from get_local_occupancy_grid: {:.4%} ({} of {})'.format(fraction, mismatches, total))
+    print('batched rasterization on {}: {:.2f} ms per batch of {} envs'.format(
+        args.device, elapsed / args.batches * 1e3, args.num_envs))
+    raw_bytes = n_horizontal_rays * 4 + 2 * 4 + 6 * 4
+    print('bytes sent per env and step: grid {} -> raw scan {}'.format(res * res, raw_bytes))
+    if fraction > args.tolerance:
+        raise SystemExit('mismatch {:.4%} exceeds tolerance {:.4%}'.format(fraction, args.tolerance))
+
+
+if __name__ == '__main__':
+    main()
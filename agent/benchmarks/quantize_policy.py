@@ -0,0 +1,256 @@
+"""Int8 quantization of a trained policy for CPU evaluation and challenge submission.
+
+Loads a checkpoint, quantizes the policy (agent.policy.quantization: static
+post-training quantization of the conv backbone calibrated on recorded depth
+frames, dynamic quantization of the LSTM/GRU and Linear heads) and exports it as a
+CPU-deployable TorchScript module, loaded with
+agent.policy.inference.load_exported. Reports, for the float policy and the
+exported int8 one:
+
+  - agreement of the action means and values on the calibration frames
+  - latency of one act call of a single environment (the challenge setting)
+  - size of the weights
+  - success / SPL on a fixed episode set and their int8 - float delta: both
+    policies run Challenge.submit on the same episodes, and the float run
+    records the depth frames used for calibration
+
+  python -m agent.benchmarks.quantize_policy --checkpoint ckpt.10.pth \
+    --config_file gibson_extension/examples/configs/turtlebot_nav_eval.yaml \
+    --episode_dir episodes --split minival --output policy_int8.pt
+
+--checkpoint, --config_file and --episode_dir are required: the accuracy cost
+of the quantization is only meaningful for trained weights. --latency_only
+drops them, to time and size the int8 kernels without iGibson, and reports no
+accuracy. Latency depends on the torch version, and the report records it
+next to the version pinned in requirements.txt.
+"""
+import argparse
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+
+import numpy as np
+import torch
+from absl import logging
+from gym import spaces
+
+import agent
+from agent.common.obs_transformers import get_active_obs_transforms
+from agent.gibson_extension.challenge.policy_agent import PolicyAgent
+from agent.policy.PointNavPolicy import PointNavResNetPolicy
+from agent.policy.inference import ActNet, PolicyInference, load_exported
+from agent.policy.quantization import model_size, quantize_policy
+from agent.ppo.config.default import get_config
+
+REQUIREMENTS = os.path.join(os.path.dirname(os.path.dirname(agent.__file__)), 'requirements.txt')
+
+
+def pinned_torch_version():
+    """
+    :return: torch version pinned in requirements.txt, None without a pin
+    """
+    if not os.path.isfile(REQUIREMENTS):
+        return None
+    with open(REQUIREMENTS, 'r') as f:
+        for line in f:
+            match = re.match(r'torch==(\S+)', line.strip())
+            if match is not None:
+                return match.group(1)
+    return None
+
+
+def load_policy(args, config):
+    obs_space = spaces.Dict(OrderedDict([
+        ('task_obs', spaces.Box(low=-np.inf, high=np.inf, shape=(4,), dtype=np.float32)),
+        ('depth', spaces.Box(low=0.0, high=1.0, shape=(args.image_size, args.image_size, 1), dtype=np.float32)),
+    ]))
+    action_space = spaces.Box(low=-1.0, high=1.0, shape=(2,), dtype=np.float32)
+    policy = PointNavResNetPolicy.from_config(config, obs_space, action_space)
+    if args.checkpoint is not None:
+        ckpt_dict = torch.load(args.checkpoint, map_location='cpu')
+        policy.load_state_dict({
+            k[len('actor_critic.'):]: v for k, v in ckpt_dict['state_dict'].items()
+            if k.startswith('actor_critic.')
+        })
+    else:
+        logging.warning('No checkpoint, quantizing a randomly initialized policy: latency and size only')
+    policy.to('cpu').eval()
+    policy.device = torch.device('cpu')
+    return policy
+
+
+def run_challenge(args, policy, obs_transforms, record_observations=False):
+    # imports iGibson
+    from agent.gibson_extension.challenge.challenge import Challenge
+
+    os.environ['CONFIG_FILE'] = args.config_file
+    os.environ['SPLIT'] = args.split
+    os.environ['EPISODE_DIR'] = args.episode_dir
+    os.environ['EVAL_EPISODES_PER_SCENE'] = str(args.episodes_per_scene)
+    # same action noise for both policies
+    torch.manual_seed(args.seed)
+    policy_agent = PolicyAgent(policy, obs_transforms, record_observations=record_observations)
+    metrics = Challenge().submit(policy_agent)
+    metrics['act_ms_median'] = float(np.median(policy_agent.act_times) * 1e3)
+    return metrics, policy_agent.observations
+
+
+def calibration_frames(args, recorded_observations):
+    """
+    :return: transformed depth frames, N x H x W x 1
+    """
+    if args.calibration_frames is not None:
+        return torch.from_numpy(np.load(args.calibration_frames)['depth'])
+    if recorded_observations:
+        frames = torch.cat([observations['depth'] for observations in recorded_observations])
+        index = np.linspace(0, len(frames) - 1, min(args.calibration_size, len(frames))).astype(np.int64)
+        return frames[torch.from_numpy(index)]
+    logging.warning('No recorded depth frames, calibrating on random frames: pass --episode_dir or '
+                    '--calibration_frames for a representative calibration')
+    return torch.rand(args.calibration_size, args.image_size, args.image_size, 1)
+
+
+def act_inputs(hidden_shape, frames):
+    num_frames = len(frames)
+    generator = torch.Generator().manual_seed(0)
+    observations = {
+        'depth': frames,
+        'task_obs': torch.randn(num_frames, 4, generator=generator),
+    }
+    rnn_hidden_states = torch.zeros(num_frames, *hidden_shape)
+    prev_actions = torch.rand(num_frames, 2, generator=generator) * 2 - 1
+    masks = torch.ones(num_frames, 1, dtype=torch.bool)
+    return observations, rnn_hidden_states, prev_actions, masks
+
+
+@torch.no_grad()
+def output_difference(policy, exported, hidden_shape, frames):
+    """
+    :return: max abs difference of the values and of the action means
+    """
+    inputs = act_inputs(hidden_shape, frames)
+    value, mean, _ = ActNet(policy)(*inputs)
+    quantized_value, quantized_mean, _ = exported.module(*inputs)
+    return (value - quantized_value).abs().max().item(), (mean - quantized_mean).abs().max().item()
+
+
+@torch.no_grad()
+def act_latency(policy, hidden_shape, frames, repeat):
+    """
+    :return: median milliseconds of one act call of a single environment
+    """
+    observations, rnn_hidden_states, prev_actions, masks = act_inputs(hidden_shape, frames[:1])
+    times = []
+    for i in range(repeat + 3):
+        observations['depth'] = frames[i % len(frames)].unsqueeze(0)
+        start = time.perf_counter()
+        _, prev_actions, _, rnn_hidden_states = policy.act(observations, rnn_hidden_states, prev_actions, masks)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times[3:]) * 1e3)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--checkpoint', type=str, default=None, help='checkpoint saved by PPOTrainer')
+    parser.add_argument('--agent_config_file', type=str,
+                        default=os.path.join(os.path.dirname(agent.__file__), 'configs', 'agent.yaml'))
+    parser.add_argument('--backbone', type=str, default=None, help='overrides RL.DDPPO.backbone')
+    parser.add_argument('--image_size', type=int, default=256, help='depth size seen by the policy')
+    parser.add_argument('--backend', type=str, default='fbgemm', choices=('fbgemm', 'qnnpack'))
+    parser.add_argument('--no_static', action='store_true', help='keep the conv backbone in float')
+    parser.add_argument('--no_dynamic', action='store_true', help='keep the LSTM and Linear layers in float')
+    parser.add_argument('--calibration_frames', type=str, default=None,
+                        help='.npz with transformed depth frames, as written by --save_calibration_frames')
+    parser.add_argument('--save_calibration_frames', type=str, default=None)
+    parser.add_argument('--calibration_size', type=int, default=256, help='frames used for calibration')
+    parser.add_argument('--calibration_batch', type=int, default=16)
+    parser.add_argument('--config_file', type=str, default=None, help='iGibson config of Challenge.submit')
+    parser.add_argument('--episode_dir', type=str, default=None, help='fixed episode set of Challenge.submit')
+    parser.add_argument('--split', type=str, default='minival')
+    parser.add_argument('--episodes_per_scene', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--num_threads', type=int, default=1, help='CPU threads, as in a challenge container')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--output', type=str, default='policy_int8.pt', help='exported int8 policy')
+    parser.add_argument('--report', type=str, default=None, help='write the report as JSON')
+    parser.add_argument('--latency_only', action='store_true',
+                        help='allow running without checkpoint and episode set, reporting no accuracy')
+    args = parser.parse_args()
+    if not args.latency_only:
+        missing = [name for name in ('checkpoint', 'config_file', 'episode_dir') if getattr(args, name) is None]
+        if missing:
+            parser.error('the accuracy delta needs {}, or pass --latency_only'.format(
+                ', '.join('--' + name for name in missing)))
+
+    pinned_torch = pinned_torch_version()
+    if pinned_torch is not None and torch.__version__.split('+')[0] != pinned_torch:
+        logging.warning('torch %s is not the pinned torch==%s: latencies are not those of the pinned build',
+                        torch.__version__, pinned_torch)
+
+    torch.set_num_threads(args.num_threads)
+    torch.manual_seed(args.seed)
+    opts = [] if args.backbone is None else ['RL.DDPPO.backbone', args.backbone]
+    config = get_config(args.agent_config_file, opts)
+    obs_transforms = get_active_obs_transforms(config)
+    policy = load_policy(args, config)
+    hidden_shape = (policy.net.num_recurrent_layers, policy.net._hidden_size)
+
+    metrics, recorded_observations = None, []
+    if not args.latency_only:
+        metrics, recorded_observations = run_challenge(args, policy, obs_transforms, record_observations=True)
+    frames = calibration_frames(args, recorded_observations)
+    if args.save_calibration_frames is not None:
+        np.savez_compressed(args.save_calibration_frames, depth=frames.numpy())
+
+    calibration = None
+    if not args.no_static:
+        calibration = [{'depth': batch} for batch in frames.split(args.calibration_batch)]
+    quantized = quantize_policy(policy, calibration, backend=args.backend, dynamic=not args.no_dynamic)
+    # the FX graph of the quantized backbone does not pickle, the policy is deployed as TorchScript
+    PolicyInference(quantized).export(args.output, *act_inputs(hidden_shape, frames[:1]))
+    exported = load_exported(args.output)
+
+    value_error, action_error = output_difference(policy, exported, hidden_shape, frames)
+    report = OrderedDict([
+        ('torch', torch.__version__),
+        ('pinned_torch', pinned_torch),
+        ('checkpoint', args.checkpoint),
+        ('backend', args.backend),
+        ('num_threads', torch.get_num_threads()),
+        ('static', not args.no_static),
+        ('dynamic', not args.no_dynamic),
+        ('calibration_frames', len(frames)),
+        ('max_abs_value_difference', value_error),
+        ('max_abs_action_mean_difference', action_error),
+        ('act_ms', OrderedDict([('float', act_latency(policy, hidden_shape, frames, args.repeat)),
+                                ('int8', act_latency(exported, hidden_shape, frames, args.repeat))])),
+        ('size_mb', OrderedDict([('float', model_size(policy) / 1e6),
+                                 ('int8', os.path.getsize(args.output) / 1e6)])),
+    ])
+    if metrics is not None:
+        quantized_metrics, _ = run_challenge(args, exported, obs_transforms)
+        report['challenge'] = OrderedDict([
+            ('float', metrics),
+            ('int8', quantized_metrics),
+            ('delta', OrderedDict((key, quantized_metrics[key] - metrics[key]) for key in metrics)),
+        ])
+
+    print('calibration frames {}, max abs difference value {:.4f}, action mean {:.4f}'.format(
+        len(frames), value_error, action_error))
+    for name in ('act_ms', 'size_mb'):
+        print('{:<8} float {:9.3f}  int8 {:9.3f}  x{:.2f}'.format(
+            name, report[name]['float'], report[name]['int8'], report[name]['float'] / report[name]['int8']))
+    if metrics is not None:
+        for key in metrics:
+            print('{:<16} float {:8.4f}  int8 {:8.4f}  delta {:+.4f}'.format(
+                key, metrics[key], quantized_metrics[key], report['challenge']['delta'][key]))
+    print('wrote {}'.format(args.output))
+    if args.report is not None:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
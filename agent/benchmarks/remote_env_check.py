@@ -0,0 +1,102 @@
+"""Localhost check and benchmark of remote env workers.
+
+Starts a RemoteEnvServer hosting stand-in environments (suite_fake) on a Unix
+socket or a localhost TCP port, steps a ParallelPyEnvironment of remote
+endpoints and one of local processes with the same seeds and actions, fails if
+any observation, reward or info differs, and reports the time per batched step
+of both.
+
+  python -m agent.benchmarks.remote_env_check --num_envs 4 --steps 200
+"""
+import argparse
+import functools
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from agent.environments import suite_fake
+from agent.environments.parallel_py_environment import ParallelPyEnvironment
+from agent.environments.remote_py_environment import RemoteEnvServer, parse_endpoint
+
+
+def serve(address, num_envs, image_width, image_height):
+    env_constructors = [functools.partial(suite_fake.load, seed=i, image_width=image_width,
+                                          image_height=image_height)
+                        for i in range(num_envs)]
+    RemoteEnvServer(address, env_constructors, authkey=b'check').serve_forever()
+
+
+def flatten(time_steps):
+    values = []
+    for time_step in time_steps:
+        for value in time_step:
+            if isinstance(value, dict):
+                values.extend(np.asarray(value[key]) for key in sorted(value))
+            elif value is not None:
+                values.append(np.asarray(value))
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_envs', type=int, default=4)
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument('--image_width', type=int, default=160)
+    parser.add_argument('--image_height', type=int, default=90)
+    parser.add_argument('--tcp_port', type=int, default=None,
+                        help='serve on localhost:port instead of a Unix socket')
+    args = parser.parse_args()
+
+    if args.tcp_port is None:
+        socket_dir = tempfile.mkdtemp()
+        endpoint = os.path.join(socket_dir, 'envs.sock')
+    else:
+        endpoint = 'localhost:{}'.format(args.tcp_port)
+    address, _ = parse_endpoint(endpoint)
+    server = multiprocessing.Process(
+        target=serve, args=(address, args.num_envs, args.image_width, args.image_height))
+    server.start()
+    # wait for the listener
+    for _ in range(100):
+        if args.tcp_port is not None or os.path.exists(address):
+            break
+        time.sleep(0.05)
+    time.sleep(0.2)
+
+    remote = ParallelPyEnvironment(
+        [], remote_endpoints=['{}#{}'.format(endpoint, i) for i in range(args.num_envs)],
+        remote_authkey=b'check')
+    local = ParallelPyEnvironment(
+        [functools.partial(suite_fake.load, seed=i, image_width=args.image_width,
+                           image_height=args.image_height)
+         for i in range(args.num_envs)])
+
+    rng = np.random.RandomState(0)
+    mismatches = 0
+    elapsed = {'remote': 0.0, 'local': 0.0}
+    for step in range(args.steps + 1):
+        actions = rng.uniform(-1.0, 1.0, size=(args.num_envs, 2)).astype(np.float32)
+        results = {}
+        for name, env in (('remote', remote), ('local', local)):
+            start = time.time()
+            results[name] = env.reset() if step == 0 else env.step(actions)
+            if step > 0:
+                elapsed[name] += time.time() - start
+        for a, b in zip(flatten(results['remote']), flatten(results['local'])):
+            mismatches += int(not np.array_equal(a, b))
+
+    remote.close()
+    local.close()
+    server.terminate()
+    print('values differing between remote and local envs: {}'.format(mismatches))
+    print('ms per batched step of {} envs: remote {:.3f}  local {:.3f}'.format(
+        args.num_envs, elapsed['remote'] / args.steps * 1e3, elapsed['local'] / args.steps * 1e3))
+    if mismatches > 0:
+        raise SystemExit('remote envs differ from local envs')
+
+
+if __name__ == '__main__':
+    main()
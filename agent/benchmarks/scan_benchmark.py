@@ -0,0 +1,117 @@
+"""Micro-benchmark of the LiDAR ray setup done by ScanSensor every step.
+
+Compares the per-call angle table / list comprehension used previously with the
+precomputed tables of agent.gibson_extension.utils.scan_utils, and checks that both
+produce the same rays. Does not need pybullet or a running simulator.
+
+  python -m agent.benchmarks.scan_benchmark --n_horizontal_rays 228
+"""
+import argparse
+import timeit
+
+import numpy as np
+from transforms3d.quaternions import quat2mat
+
+from agent.gibson_extension.utils.scan_utils import laser_unit_vectors, ray_start_end, \
+    laser_to_base_transform, scan_to_base_points
+
+
+def legacy_ray_start_end(laser_position, laser_orientation, n_horizontal_rays, laser_angular_range,
+                         min_laser_dist, laser_linear_range):
+    laser_angular_half_range = laser_angular_range / 2.0
+    angle = np.arange(
+        -laser_angular_half_range / 180 * np.pi,
+        laser_angular_half_range / 180 * np.pi,
+        laser_angular_range / 180.0 * np.pi / n_horizontal_rays,
+    )
+    unit_vector_local = np.array([[np.cos(ang), np.sin(ang), 0.0] for ang in angle])
+    transform_matrix = quat2mat(
+        [laser_orientation[3], laser_orientation[0], laser_orientation[1], laser_orientation[2]]
+    )
+    unit_vector_world = transform_matrix.dot(unit_vector_local.T).T
+
+    start_pose = np.tile(laser_position, (n_horizontal_rays, 1))
+    start_pose += unit_vector_world * min_laser_dist
+    end_pose = laser_position + unit_vector_world * laser_linear_range
+    return start_pose, end_pose
+
+
+def legacy_scan_local(scan, laser_position, laser_orientation, base_position, base_orientation,
+                      n_horizontal_rays, laser_angular_range, min_laser_dist, laser_linear_range):
+    laser_angular_half_range = laser_angular_range / 2.0
+    angle = np.arange(
+        -np.radians(laser_angular_half_range),
+        np.radians(laser_angular_half_range),
+        np.radians(laser_angular_range) / n_horizontal_rays,
+    )
+    unit_vector_laser = np.array([[np.cos(ang), np.sin(ang), 0.0] for ang in angle])
+    scan_laser = unit_vector_laser * (scan * (laser_linear_range - min_laser_dist) + min_laser_dist)
+    laser_rotation = quat2mat(
+        [laser_orientation[3], laser_orientation[0], laser_orientation[1], laser_orientation[2]])
+    scan_world = laser_rotation.dot(scan_laser.T).T + laser_position
+    base_rotation = quat2mat(
+        [base_orientation[3], base_orientation[0], base_orientation[1], base_orientation[2]])
+    scan_local = base_rotation.T.dot((scan_world - base_position).T).T
+    return scan_local[:, :2]
+
+
+def flatten(result):
+    if isinstance(result, tuple):
+        return np.concatenate([np.ravel(x) for x in result])
+    return np.ravel(result)
+
+
+def random_pose(rng):
+    position = rng.uniform(-5.0, 5.0, size=3)
+    orientation = rng.normal(size=4)
+    return position, orientation / np.linalg.norm(orientation)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_horizontal_rays', type=int, default=228)
+    parser.add_argument('--laser_angular_range', type=float, default=240.0)
+    parser.add_argument('--min_laser_dist', type=float, default=0.05)
+    parser.add_argument('--laser_linear_range', type=float, default=5.6)
+    parser.add_argument('--number', type=int, default=2000, help='calls per measurement')
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    laser_position, laser_orientation = random_pose(rng)
+    base_position, base_orientation = random_pose(rng)
+    scan = rng.uniform(size=(args.n_horizontal_rays, 1))
+
+    unit_vector_laser = laser_unit_vectors(args.n_horizontal_rays, args.laser_angular_range)
+    rotation_base, translation_base = laser_to_base_transform(
+        laser_position, laser_orientation, base_position, base_orientation)
+    unit_vector_base = unit_vector_laser.dot(rotation_base.T)
+
+    def legacy_rays():
+        return legacy_ray_start_end(laser_position, laser_orientation, args.n_horizontal_rays,
+                                    args.laser_angular_range, args.min_laser_dist, args.laser_linear_range)
+
+    def rays():
+        return ray_start_end(laser_position, laser_orientation, unit_vector_laser,
+                             args.min_laser_dist, args.laser_linear_range)
+
+    def legacy_points():
+        return legacy_scan_local(scan, laser_position, laser_orientation, base_position, base_orientation,
+                                 args.n_horizontal_rays, args.laser_angular_range,
+                                 args.min_laser_dist, args.laser_linear_range)
+
+    def points():
+        return scan_to_base_points(scan, unit_vector_base, translation_base,
+                                   args.min_laser_dist, args.laser_linear_range)
+
+    for (ref_fn, new_fn, name) in [(legacy_rays, rays, 'ray start/end'),
+                                   (legacy_points, points, 'scan points in base frame')]:
+        ref, new = ref_fn(), new_fn()
+        max_err = np.abs(flatten(ref) - flatten(new)).max()
+        legacy_time = min(timeit.repeat(ref_fn, number=args.number, repeat=5)) / args.number
+        new_time = min(timeit.repeat(new_fn, number=args.number, repeat=5)) / args.number
+        print('{:<28s} legacy {:8.2f} us  vectorized {:8.2f} us  speedup {:5.1f}x  max abs diff {:.2e}'.format(
+            name, legacy_time * 1e6, new_time * 1e6, legacy_time / new_time, max_err))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""End-to-end throughput of PPOTrainer with stand-in environments.
+
+Drives the trainer's rollout collection and PPO update loop with suite_fake
+environments, which match the observation spec and info keys of iGibsonEnv and
+sleep for a configurable time per step, over a sweep of
+num_parallel_environments, num_steps and num_mini_batch. Reports env steps per
+second and the time spent per phase: policy inference (act), environment steps
+(env), observation batching and rollout insertion (batch, which includes the
+visual encoder with --freeze_encoder) and the PPO update (update). Runs on CPU
+when CUDA is not available. With --freeze_encoder, the frozen encoder is
+initialized from a checkpoint of a randomly initialized policy.
+
+  python -m agent.benchmarks.trainer_throughput --num_envs 1,2,4 --num_steps 32,64 \
+    --num_mini_batch 1,2 --step_time 0.02
+"""
+import argparse
+import functools
+import itertools
+import os
+import tempfile
+import time
+
+import torch
+from absl import flags
+from absl import logging
+
+import agent
+from agent.environments import suite_fake
+from agent.policy.PointNavPolicy import PointNavResNetPolicy
+from agent.trainer.ppo_trainer import PPOTrainer
+
+PHASES = ('act', 'env', 'batch', 'update')
+
+# flags read by PPOTrainer, normally defined by the training script
+flags.DEFINE_string('root_dir', None, 'Root directory for writing logs/summaries/checkpoints.')
+flags.DEFINE_multi_string('gin_file', None, 'Path to the gin config files.')
+flags.DEFINE_multi_string('gin_param', None, 'Gin binding to pass through.')
+flags.DEFINE_integer('num_parallel_environments', 1, 'Number of environments to run in parallel')
+flags.DEFINE_integer('gpu_c', 0, 'GPU id for compute.')
+flags.DEFINE_string('config_file', None, 'Config file for the experiment.')
+flags.DEFINE_string('agent_config_file', None, 'Config file for the agent.')
+
+
+def int_list(value):
+    return [int(v) for v in value.split(',')]
+
+
+def save_random_weights(trainer, path):
+    # throughput does not depend on the weights the encoder is frozen with
+    policy = PointNavResNetPolicy.from_config(trainer.agent_config, trainer.observation_spec, trainer.action_spec)
+    torch.save({'state_dict': {'actor_critic.' + k: v for k, v in policy.state_dict().items()}}, path)
+
+
+def run(trainer, args, num_envs, num_steps, num_mini_batch):
+    flags.FLAGS.num_parallel_environments = num_envs
+    pretrained_weights = os.path.join(flags.FLAGS.root_dir, 'random_weights.pth')
+    trainer.agent_config.defrost()
+    trainer.agent_config.merge_from_list([
+        'RL.PPO.num_steps', num_steps,
+        'RL.PPO.num_mini_batch', num_mini_batch,
+        'RL.PPO.ppo_epoch', args.ppo_epoch,
+        'RL.DDPPO.backbone', args.backbone,
+        'RL.DDPPO.train_encoder', not args.freeze_encoder,
+        'RL.DDPPO.pretrained_encoder', args.freeze_encoder,
+        'RL.DDPPO.pretrained_weights', pretrained_weights,
+    ])
+    trainer.agent_config.freeze()
+    trainer.root_dir = flags.FLAGS.root_dir
+    trainer.gpu = flags.FLAGS.gpu_c
+    trainer.model_ids = None
+
+    env_load_fn = functools.partial(suite_fake.load,
+                                    output=args.output.split(','),
+                                    image_width=args.image_width,
+                                    image_height=args.image_height,
+                                    step_time=args.step_time,
+                                    reset_time=args.reset_time,
+                                    episode_length=args.episode_length)
+    trainer.init_envs(env_load_fn)
+    if args.freeze_encoder:
+        save_random_weights(trainer, pretrained_weights)
+    trainer.init_ppo_training()
+    try:
+        # the first update pays for allocations and cuDNN autotuning
+        trainer._collect_rollout()
+        trainer._update_agent()
+        trainer.phase_time.clear()
+
+        num_env_steps = 0
+        start = time.time()
+        for _ in range(args.updates):
+            num_env_steps += trainer._collect_rollout()
+            trainer._update_agent()
+        elapsed = time.time() - start
+    finally:
+        trainer.tf_env.close()
+    return num_env_steps / elapsed, {phase: trainer.phase_time[phase] / args.updates for phase in PHASES}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_envs', type=int_list, default=[1, 2, 4],
+                        help='comma-separated num_parallel_environments to sweep')
+    parser.add_argument('--num_steps', type=int_list, default=[32],
+                        help='comma-separated rollout lengths to sweep')
+    parser.add_argument('--num_mini_batch', type=int_list, default=[1, 2],
+                        help='comma-separated numbers of mini batches to sweep')
+    parser.add_argument('--updates', type=int, default=3, help='timed updates per configuration')
+    parser.add_argument('--ppo_epoch', type=int, default=2)
+    parser.add_argument('--backbone', type=str, default='resnet18')
+    parser.add_argument('--freeze_encoder', action='store_true',
+                        help='RL.DDPPO.train_encoder False: the rollouts store visual features')
+    parser.add_argument('--agent_config_file', type=str,
+                        default=os.path.join(os.path.dirname(agent.__file__), 'configs', 'agent.yaml'))
+    parser.add_argument('--output', type=str, default='task_obs,rgb,depth,occupancy_grid',
+                        help='comma-separated env outputs')
+    parser.add_argument('--image_width', type=int, default=640)
+    parser.add_argument('--image_height', type=int, default=360)
+    parser.add_argument('--step_time', type=float, default=0.0,
+                        help='seconds each env step sleeps to stand in for simulation and rendering')
+    parser.add_argument('--reset_time', type=float, default=0.0,
+                        help='seconds each env reset sleeps')
+    parser.add_argument('--episode_length', type=int, default=100)
+    parser.add_argument('--gpu', type=int, default=0)
+    args = parser.parse_args()
+
+    root_dir = tempfile.mkdtemp()
+    flags.FLAGS(['trainer_throughput',
+                 '--root_dir={}'.format(root_dir),
+                 '--config_file=suite_fake',
+                 '--agent_config_file={}'.format(args.agent_config_file),
+                 '--gpu_c={}'.format(args.gpu)])
+    # the trainer parses the gin config, which can only be done once per process
+    trainer = PPOTrainer(flags.FLAGS)
+    logging.set_verbosity(logging.WARNING)
+
+    rows = []
+    for num_envs, num_steps, num_mini_batch in itertools.product(
+            args.num_envs, args.num_steps, args.num_mini_batch):
+        if num_mini_batch > num_envs:
+            continue
+        steps_per_second, phase_time = run(trainer, args, num_envs, num_steps, num_mini_batch)
+        rows.append((num_envs, num_steps, num_mini_batch, steps_per_second, phase_time))
+
+    print('{:>5} {:>6} {:>6} {:>10}  {}'.format(
+        'envs', 'steps', 'mini', 'steps/s', '  '.join('{:>9}'.format(phase + ' s') for phase in PHASES)))
+    for num_envs, num_steps, num_mini_batch, steps_per_second, phase_time in rows:
+        print('{:>5} {:>6} {:>6} {:>10.1f}  {}'.format(
+            num_envs, num_steps, num_mini_batch, steps_per_second,
+            '  '.join('{:>9.3f}'.format(phase_time[phase]) for phase in PHASES)))
+    print('phase times are seconds per update (num_steps steps of every env, then the PPO update)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Benchmark of the optimized execution of the visual encoder (RL.POLICY.OPTIMIZED_VISUAL_ENCODER).
+
+Times ResNetEncoder on CPU in its default execution (NCHW, average pool then
+the first conv) and optimized one (channels last, average pool folded into the
+first conv when the input normalization is not being updated), with the same
+weights, at act batch sizes (one step of every env in eval mode, no grad) and
+update batch sizes (a PPO mini batch in train mode, forward and backward).
+With --compile, also times the optimized act path under torch.compile (the
+"compile" inference backend), where Inductor fuses the GroupNorm, ReLU and
+residual adds around the convs. Fails if the act outputs of the modes differ
+by more than --atol.
+
+  python -m agent.benchmarks.visual_encoder_benchmark --backbones resnet18,resnet50 \
+    --act_batch 1,4,8 --update_batch 64,256
+"""
+import argparse
+from collections import OrderedDict
+
+import numpy as np
+import torch
+from gym import spaces
+
+from agent.benchmarks.learner_kernels import time_kernel
+from agent.policy import resnet
+from agent.policy.PointNavPolicy import ResNetEncoder
+
+
+def int_list(value):
+    return [int(v) for v in value.split(',')]
+
+
+def build_encoders(backbone, image_size, baseplanes, normalize_visual_inputs, with_compile):
+    obs_space = spaces.Dict(OrderedDict([
+        ('depth', spaces.Box(low=0.0, high=1.0, shape=(image_size, image_size, 1), dtype=np.float32)),
+    ]))
+    encoders = OrderedDict()
+    for mode, optimized in (('default', False), ('optimized', True)):
+        torch.manual_seed(0)
+        encoders[mode] = ResNetEncoder(obs_space, baseplanes=baseplanes, ngroups=baseplanes // 2,
+                                       make_backbone=getattr(resnet, backbone),
+                                       normalize_visual_inputs=normalize_visual_inputs, optimized=optimized)
+    encoders['optimized'].load_state_dict(encoders['default'].state_dict())
+    if with_compile:
+        encoders['optimized+compile'] = torch.compile(encoders['optimized'], dynamic=False)
+    return encoders
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backbones', type=str, default='resnet18,resnet50')
+    parser.add_argument('--baseplanes', type=int, default=32)
+    parser.add_argument('--image_size', type=int, default=256)
+    parser.add_argument('--normalize_visual_inputs', type=int, default=1,
+                        help='RunningMeanAndVar on the inputs, as in agent.yaml')
+    parser.add_argument('--act_batch', type=int_list, default=[1, 4, 8],
+                        help='comma-separated act batch sizes (num envs)')
+    parser.add_argument('--update_batch', type=int_list, default=[64, 256],
+                        help='comma-separated update batch sizes (num_steps * num_envs / num_mini_batch)')
+    parser.add_argument('--compile', action='store_true', help='also time the optimized encoder under torch.compile')
+    parser.add_argument('--num_threads', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--atol', type=float, default=1e-3)
+    args = parser.parse_args()
+
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+    device = torch.device('cpu')
+    with_compile = args.compile and hasattr(torch, 'compile')
+    print('torch {}, {} threads'.format(torch.__version__, torch.get_num_threads()))
+    print('{:<10} {:<7} {:>6}  {:<18} {:>10} {:>8}'.format('backbone', 'phase', 'batch', 'mode', 'ms', 'speedup'))
+
+    max_error = 0.0
+    for backbone in args.backbones.split(','):
+        encoders = build_encoders(backbone, args.image_size, args.baseplanes, bool(args.normalize_visual_inputs),
+                                  with_compile)
+        for phase, batch_sizes in (('act', args.act_batch), ('update', args.update_batch)):
+            for batch_size in batch_sizes:
+                observations = {'depth': torch.rand(batch_size, args.image_size, args.image_size, 1)}
+                for mode, encoder in encoders.items():
+                    if phase == 'update' and mode.endswith('+compile'):
+                        continue
+                    encoder.train(phase == 'update')
+
+                    if phase == 'act':
+                        with torch.no_grad():
+                            output = encoder(observations)
+                        if mode == 'default':
+                            expected = output
+                        max_error = max(max_error, (output - expected).abs().max().item())
+
+                        def fn(encoder=encoder):
+                            with torch.no_grad():
+                                encoder(observations)
+                    else:
+                        def fn(encoder=encoder):
+                            encoder(observations).sum().backward()
+                    median, _ = time_kernel(fn, device, args.repeat)
+                    if mode == 'default':
+                        default_ms = median
+                    print('{:<10} {:<7} {:>6}  {:<18} {:>10.3f} {:>7.2f}x'.format(
+                        backbone, phase, batch_size, mode, median, default_ms / median))
+                for encoder in encoders.values():
+                    encoder.zero_grad(set_to_none=True)
+
+    if max_error > args.atol:
+        raise SystemExit('optimized encoder differs from the default one by {:.3g}'.format(max_error))
+    print('outputs of the modes match (max abs difference {:.3g})'.format(max_error))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,7 @@
 from agent.gibson_extension.examples.configs.default import Config
 from gym import spaces
 import abc
-from typing import Tuple,Union,Iterable,List,Dict
+from typing import Any,Tuple,Union,Iterable,List,Dict
 import torch
 import torch.nn as nn
 from agent.gibson_extension.utils.common import (
@@ -11,8 +11,18 @@ from agent.gibson_extension.utils.common import (
     image_resize_shortest_edge,
     overwrite_gym_box_shape,
 )
+from agent.gibson_extension.utils.occupancy_grid_utils import (
+    OBSTACLES,
+    UNKNOWN,
+    FREESPACE,
+    RAW_SCAN_KEYS,
+    disk_stencil,
+    static_overlay,
+)
+from agent.gibson_extension.utils.scan_utils import laser_unit_vectors
 import copy
 import numbers
+import numpy as np
 from absl import logging
 
 
@@ -190,6 +200,306 @@ class CenterCropper(ObservationTransformer):
         )
 
 
+class OccupancyGridRasterizer(ObservationTransformer):
+    r"""Rasterizes the local occupancy grid of all envs at once from the raw scans.
+
+    Workers configured with ``occupancy_grid_mode: learner`` send the scan, the
+    target in the robot base frame and the laser extrinsic (RAW_SCAN_KEYS)
+    instead of the rasterized grid. This module rebuilds the same uint8 grid as
+    LocalOccupancyGrid (scan points stamped with a disk stencil, scan polygon
+    filled with the even-odd scanline rule, static footprint / heading overlay,
+    target point) with scatters and a batched scanline fill.
+
+    The polygon fill follows cv2.fillPoly (clipped 4-connected edges, 16-bit
+    fixed point scanline crossings); obs_transformers_test.py bounds the
+    remaining mismatch with LocalOccupancyGrid.
+
+    The scan parameters must be those of the envs: PPOTrainer adds the
+    transform, built with from_env_config, when the observations carry
+    RAW_SCAN_KEYS.
+    """
+
+    def __init__(
+        self,
+        grid_resolution: int = 128,
+        occupancy_range: float = 5.0,
+        robot_footprint_radius: float = 0.32,
+        n_horizontal_rays: int = 228,
+        laser_angular_range: float = 240.0,
+        min_laser_dist: float = 0.05,
+        laser_linear_range: float = 5.6,
+        output_key: str = "global_occupancy_grid",
+    ):
+        super().__init__()
+        self.grid_resolution = grid_resolution
+        self.occupancy_range = occupancy_range
+        self.min_laser_dist = min_laser_dist
+        self.laser_linear_range = laser_linear_range
+        self.output_key = output_key
+
+        center = grid_resolution // 2
+        footprint_radius_in_map = int(
+            robot_footprint_radius / occupancy_range * grid_resolution
+        )
+        overlay_mask, overlay_values = static_overlay(
+            grid_resolution,
+            footprint_radius_in_map,
+            (center + grid_resolution // 15, center),
+        )
+        overlay = np.full((grid_resolution, grid_resolution), -1, dtype=np.int64)
+        overlay[overlay_mask] = overlay_values
+
+        self.register_buffer(
+            "unit_vector_laser",
+            torch.from_numpy(
+                laser_unit_vectors(n_horizontal_rays, laser_angular_range)[:, :2]
+            ),
+            persistent=False,
+        )
+        self.register_buffer(
+            "point_stencil", torch.from_numpy(disk_stencil(2)).long(), persistent=False
+        )
+        self.register_buffer(
+            "overlay", torch.from_numpy(overlay), persistent=False
+        )
+
+    def transform_observation_space(
+        self,
+        observation_space: spaces.Dict,
+    ):
+        observation_space = copy.deepcopy(observation_space)
+        if RAW_SCAN_KEYS[0] in observation_space.spaces:
+            for key in RAW_SCAN_KEYS:
+                observation_space.spaces.pop(key, None)
+            observation_space.spaces[self.output_key] = spaces.Box(
+                low=0,
+                high=2,
+                shape=(self.grid_resolution, self.grid_resolution, 1),
+                dtype=np.uint8,
+            )
+        return observation_space
+
+    def _stamp(self, grid: torch.Tensor, centers: torch.Tensor, value: int):
+        # grid: [B, H, W], centers: [B, N, 2] (x, y)
+        pixels = centers.unsqueeze(2) + self.point_stencil.view(1, 1, -1, 2)
+        grid[self._scatter_mask(pixels[..., 0], pixels[..., 1])] = value
+
+    def _scatter_mask(self, x: torch.Tensor, y: torch.Tensor) -> torch.Tensor:
+        # boolean [B, H, W] mask of the pixels (x, y) given as [B, ...] tensors
+        batch_size = x.shape[0]
+        height = width = self.grid_resolution
+        valid = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        batch_idx = torch.arange(batch_size, device=x.device).view(
+            -1, *([1] * (x.dim() - 1))
+        )
+        flat_idx = (batch_idx * height + y) * width + x
+        mask = torch.zeros(
+            batch_size * height * width, dtype=torch.bool, device=x.device
+        )
+        mask[flat_idx[valid]] = True
+        return mask.view(batch_size, height, width)
+
+    def _fill_polygon(self, vertices: torch.Tensor) -> torch.Tensor:
+        # cv2.fillPoly of the closed polygons vertices [B, V, 2] (x, y): edges are
+        # drawn as clipped 4-connected lines, then the interior is filled scanline
+        # by scanline between pairs of edge crossings (even-odd rule), with the
+        # crossings computed in the same 16-bit fixed point as cv2
+        height = width = self.grid_resolution
+        one = 65536
+        start = torch.roll(vertices, shifts=1, dims=1)
+        end = vertices
+        clipped_start, clipped_end, visible = self._clip_lines(start, end)
+
+        # edges leaving the grid are interpolated from their clipped end points,
+        # edges inside it from the pixel centers
+        outside = ((start < 0) | (start >= width) | (end < 0) | (end >= width)).any(-1)
+        use_clipped = outside & (clipped_start[..., 1] != clipped_end[..., 1])
+        use_clipped = use_clipped.unsqueeze(-1)
+        offset = (~outside).long().unsqueeze(-1) * (one // 2)
+        scale = torch.tensor([one, 1], device=vertices.device)
+        p0 = torch.where(use_clipped, clipped_start, start) * scale
+        p1 = torch.where(use_clipped, clipped_end, end) * scale
+        p0[..., :1] += offset
+        p1[..., :1] += offset
+
+        y0, y1 = start[..., 1], end[..., 1]
+        dy = p1[..., 1] - p0[..., 1]
+        dy = torch.where(dy == 0, torch.ones_like(dy), dy)
+        dx_fixed = torch.div(p1[..., 0] - p0[..., 0], dy, rounding_mode="trunc")
+        top_y = torch.minimum(y0, y1)
+        bottom_y = torch.maximum(y0, y1)
+        top_x = torch.where(y0 < y1, p0[..., 0] + (y0 - p0[..., 1]) * dx_fixed,
+                            p1[..., 0] + (y1 - p1[..., 1]) * dx_fixed)
+
+        # crossings of the scanlines [top, bottom) of every edge
+        top_y, bottom_y = top_y.unsqueeze(1), bottom_y.unsqueeze(1)
+        rows = torch.arange(height, device=vertices.device).view(1, -1, 1)
+        crosses = (top_y <= rows) & (rows < bottom_y)
+        crossing_x = top_x.unsqueeze(1) + (rows - top_y) * dx_fixed.unsqueeze(1)
+        big = torch.iinfo(torch.int64).max
+        crossing_x = torch.where(crosses, crossing_x, torch.full_like(crossing_x, big))
+        crossing_x, _ = torch.sort(crossing_x, dim=-1)  # [B, H, V]
+
+        cols = torch.arange(width, device=vertices.device) * one
+        cols = cols.view(1, 1, -1).expand(crossing_x.shape[0], height, width).contiguous()
+        count_le = torch.searchsorted(crossing_x, cols, right=True)
+        count_lt = torch.searchsorted(crossing_x, cols, right=False)
+        # pixels between a pair of crossings, both ends included
+        inside = ((count_lt % 2) == 1) | (count_le > count_lt)
+        return inside | self._draw_lines(clipped_start, clipped_end, visible)
+
+    def _clip_lines(self, start: torch.Tensor, end: torch.Tensor):
+        # cv2.clipLine of [B, E, 2] integer endpoints to the grid, in the same
+        # order and with the same truncations; also returns which lines are visible
+        last = self.grid_resolution - 1
+        x1, y1 = start[..., 0], start[..., 1]
+        x2, y2 = end[..., 0], end[..., 1]
+
+        def outcode(x, y):
+            return (x < 0).long() + (x > last).long() * 2 + (y < 0).long() * 4 + (y > last).long() * 8
+
+        def shift(offset, num, den):
+            # (int64)((double)offset * num / den) without dividing by zero
+            den = torch.where(den == 0, torch.ones_like(den), den)
+            return torch.trunc(offset.double() * num / den).long()
+
+        c1, c2 = outcode(x1, y1), outcode(x2, y2)
+        clip = ((c1 & c2) == 0) & ((c1 | c2) != 0)
+        for first in (True, False):
+            c = c1 if first else c2
+            x, y = (x1, y1) if first else (x2, y2)
+            move = clip & ((c & 12) != 0)
+            bound = torch.where(c < 8, torch.zeros_like(c), torch.full_like(c, last))
+            x = torch.where(move, x + shift(bound - y, x2 - x1, y2 - y1), x)
+            y = torch.where(move, bound, y)
+            c = torch.where(move, (x < 0).long() + (x > last).long() * 2, c)
+            if first:
+                x1, y1, c1 = x, y, c
+            else:
+                x2, y2, c2 = x, y, c
+        clip = clip & ((c1 & c2) == 0) & ((c1 | c2) != 0)
+        for first in (True, False):
+            c = c1 if first else c2
+            x, y = (x1, y1) if first else (x2, y2)
+            move = clip & (c != 0)
+            bound = torch.where(c == 1, torch.zeros_like(c), torch.full_like(c, last))
+            y = torch.where(move, y + shift(bound - x, y2 - y1, x2 - x1), y)
+            x = torch.where(move, bound, x)
+            c = torch.where(move, torch.zeros_like(c), c)
+            if first:
+                x1, y1, c1 = x, y, c
+            else:
+                x2, y2, c2 = x, y, c
+        visible = (c1 | c2) == 0
+        return torch.stack([x1, y1], dim=-1), torch.stack([x2, y2], dim=-1), visible
+
+    def _draw_lines(
+        self, start: torch.Tensor, end: torch.Tensor, visible: torch.Tensor
+    ) -> torch.Tensor:
+        # 4-connected lines as drawn by cv2.line(lineType=4) for [B, E, 2] endpoints
+        # already clipped to the grid. Lines are traced from their left end; along
+        # the major axis each step n covers minor offsets ceil((n - 1) * dmin / dmaj)
+        # and ceil(n * dmin / dmaj).
+        swap = (start[..., 0] > end[..., 0]).unsqueeze(-1)
+        p0 = torch.where(swap, end, start)
+        p1 = torch.where(swap, start, end)
+        delta = p1 - p0
+        step = torch.sign(delta)
+        adx, ady = delta[..., 0].abs(), delta[..., 1].abs()
+        steep = ady > adx
+        dmaj = torch.where(steep, ady, adx).unsqueeze(-1)
+        dmin = torch.where(steep, adx, ady).unsqueeze(-1)
+
+        n = torch.arange(
+            int(dmaj.max().item()) + 1 if dmaj.numel() > 0 else 1, device=start.device
+        ).view(1, 1, -1)
+        safe_dmaj = torch.clamp(dmaj, min=1)
+        m_enter = torch.div(torch.clamp(n - 1, min=0) * dmin + safe_dmaj - 1, safe_dmaj, rounding_mode="floor")
+        m_leave = torch.div(n * dmin + safe_dmaj - 1, safe_dmaj, rounding_mode="floor")
+        m_leave = torch.where(n >= dmaj, dmin.expand_as(m_leave), m_leave)
+        on_line = (n <= dmaj) & visible.unsqueeze(-1)
+
+        masks = []
+        for m in (m_enter, m_leave):
+            major = torch.where(steep.unsqueeze(-1), step[..., 1:2], step[..., 0:1]) * n
+            minor = torch.where(steep.unsqueeze(-1), step[..., 0:1], step[..., 1:2]) * m
+            x = p0[..., 0:1] + torch.where(steep.unsqueeze(-1), minor, major)
+            y = p0[..., 1:2] + torch.where(steep.unsqueeze(-1), major, minor)
+            x = torch.where(on_line, x, torch.full_like(x, -1))
+            masks.append(self._scatter_mask(x, y))
+        return masks[0] | masks[1]
+
+    @torch.no_grad()
+    def rasterize(
+        self, scan: torch.Tensor, target: torch.Tensor, extrinsic: torch.Tensor
+    ) -> torch.Tensor:
+        """Args:
+        scan: [B, N, 1] hit fractions
+        target: [B, 2] target position in the robot base frame
+        extrinsic: [B, 2, 3] laser to base planar transform [R | t]
+        Returns: [B, H, W, 1] uint8 occupancy grid (OccupancyGridState * 2)
+        """
+        batch_size = scan.shape[0]
+        res = self.grid_resolution
+        scan = scan.double().view(batch_size, -1, 1)
+        extrinsic = extrinsic.double()
+        rotation, translation = extrinsic[:, :, :2], extrinsic[:, :, 2]
+        dist = scan * (self.laser_linear_range - self.min_laser_dist) + self.min_laser_dist
+        dirs = torch.einsum("nk,bjk->bnj", self.unit_vector_laser.double(), rotation)
+        points = dirs * dist + translation.unsqueeze(1)
+
+        origin = torch.zeros(batch_size, 1, 2, dtype=points.dtype, device=points.device)
+        points = torch.cat([origin, points, origin], dim=1)
+        scale = torch.tensor([1.0, -1.0], dtype=points.dtype, device=points.device)
+        vertices = (points * scale / self.occupancy_range * res + res / 2).long()
+
+        grid = torch.full(
+            (batch_size, res, res), UNKNOWN, dtype=torch.uint8, device=scan.device
+        )
+        self._stamp(grid, vertices, OBSTACLES)
+        grid[self._fill_polygon(vertices)] = FREESPACE
+        overlay_mask = self.overlay >= 0
+        grid[:, overlay_mask] = self.overlay[overlay_mask].to(torch.uint8)
+
+        target = target.double().view(batch_size, 1, 2)
+        target_in_map = (target * scale / self.occupancy_range * res + res / 2).long()
+        self._stamp(grid, target_in_map, OBSTACLES)
+        return grid.unsqueeze(-1)
+
+    @torch.no_grad()
+    def forward(
+        self, observations: Dict[str, torch.Tensor]
+    ) -> Dict[str, torch.Tensor]:
+        if RAW_SCAN_KEYS[0] in observations:
+            scan, target, extrinsic = (
+                observations.pop(key) for key in RAW_SCAN_KEYS
+            )
+            observations[self.output_key] = self.rasterize(scan, target, extrinsic)
+        return observations
+
+    @classmethod
+    def from_config(cls, config: Config):
+        raise ValueError(
+            "OccupancyGridRasterizer is built from the env config and added "
+            "by the trainer when the envs run with occupancy_grid_mode: "
+            "learner, remove it from RL.POLICY.OBS_TRANSFORMS.ENABLED_TRANSFORMS"
+        )
+
+    @classmethod
+    def from_env_config(cls, env_config: Dict[str, Any]):
+        r"""Rasterizer matching the ScanSensor of an iGibson env config,
+        with the same defaults.
+        """
+        return cls(
+            grid_resolution=env_config.get("grid_resolution", 128),
+            occupancy_range=env_config.get("occupancy_range", 5),
+            robot_footprint_radius=env_config.get("robot_footprint_radius", 0.32),
+            n_horizontal_rays=env_config.get("n_horizontal_rays", 128),
+            laser_angular_range=env_config.get("laser_angular_range", 180.0),
+            min_laser_dist=env_config.get("min_laser_dist", 0.05),
+            laser_linear_range=env_config.get("laser_linear_range", 10.0),
+        )
+
 
 def get_active_obs_transforms(config: Config) -> List[ObservationTransformer]:
     active_obs_transforms = []
@@ -0,0 +1,132 @@
+import unittest
+
+import numpy as np
+import torch
+from gym import spaces
+
+from agent.common.obs_transformers import OccupancyGridRasterizer
+from agent.gibson_extension.utils.occupancy_grid_utils import (
+    LocalOccupancyGrid,
+    RAW_SCAN_KEYS,
+)
+from agent.gibson_extension.utils.scan_utils import (
+    laser_unit_vectors,
+    scan_to_base_points,
+)
+
+# scan parameters of turtlebot_nav.yaml
+ENV_CONFIG = {
+    "grid_resolution": 128,
+    "occupancy_range": 5.0,
+    "robot_footprint_radius": 0.32,
+    "n_horizontal_rays": 228,
+    "laser_angular_range": 240.0,
+    "min_laser_dist": 0.05,
+    "laser_linear_range": 5.6,
+}
+
+
+def random_raw_scans(rng, num_envs, n_horizontal_rays, occupancy_range):
+    scans = rng.uniform(size=(num_envs, n_horizontal_rays, 1)).astype(np.float32)
+    targets = rng.uniform(
+        -occupancy_range, occupancy_range, size=(num_envs, 2)
+    ).astype(np.float32)
+    yaw = rng.uniform(-0.05, 0.05, size=num_envs)
+    extrinsics = np.zeros((num_envs, 2, 3), dtype=np.float32)
+    extrinsics[:, 0, 0], extrinsics[:, 0, 1] = np.cos(yaw), -np.sin(yaw)
+    extrinsics[:, 1, 0], extrinsics[:, 1, 1] = np.sin(yaw), np.cos(yaw)
+    extrinsics[:, :, 2] = rng.uniform(-0.1, 0.1, size=(num_envs, 2))
+    return scans, targets, extrinsics
+
+
+def reference_grids(scans, targets, extrinsics):
+    # what ScanSensor.get_local_occupancy_grid returns in the workers
+    res = ENV_CONFIG["grid_resolution"]
+    occupancy_range = ENV_CONFIG["occupancy_range"]
+    footprint = int(ENV_CONFIG["robot_footprint_radius"] / occupancy_range * res)
+    reference = LocalOccupancyGrid(
+        res, occupancy_range, footprint, (res // 2 + res // 15, res // 2)
+    )
+    unit_vector_laser = laser_unit_vectors(
+        ENV_CONFIG["n_horizontal_rays"], ENV_CONFIG["laser_angular_range"]
+    )[:, :2]
+    grids = []
+    for scan, target, extrinsic in zip(scans, targets, extrinsics):
+        unit_vector_base = unit_vector_laser.dot(
+            extrinsic[:, :2].astype(np.float64).T
+        )
+        scan_local = scan_to_base_points(
+            scan.astype(np.float64),
+            unit_vector_base,
+            extrinsic[:, 2].astype(np.float64),
+            ENV_CONFIG["min_laser_dist"],
+            ENV_CONFIG["laser_linear_range"],
+        )
+        grids.append(reference.rasterize(scan_local, target.astype(np.float64)))
+    return np.stack(grids, axis=0)
+
+
+class OccupancyGridRasterizerTest(unittest.TestCase):
+    def setUp(self):
+        self.rasterizer = OccupancyGridRasterizer.from_env_config(ENV_CONFIG)
+
+    def test_matches_local_occupancy_grid(self):
+        rng = np.random.RandomState(0)
+        mismatches, total = 0, 0
+        for _ in range(5):
+            scans, targets, extrinsics = random_raw_scans(
+                rng, 8, ENV_CONFIG["n_horizontal_rays"], ENV_CONFIG["occupancy_range"]
+            )
+            expected = reference_grids(scans, targets, extrinsics)
+            actual = self.rasterizer.rasterize(
+                *(torch.from_numpy(x) for x in (scans, targets, extrinsics))
+            ).numpy()
+            self.assertEqual(actual.shape, expected.shape)
+            self.assertEqual(actual.dtype, np.uint8)
+            mismatches += int(np.count_nonzero(actual != expected))
+            total += expected.size
+        # float rounding of the projected scan points moves a few pixels
+        self.assertLess(mismatches / total, 1e-3)
+
+    def test_uses_env_scan_parameters(self):
+        self.assertEqual(self.rasterizer.unit_vector_laser.shape, (228, 2))
+        self.assertEqual(self.rasterizer.laser_linear_range, 5.6)
+        defaults = OccupancyGridRasterizer.from_env_config({})
+        self.assertEqual(defaults.unit_vector_laser.shape, (128, 2))
+
+    def test_not_configurable_from_agent_config(self):
+        with self.assertRaises(ValueError):
+            OccupancyGridRasterizer.from_config(None)
+
+    def test_replaces_raw_scans_with_grid(self):
+        observation_space = spaces.Dict(
+            {
+                "depth": spaces.Box(0.0, 1.0, (8, 8, 1), np.float32),
+                "occupancy_scan": spaces.Box(0.0, 1.0, (228, 1), np.float32),
+                "occupancy_target": spaces.Box(-np.inf, np.inf, (2,), np.float32),
+                "occupancy_extrinsic": spaces.Box(-np.inf, np.inf, (2, 3), np.float32),
+            }
+        )
+        transformed = self.rasterizer.transform_observation_space(observation_space)
+        self.assertEqual(
+            sorted(transformed.spaces), ["depth", "global_occupancy_grid"]
+        )
+        self.assertEqual(
+            transformed.spaces["global_occupancy_grid"].shape, (128, 128, 1)
+        )
+
+        scans, targets, extrinsics = random_raw_scans(
+            np.random.RandomState(1), 2, 228, 5.0
+        )
+        observations = dict(
+            zip(RAW_SCAN_KEYS, (torch.from_numpy(x) for x in (scans, targets, extrinsics)))
+        )
+        observations["depth"] = torch.zeros(2, 8, 8, 1)
+        observations = self.rasterizer(observations)
+        self.assertEqual(
+            sorted(observations), ["depth", "global_occupancy_grid"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -12,12 +12,18 @@ import traceback
 from typing import Tuple
 from absl import logging
 
+import cloudpickle
 import gin
 import numpy as np
 
 from agent.environments import py_environment
 from agent.utils import nest_utils
 
+# Modules the forkserver imports once before forking the env workers. Missing
+# modules are skipped by multiprocessing.
+DEFAULT_PRELOAD_MODULES = ('numpy', 'cv2', 'torch', 'pybullet', 'igibson',
+                           'agent.environments.suite_gibson')
+
 
 @gin.configurable
 class ParallelPyEnvironment(py_environment.PyEnvironment):
@@ -30,7 +36,9 @@ class ParallelPyEnvironment(py_environment.PyEnvironment):
   """
 
   def __init__(self, env_constructors, start_serially=True, blocking=False,
-               flatten=False):
+               flatten=False, start_method=None,
+               preload_modules=DEFAULT_PRELOAD_MODULES, remote_endpoints=(),
+               remote_authkey=None):
     """Batch together environments and simulate them in external processes.
 
     The environments can be different but must use the same action and
@@ -42,14 +50,38 @@ class ParallelPyEnvironment(py_environment.PyEnvironment):
       blocking: Whether to step environments one after another.
       flatten: Boolean, whether to use flatten action and time_steps during
         communication to reduce overhead.
+      start_method: multiprocessing start method of the workers, 'fork',
+        'forkserver' or 'spawn'; None uses the platform default. With
+        'forkserver', a server process imports `preload_modules` once and
+        forks every worker from it, so workers skip the heavy imports and
+        share the imported modules copy-on-write without inheriting the
+        state of the main process (e.g. CUDA).
+      preload_modules: Modules imported by the forkserver before forking.
+        Modules that load shared assets at import time can be added here.
+      remote_endpoints: Environments hosted by remote servers (see
+        remote_py_environment), as 'host:port#index' or 'path#index'
+        strings. They are batched after the local environments.
+      remote_authkey: Authentication key of the remote servers, or None.
 
     Raises:
       ValueError: If the action or observation specs don't match.
     """
     super(ParallelPyEnvironment, self).__init__()
-    self._envs = [ProcessPyEnvironment(ctor, flatten=flatten)
+    context = multiprocessing.get_context(start_method)
+    if context.get_start_method() == 'forkserver':
+      context.set_forkserver_preload(list(preload_modules))
+    self._envs = [ProcessPyEnvironment(ctor, flatten=flatten, context=context)
                   for ctor in env_constructors]
-    self._num_envs = len(env_constructors)
+    num_local_envs = len(self._envs)
+    if remote_endpoints:
+      # imported here, remote_py_environment builds on ProcessPyEnvironment
+      from agent.environments.remote_py_environment import RemotePyEnvironment
+      if isinstance(remote_authkey, str):
+        remote_authkey = remote_authkey.encode()
+      self._envs += [RemotePyEnvironment(endpoint, authkey=remote_authkey,
+                                         flatten=flatten)
+                     for endpoint in remote_endpoints]
+    self._num_envs = len(self._envs)
     self._blocking = blocking
     self._start_serially = start_serially
     self.start()
@@ -59,8 +91,16 @@ class ParallelPyEnvironment(py_environment.PyEnvironment):
     self._parallel_execution = True
     if any(env.action_spec() != self._action_spec for env in self._envs):
       raise ValueError('All environments must have the same action spec.')
-    if any(env.time_step_spec() != self._time_step_spec for env in self._envs):
-      raise ValueError('All environments must have the same time_step_spec.')
+    for index, env in enumerate(self._envs):
+      if env.time_step_spec() != self._time_step_spec:
+        message = ('All environments must have the same time_step_spec, '
+                   'environment {} has {}, expected {}.'.format(
+                       index, env.time_step_spec(), self._time_step_spec))
+        if index >= num_local_envs:
+          message += (' Remote servers render their own observations: start '
+                      'them with the --render_modalities and '
+                      '--render_shortest_edge of the local environments.')
+        raise ValueError(message)
     self._flatten = flatten
 
   def start(self):
@@ -189,7 +229,7 @@ class ProcessPyEnvironment(object):
   _EXCEPTION = 5
   _CLOSE = 6
 
-  def __init__(self, env_constructor, flatten=False):
+  def __init__(self, env_constructor, flatten=False, context=None):
     """Step environment in a separate process for lock free paralellism.
 
     The environment is created in an external process by calling the provided
@@ -199,8 +239,12 @@ class ProcessPyEnvironment(object):
 
     Args:
       env_constructor: Callable that creates and returns a Python environment.
+        Unless the start method is 'fork', it is sent to the worker with
+        cloudpickle and must not capture unpicklable state.
       flatten: Boolean, whether to assume flattened actions and time_steps
         during communication to avoid overhead.
+      context: multiprocessing context used to start the process; None uses
+        the default context.
 
     Attributes:
       observation_spec: The cached observation spec of the environment.
@@ -209,6 +253,8 @@ class ProcessPyEnvironment(object):
     """
     self._env_constructor = env_constructor
     self._flatten = flatten
+    self._context = context or multiprocessing.get_context()
+    self._process = None
     self._observation_spec = None
     self._action_spec = None
     self._time_step_spec = None
@@ -219,10 +265,13 @@ class ProcessPyEnvironment(object):
     Args:
       wait_to_start: Whether the call should wait for an env initialization.
     """
-    self._conn, conn = multiprocessing.Pipe()
-    self._process = multiprocessing.Process(
-        target=self._worker,
-        args=(conn, self._env_constructor, self._flatten))
+    env_constructor = self._env_constructor
+    if self._context.get_start_method() != 'fork':
+      env_constructor = cloudpickle.dumps(env_constructor)
+    self._conn, conn = self._context.Pipe()
+    self._process = self._context.Process(
+        target=ProcessPyEnvironment._worker,
+        args=(conn, env_constructor, self._flatten))
     atexit.register(self.close)
     self._process.start()
     if wait_to_start:
@@ -233,7 +282,8 @@ class ProcessPyEnvironment(object):
     result = self._conn.recv()
     if isinstance(result, Exception):
       self._conn.close()
-      self._process.join(5)
+      if self._process is not None:
+        self._process.join(5)
       raise result
     assert result == self._READY, result
 
@@ -290,7 +340,8 @@ class ProcessPyEnvironment(object):
     except IOError:
       # The connection was already closed.
       pass
-    self._process.join(5)
+    if self._process is not None:
+      self._process.join(5)
 
   def step(self, action, blocking=True):
     """Step the environment.
@@ -351,12 +402,17 @@ class ProcessPyEnvironment(object):
     self.close()
     raise KeyError('Received message of unexpected type {}'.format(message))
 
-  def _worker(self, conn, env_constructor, flatten=False):
+  @staticmethod
+  def _worker(conn, env_constructor, flatten=False):
     """The process waits for actions and sends back environment results.
 
+    A static method so that starting the process does not pickle the
+    ProcessPyEnvironment with start methods other than 'fork'.
+
     Args:
       conn: Connection for communication to the main process.
-      env_constructor: env_constructor for the OpenAI Gym environment.
+      env_constructor: env_constructor for the OpenAI Gym environment, or its
+        cloudpickle serialization.
       flatten: Boolean, whether to assume flattened actions and time_steps
         during communication to avoid overhead.
 
@@ -364,9 +420,11 @@ class ProcessPyEnvironment(object):
       KeyError: When receiving a message of unknown type.
     """
     try:
+      if isinstance(env_constructor, bytes):
+        env_constructor = cloudpickle.loads(env_constructor)
       env = env_constructor()
       action_spec = env.action_space
-      conn.send(self._READY)  # Ready.
+      conn.send(ProcessPyEnvironment._READY)  # Ready.
       while True:
         try:
           # Only block for short times to have keyboard exceptions be raised.
@@ -375,12 +433,12 @@ class ProcessPyEnvironment(object):
           message, payload = conn.recv()
         except (EOFError, KeyboardInterrupt):
           break
-        if message == self._ACCESS:
+        if message == ProcessPyEnvironment._ACCESS:
           name = payload
           result = getattr(env, name)
-          conn.send((self._RESULT, result))
+          conn.send((ProcessPyEnvironment._RESULT, result))
           continue
-        if message == self._CALL:
+        if message == ProcessPyEnvironment._CALL:
           name, args, kwargs = payload
           if flatten and name == 'step':
             args = [torch.tensor(args[0]).view(action_spec.shape)]
@@ -388,9 +446,9 @@ class ProcessPyEnvironment(object):
           result = getattr(env, name)(*args, **kwargs)
           if flatten and name in ['step', 'reset']:
             result = torch.flatten(result)
-          conn.send((self._RESULT, result))
+          conn.send((ProcessPyEnvironment._RESULT, result))
           continue
-        if message == self._CLOSE:
+        if message == ProcessPyEnvironment._CLOSE:
           assert payload is None
           env.close()
           break
@@ -400,6 +458,6 @@ class ProcessPyEnvironment(object):
       stacktrace = ''.join(traceback.format_exception(etype, evalue, tb))
       message = 'Error in environment process: {}'.format(stacktrace)
       logging.error(message)
-      conn.send((self._EXCEPTION, stacktrace))
+      conn.send((ProcessPyEnvironment._EXCEPTION, stacktrace))
     finally:
       conn.close()
\ No newline at end of file
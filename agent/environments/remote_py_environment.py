@@ -0,0 +1,294 @@
+"""Runs environments in a remote server process and steps them over sockets.
+
+A server hosts N environments, each in its own worker process running the same
+loop as `ProcessPyEnvironment`, and accepts one connection per environment.
+`RemotePyEnvironment` is the client side: it speaks the `ProcessPyEnvironment`
+protocol (`_CALL`, `_ACCESS`, `_RESULT`, ...) over a TCP or Unix socket, so
+`ParallelPyEnvironment` can mix local and remote environments.
+
+Messages are pickled, except numpy arrays which are sent as raw binary frames
+and received straight into preallocated arrays. Pickled messages execute code
+when loaded: only serve on trusted networks, and set an authkey.
+
+Start a server hosting 4 iGibson environments:
+
+  python -m agent.environments.remote_py_environment --address 0.0.0.0:6000 \
+    --num_envs 4 --config_file gibson_extension/examples/configs/turtlebot_nav.yaml \
+    --render_modalities depth --render_shortest_edge 256
+
+where the render flags are those the trainer passes its local environments
+(PPOTrainer.get_render_spec), and point the learner at it with gin:
+
+  ParallelPyEnvironment.remote_endpoints = ['simhost:6000#0', 'simhost:6000#1', ...]
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import atexit
+import functools
+import multiprocessing
+import multiprocessing.connection
+import pickle
+import socket
+
+from absl import logging
+import numpy as np
+
+from agent.environments.parallel_py_environment import ProcessPyEnvironment
+
+
+class _ArrayRef(object):
+  """Placeholder of an array sent as a separate frame."""
+
+  def __init__(self, index):
+    self.index = index
+
+
+def _extract_arrays(obj, arrays):
+  """Replaces the numpy arrays in nested lists, tuples and dicts by _ArrayRef."""
+  if isinstance(obj, np.ndarray) and obj.dtype != object:
+    arrays.append(obj)
+    return _ArrayRef(len(arrays) - 1)
+  if isinstance(obj, dict):
+    return type(obj)((key, _extract_arrays(value, arrays))
+                     for key, value in obj.items())
+  if isinstance(obj, tuple) and hasattr(obj, '_fields'):
+    return type(obj)(*[_extract_arrays(value, arrays) for value in obj])
+  if isinstance(obj, (list, tuple)):
+    return type(obj)(_extract_arrays(value, arrays) for value in obj)
+  return obj
+
+
+def _restore_arrays(obj, arrays):
+  """Inverse of _extract_arrays."""
+  if isinstance(obj, _ArrayRef):
+    return arrays[obj.index]
+  if isinstance(obj, dict):
+    return type(obj)((key, _restore_arrays(value, arrays))
+                     for key, value in obj.items())
+  if isinstance(obj, tuple) and hasattr(obj, '_fields'):
+    return type(obj)(*[_restore_arrays(value, arrays) for value in obj])
+  if isinstance(obj, (list, tuple)):
+    return type(obj)(_restore_arrays(value, arrays) for value in obj)
+  return obj
+
+
+class ArrayConnection(object):
+  """Connection sending numpy arrays as raw frames next to the pickled message.
+
+  Wraps a `multiprocessing.connection.Connection` and exposes the subset of its
+  interface used by `ProcessPyEnvironment` (send, recv, poll, close).
+  """
+
+  def __init__(self, conn):
+    self._conn = conn
+    # messages are several frames: without TCP_NODELAY, Nagle's algorithm holds
+    # back the last frame until the previous one is acknowledged
+    sock = socket.fromfd(conn.fileno(), socket.AF_INET, socket.SOCK_STREAM)
+    try:
+      sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError:
+      pass  # Unix socket
+    finally:
+      sock.close()
+
+  def send(self, obj):
+    arrays = []
+    skeleton = _extract_arrays(obj, arrays)
+    header = [(array.dtype.str, array.shape) for array in arrays]
+    self._conn.send_bytes(pickle.dumps((skeleton, header),
+                                       protocol=pickle.HIGHEST_PROTOCOL))
+    for array in arrays:
+      if array.nbytes > 0:
+        self._conn.send_bytes(
+            memoryview(np.ascontiguousarray(array)).cast('B'))
+      else:
+        # memoryview cannot cast views with zeros in their shape
+        self._conn.send_bytes(b'')
+
+  def recv(self):
+    skeleton, header = pickle.loads(self._conn.recv_bytes())
+    arrays = []
+    for dtype, shape in header:
+      array = np.empty(shape, dtype=dtype)
+      if array.nbytes > 0:
+        self._conn.recv_bytes_into(memoryview(array).cast('B'))
+      else:
+        self._conn.recv_bytes()
+      arrays.append(array)
+    return _restore_arrays(skeleton, arrays)
+
+  def poll(self, timeout=0.0):
+    return self._conn.poll(timeout)
+
+  def close(self):
+    self._conn.close()
+
+
+def parse_endpoint(endpoint):
+  """Parses 'host:port#index' (TCP) or 'path#index' (Unix socket).
+
+  Args:
+    endpoint: Endpoint string; the index defaults to 0.
+
+  Returns:
+    Address for `multiprocessing.connection` and environment index.
+  """
+  address, _, index = endpoint.partition('#')
+  index = int(index) if index else 0
+  if ':' in address and not address.startswith('/'):
+    host, port = address.rsplit(':', 1)
+    return (host, int(port)), index
+  return address, index
+
+
+class RemotePyEnvironment(ProcessPyEnvironment):
+  """Step a single env hosted by a RemoteEnvServer."""
+
+  def __init__(self, endpoint, authkey=None, flatten=False):
+    """Step an environment hosted by a remote server.
+
+    Args:
+      endpoint: 'host:port#index' or 'path#index' of the environment.
+      authkey: Authentication key shared with the server, or None.
+      flatten: Boolean, whether to assume flattened actions and time_steps
+        during communication to avoid overhead.
+    """
+    super(RemotePyEnvironment, self).__init__(None, flatten=flatten)
+    self._address, self._env_index = parse_endpoint(endpoint)
+    self._authkey = authkey
+
+  def start(self, wait_to_start=True):
+    """Connect to the server, which starts the environment.
+
+    Args:
+      wait_to_start: Whether the call should wait for an env initialization.
+    """
+    conn = multiprocessing.connection.Client(self._address,
+                                             authkey=self._authkey)
+    conn.send(self._env_index)
+    self._conn = ArrayConnection(conn)
+    atexit.register(self.close)
+    if wait_to_start:
+      self.wait_start()
+
+
+class RemoteEnvServer(object):
+  """Hosts environments, each in a worker process serving one connection."""
+
+  def __init__(self, address, env_constructors, authkey=None, flatten=False):
+    """Host environments for RemotePyEnvironment clients.
+
+    Args:
+      address: (host, port) tuple for TCP or a path for a Unix socket.
+      env_constructors: List of callables that create environments; a
+        client connecting with index i gets an environment from the i-th.
+      authkey: Authentication key clients must present, or None.
+      flatten: Boolean, whether to assume flattened actions and time_steps
+        during communication to avoid overhead.
+    """
+    self._address = address
+    self._env_constructors = env_constructors
+    self._authkey = authkey
+    self._flatten = flatten
+    self._processes = {}
+
+  def serve_forever(self):
+    """Accept connections and start an environment worker for each."""
+    listener = multiprocessing.connection.Listener(self._address,
+                                                   authkey=self._authkey)
+    logging.info('Serving %d environments on %s.',
+                 len(self._env_constructors), listener.address)
+    try:
+      while True:
+        try:
+          conn = listener.accept()
+          env_index = conn.recv()
+        except (EOFError, OSError, multiprocessing.AuthenticationError) as e:
+          logging.warning('Rejected connection: %s', e)
+          continue
+        self._start_worker(conn, env_index)
+    finally:
+      listener.close()
+      for process in self._processes.values():
+        process.join(5)
+
+  def _start_worker(self, conn, env_index):
+    process = self._processes.get(env_index)
+    if not 0 <= env_index < len(self._env_constructors):
+      error = IndexError('No environment {} on this server'.format(env_index))
+    elif process is not None and process.is_alive():
+      error = RuntimeError('Environment {} is already connected'.format(env_index))
+    else:
+      error = None
+    if error is not None:
+      ArrayConnection(conn).send(error)
+      conn.close()
+      return
+    process = multiprocessing.Process(
+        target=ProcessPyEnvironment._worker,
+        args=(ArrayConnection(conn), self._env_constructors[env_index],
+              self._flatten),
+        daemon=True)
+    process.start()
+    # the worker owns the connection now
+    conn.close()
+    self._processes[env_index] = process
+    logging.info('Started environment %d.', env_index)
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--address', type=str, default='localhost:6000',
+                      help='host:port, or a path for a Unix socket')
+  parser.add_argument('--num_envs', type=int, default=1)
+  parser.add_argument('--authkey', type=str, default=None)
+  parser.add_argument('--config_file', type=str, default=None)
+  parser.add_argument('--model_ids', type=str, default=None,
+                      help='comma-separated model ids, one per environment')
+  parser.add_argument('--gpu', type=int, default=0)
+  parser.add_argument('--action_timestep', type=float, default=1.0 / 10.0)
+  parser.add_argument('--physics_timestep', type=float, default=1.0 / 40.0)
+  parser.add_argument('--render_modalities', type=str, default=None,
+                      help='comma-separated vision modalities the learner consumes, '
+                      'as in PPOTrainer.get_render_spec')
+  parser.add_argument('--render_shortest_edge', type=int, default=None,
+                      help='shortest image edge the learner consumes, '
+                      'as in PPOTrainer.get_render_spec')
+  parser.add_argument('--fake', action='store_true',
+                      help='host stand-in environments (suite_fake) instead of iGibson')
+  args = parser.parse_args()
+
+  address, _ = parse_endpoint(args.address)
+  render_spec = dict(
+      render_modalities=(args.render_modalities.split(',')
+                         if args.render_modalities is not None else None),
+      render_shortest_edge=args.render_shortest_edge)
+  model_ids = args.model_ids.split(',') if args.model_ids else [None] * args.num_envs
+  assert len(model_ids) == args.num_envs, 'one model id per environment'
+  if args.fake:
+    from agent.environments import suite_fake
+    env_constructors = [functools.partial(suite_fake.load, seed=i,
+                                          **render_spec)
+                        for i in range(args.num_envs)]
+  else:
+    from agent.environments import suite_gibson
+    env_constructors = [functools.partial(suite_gibson.load,
+                                          config_file=args.config_file,
+                                          model_id=model_id,
+                                          env_mode='headless',
+                                          action_timestep=args.action_timestep,
+                                          physics_timestep=args.physics_timestep,
+                                          device_idx=args.gpu,
+                                          **render_spec)
+                        for model_id in model_ids]
+  authkey = args.authkey.encode() if args.authkey else None
+  logging.set_verbosity(logging.INFO)
+  RemoteEnvServer(address, env_constructors, authkey=authkey).serve_forever()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,103 @@
+"""Tests for agent.environments.remote_py_environment."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import functools
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from absl.testing import absltest
+import numpy as np
+
+from agent.environments import parallel_py_environment
+from agent.environments import remote_py_environment
+from agent.environments import suite_fake
+
+Pair = collections.namedtuple('Pair', ['first', 'second'])
+
+
+class ArrayConnectionTest(absltest.TestCase):
+
+  def setUp(self):
+    super(ArrayConnectionTest, self).setUp()
+    conn_a, conn_b = multiprocessing.Pipe()
+    self.sender = remote_py_environment.ArrayConnection(conn_a)
+    self.receiver = remote_py_environment.ArrayConnection(conn_b)
+
+  def tearDown(self):
+    self.sender.close()
+    self.receiver.close()
+    super(ArrayConnectionTest, self).tearDown()
+
+  def test_round_trip(self):
+    message = (
+        1,
+        {'depth': np.random.rand(4, 6, 1).astype(np.float32),
+         'task_obs': np.arange(4, dtype=np.float64)},
+        [np.zeros((0, 3), dtype=np.int64), 'name', None],
+        Pair(np.array([True, False]), np.array(2.5, dtype=np.float32)),
+        np.array(['a', 1], dtype=object),
+    )
+    self.sender.send(message)
+    received = self.receiver.recv()
+
+    self.assertEqual(received[0], 1)
+    self.assertEqual(list(received[1].keys()), ['depth', 'task_obs'])
+    for key, value in message[1].items():
+      self.assertEqual(received[1][key].dtype, value.dtype)
+      np.testing.assert_array_equal(received[1][key], value)
+    self.assertEqual(received[2][0].shape, (0, 3))
+    self.assertEqual(received[2][0].dtype, np.int64)
+    self.assertEqual(received[2][1:], ['name', None])
+    self.assertIsInstance(received[3], Pair)
+    np.testing.assert_array_equal(received[3].first, [True, False])
+    self.assertEqual(received[3].second.shape, ())
+    self.assertEqual(received[3].second, np.float32(2.5))
+    self.assertEqual(list(received[4]), ['a', 1])
+
+  def test_non_contiguous_array(self):
+    array = np.arange(24, dtype=np.int32).reshape(4, 6)[:, ::2]
+    self.sender.send(array)
+    np.testing.assert_array_equal(self.receiver.recv(), array)
+
+
+class RemoteRenderSpecTest(absltest.TestCase):
+
+  def serve(self, **render_spec):
+    # the listener of the server thread outlives the test, and removes its
+    # socket file at exit
+    address = os.path.join(tempfile.mkdtemp(), 'env.sock')
+    server = remote_py_environment.RemoteEnvServer(
+        address, [functools.partial(suite_fake.load, **render_spec)])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    while not os.path.exists(address):
+      time.sleep(0.01)
+    return address + '#0'
+
+  def parallel_env(self, endpoint):
+    return parallel_py_environment.ParallelPyEnvironment(
+        [functools.partial(suite_fake.load, render_modalities=['depth'],
+                           render_shortest_edge=64)],
+        remote_endpoints=[endpoint])
+
+  def test_matching_render_spec(self):
+    env = self.parallel_env(
+        self.serve(render_modalities=['depth'], render_shortest_edge=64))
+    try:
+      self.assertEqual(env.batch_size, 2)
+    finally:
+      env.close()
+
+  def test_mismatched_render_spec(self):
+    with self.assertRaisesRegex(ValueError, '--render_shortest_edge'):
+      self.parallel_env(self.serve())
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,170 @@
+import time
+from collections import OrderedDict
+
+import gin
+import gym
+import numpy as np
+
+from agent.environments import gym_wrapper
+from agent.environments import wrappers
+from agent.gibson_extension.utils.render_utils import derive_render_config
+
+
+class FakeGibsonEnv(gym.Env):
+    """
+    Stand-in for iGibsonEnv with the same observation and action spaces (task_obs, vision,
+    scan and occupancy grid outputs) and info keys, without a simulator. Observations are
+    drawn from a seeded generator, so two instances with the same seed produce the same
+    episodes, and steps and resets sleep for a configurable time to stand in for simulation
+    and rendering. Used to test and benchmark the env plumbing and the trainer on machines
+    without iGibson.
+    """
+
+    def __init__(self,
+                 output=('task_obs', 'rgb', 'depth', 'occupancy_grid'),
+                 image_width=640,
+                 image_height=360,
+                 task_obs_dim=4,
+                 n_horizontal_rays=228,
+                 grid_resolution=512,
+                 occupancy_grid_mode='worker',
+                 max_step=500,
+                 episode_length=100,
+                 step_time=0.0,
+                 reset_time=0.0,
+                 seed=0,
+                 render_modalities=None,
+                 render_shortest_edge=None):
+        """
+        :param output: observation modalities, among task_obs, rgb, depth, scan and occupancy_grid
+        :param image_width: image width
+        :param image_height: image height
+        :param task_obs_dim: task observation dimension
+        :param n_horizontal_rays: number of LiDAR rays
+        :param grid_resolution: occupancy grid resolution
+        :param occupancy_grid_mode: worker (rasterized grid) or learner (raw scan, target and extrinsic)
+        :param max_step: episode step limit, as in the iGibson config
+        :param episode_length: episodes succeed after this many steps
+        :param step_time: seconds each step sleeps to stand in for simulation and rendering
+        :param reset_time: seconds each reset sleeps to stand in for episode sampling and landing
+        :param seed: random seed
+        :param render_modalities: vision modalities the policy consumes, as in iGibsonEnv
+        :param render_shortest_edge: shortest image edge the policy consumes, as in iGibsonEnv
+        """
+        self.config = derive_render_config({
+            'output': list(output),
+            'image_width': image_width,
+            'image_height': image_height,
+            'discount_factor': 0.99,
+            'max_step': max_step,
+            # scan parameters of turtlebot_nav.yaml, read by the learner in occupancy_grid_mode learner
+            'n_horizontal_rays': n_horizontal_rays,
+            'laser_angular_range': 240.0,
+            'laser_linear_range': 5.6,
+            'min_laser_dist': 0.05,
+            'grid_resolution': grid_resolution,
+            'occupancy_grid_mode': occupancy_grid_mode,
+        }, render_modalities, render_shortest_edge)
+        self.output = self.config['output']
+        self.image_width = self.config['image_width']
+        self.image_height = self.config['image_height']
+        self.episode_length = episode_length
+        self.step_time = step_time
+        self.reset_time = reset_time
+        self.scene_id = 'fake'
+        self.current_episode = 0
+        self.current_step = 0
+        self.rng = np.random.RandomState(seed)
+
+        image_shape = (self.image_height, self.image_width)
+        observation_space = OrderedDict()
+        if 'task_obs' in self.output:
+            observation_space['task_obs'] = self.build_obs_space((task_obs_dim,), -np.inf, np.inf)
+        if 'rgb' in self.output:
+            observation_space['rgb'] = self.build_obs_space(image_shape + (3,), 0.0, 1.0)
+        if 'depth' in self.output:
+            observation_space['depth'] = self.build_obs_space(image_shape + (1,), 0.0, 1.0)
+        if 'scan' in self.output:
+            observation_space['scan'] = self.build_obs_space((n_horizontal_rays, 1), 0.0, 1.0)
+        if 'occupancy_grid' in self.output:
+            if occupancy_grid_mode == 'learner':
+                observation_space['occupancy_scan'] = self.build_obs_space((n_horizontal_rays, 1), 0.0, 1.0)
+                observation_space['occupancy_target'] = self.build_obs_space((2,), -np.inf, np.inf)
+                observation_space['occupancy_extrinsic'] = self.build_obs_space((2, 3), -np.inf, np.inf)
+            else:
+                observation_space['global_occupancy_grid'] = gym.spaces.Box(
+                    low=0, high=2, shape=(grid_resolution, grid_resolution, 1), dtype=np.uint8)
+        self.observation_space = gym.spaces.Dict(observation_space)
+        self.action_space = gym.spaces.Box(low=-1.0, high=1.0, shape=(2,), dtype=np.float32)
+
+    def build_obs_space(self, shape, low, high):
+        return gym.spaces.Box(low=low, high=high, shape=shape, dtype=np.float32)
+
+    def get_state(self):
+        state = OrderedDict()
+        for modality, space in self.observation_space.spaces.items():
+            if space.dtype == np.uint8:
+                state[modality] = self.rng.randint(0, 3, size=space.shape).astype(np.uint8)
+            else:
+                state[modality] = self.rng.uniform(size=space.shape).astype(np.float32)
+        return state
+
+    def step(self, action):
+        if self.step_time > 0:
+            time.sleep(self.step_time)
+        self.current_step += 1
+        done = self.current_step >= self.episode_length
+        info = {
+            'done': done,
+            'success': float(done),
+            'path_length': float(self.current_step),
+            'spl': float(done),
+            'episode_length': self.current_step,
+            'collision_step': 0,
+            'reset_render_syncs_skipped': 0,
+        }
+        reward = float(self.rng.uniform(-0.1, 0.1))
+        return self.get_state(), reward, done, info
+
+    def reset(self):
+        if self.reset_time > 0:
+            time.sleep(self.reset_time)
+        self.current_episode += 1
+        self.current_step = 0
+        return self.get_state()
+
+    def reload_model(self, scene_id):
+        self.scene_id = scene_id
+
+    def seed(self, seed=None):
+        self.rng = np.random.RandomState(seed)
+
+    def close(self):
+        pass
+
+
+@gin.configurable
+def load(model_id=None,
+         env_mode='headless',
+         device_idx=0,
+         seed=0,
+         **kwargs):
+    """
+    Load a FakeGibsonEnv, wrapped as suite_gibson.load wraps iGibsonEnv
+
+    :param model_id: ignored, for compatibility with suite_gibson.load
+    :param env_mode: ignored, for compatibility with suite_gibson.load
+    :param device_idx: ignored, for compatibility with suite_gibson.load
+    :param seed: random seed
+    :param kwargs: FakeGibsonEnv arguments
+    :return: wrapped py environment
+    """
+    env = FakeGibsonEnv(seed=seed, **kwargs)
+    env = gym_wrapper.GymWrapper(
+        env,
+        discount=env.config['discount_factor'],
+        match_obs_space_dtype=True,
+        auto_reset=True,
+        simplify_box_bounds=True
+    )
+    return wrappers.TimeLimit(env, env.config['max_step'])
@@ -17,14 +17,18 @@ def load(config_file,
          device_idx=0,
          gym_env_wrappers=(),
          env_wrappers=(),
-         spec_dtype_map=None):
+         spec_dtype_map=None,
+         render_modalities=None,
+         render_shortest_edge=None):
     config_file = os.path.join(os.path.dirname(agent.__file__), config_file)
     env = iGibsonEnv(config_file=config_file,
                      scene_id=model_id,
                      mode=env_mode,
                      action_timestep=action_timestep,
                      physics_timestep=physics_timestep,
-                     device_idx=device_idx)
+                     device_idx=device_idx,
+                     render_modalities=render_modalities,
+                     render_shortest_edge=render_shortest_edge)
 
     discount = env.config.get('discount_factor', 0.99)
     max_episode_steps = env.config.get('max_step', 500)
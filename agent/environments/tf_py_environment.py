@@ -269,26 +269,51 @@ class TFPyEnvironment(tf_environment.TFEnvironment):
     def _current_time_step_py():
         if self._time_step is None:
             self._time_step = self._env.reset()
-        return self._flatten(self._time_step)
+        return self._time_step
 
     def _isolated_current_time_step_py():
         return self._execute(_current_time_step_py)
 
-    outputs = np.array(_isolated_current_time_step_py())
-    
-    step_type, reward, discount, task_obs, rgb, depth, occupancy_grid, *info = (outputs[i::13] for i in range(13))
+    step_type, reward, discount, flat_observations, info = self._stack_time_steps(
+        _isolated_current_time_step_py())
+    return self._set_names_and_shapes(step_type, reward, discount, *flat_observations, info=info)
 
-    step_type, reward, discount = np.vstack(step_type), np.vstack(reward), np.vstack(discount)
-    step_type, reward, discount = np.stack(step_type, axis=0).reshape(-1,1), np.stack(reward, axis=0).reshape(-1,1), np.stack(discount, axis=0).reshape(-1,1)
+  def _stack_time_steps(self, time_steps):
+    """Stacks the time steps of the wrapped environment into batched arrays.
 
-    flat_observations = [task_obs, rgb, depth, occupancy_grid]
+    Args:
+      time_steps: Either a batched `TimeStep` (`BatchedPyEnvironment`) or a
+        list of per-environment `(step_type, reward, discount, observation,
+        info)` tuples (`ParallelPyEnvironment`).
 
-    flat_observations = [np.stack(item, axis = 0) for item in flat_observations]
+    Returns:
+      A tuple `(step_type, reward, discount, flat_observations, info)`:
+        step_type, reward, discount: `[batch_size, 1]` arrays.
+        flat_observations: A list of `[batch_size, ...]` arrays, one per key of
+          `observation_spec()`, in that order.
+        info: A dict of `[batch_size, 1]` float32 arrays over the union of the
+          info keys reported by the environments, in order of appearance;
+          environments that do not report a key get 0.
+    """
+    if isinstance(time_steps, ts.TimeStep):
+      step_type, reward, discount, observation, info = time_steps
+      flat_observations = [np.asarray(observation[key]) for key in self.observation_spec()]
+      info = {key: np.asarray(value).astype(np.float32).reshape(-1, 1)
+              for key, value in info.items()}
+    else:
+      step_type, reward, discount, observations, infos = zip(*time_steps)
+      flat_observations = [np.stack([observation[key] for observation in observations], axis=0)
+                           for key in self.observation_spec()]
+      info_keys = []
+      for env_info in infos:
+        info_keys.extend(key for key in env_info if key not in info_keys)
+      info = {key: np.array([env_info.get(key, 0) for env_info in infos]).astype(np.float32).reshape(-1, 1)
+              for key in info_keys}
+    step_type = np.asarray(step_type).reshape(-1, 1)
+    reward = np.asarray(reward).reshape(-1, 1)
+    discount = np.asarray(discount).reshape(-1, 1)
+    return step_type, reward, discount, flat_observations, info
 
-    info = [item.astype(np.float32).reshape(-1,1) for item in info]
-    
-    return self._set_names_and_shapes(step_type, reward, discount, *flat_observations, info=info)
-  
   # Make sure this is called without conversion from tf.function.
   # TODO(b/123600776): Remove override.
   def _reset(self):
@@ -365,7 +390,7 @@ class TFPyEnvironment(tf_environment.TFEnvironment):
         with self._lock:
             flattened_actions = np.stack(flattened_actions, axis=0)
             self._time_step = self._env.step(flattened_actions, *args)
-            return self._flatten(self._time_step)
+            return self._time_step
 
     def _isolated_step_py(*flattened_actions):
         return self._execute(_step_py, *flattened_actions)
@@ -388,30 +413,8 @@ class TFPyEnvironment(tf_environment.TFEnvironment):
       
       # Convert actions to numpy arrays, pass them to the isolated function, and convert back to tensors
       flat_actions_numpy = [action.cpu().numpy() for action in flat_actions]
-      outputs = np.array(_isolated_step_py(*flat_actions_numpy))  # Assuming _isolated_step_py is defined
-
-      num_environments = 4
-
-      if len(outputs) // 6 == num_environments and len(flat_actions_numpy) == num_environments:
-        step_type, reward, discount, *flat_observations = (outputs[i::7] for i in range(7))
-
-        step_type, reward, discount = np.stack(step_type, axis=0).reshape(-1,1), np.stack(reward, axis=0).reshape(-1,1), np.stack(discount, axis=0).reshape(-1,1)
-
-        flat_observations = [np.stack(item, axis = 0) for item in flat_observations]
-
-        info = {}
-        
-      else:
-        step_type, reward, discount, task_obs, rgb, depth, occupancy_grid, *info = (outputs[i::13] for i in range(13))
-
-        step_type, reward, discount = np.vstack(step_type), np.vstack(reward), np.vstack(discount)
-        step_type, reward, discount = np.stack(step_type, axis=0).reshape(-1,1), np.stack(reward, axis=0).reshape(-1,1), np.stack(discount, axis=0).reshape(-1,1)
-
-        flat_observations = [task_obs, rgb, depth, occupancy_grid]
-
-        flat_observations = [np.stack(item, axis = 0) for item in flat_observations]
-
-        info = [item.astype(np.float32).reshape(-1,1) for item in info]
+      step_type, reward, discount, flat_observations, info = self._stack_time_steps(
+          _isolated_step_py(*flat_actions_numpy))
 
       return self._set_names_and_shapes(step_type, reward, discount, *flat_observations, info=info)
 
@@ -427,19 +430,18 @@ class TFPyEnvironment(tf_environment.TFEnvironment):
         step_type = step_type.numpy()
         discount = discount.numpy()
 
-    info_spec = ['done', 'success', 'path_length', 'spl', 'episode_length', 'collision_step']
-
     # Give each tensor a meaningful name and set the static shape.
     named_observations = {}
     for obs, spec in zip(flat_observations, self.observation_spec()):
         obs = torch.tensor(obs)
-        named_observation = obs.clone().detach().requires_grad_(True).rename(None)
+        named_observation = obs.clone().detach().requires_grad_(
+            obs.is_floating_point()).rename(None)
         if not torch._C._get_tracing_state():
             named_observation = named_observation.numpy()
         named_observations[spec] = named_observation
 
     named_infos = {}
-    for obs, spec in zip(info, info_spec):
+    for spec, obs in info.items():
         obs = torch.tensor(obs)
         named_info = obs.clone().detach().requires_grad_(False).rename(None)
         if not torch._C._get_tracing_state():
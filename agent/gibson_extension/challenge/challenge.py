@@ -12,10 +12,15 @@ class Challenge:
         self.config_file = os.environ['CONFIG_FILE']
         self.split = os.environ['SPLIT']
         self.episode_dir = os.environ['EPISODE_DIR']
-        self.eval_episodes_per_scene = os.environ.get(
-            'EVAL_EPISODES_PER_SCENE', 5)
+        self.eval_episodes_per_scene = int(os.environ.get(
+            'EVAL_EPISODES_PER_SCENE', 5))
 
     def submit(self, agent):
+        """
+        Run the agent on the episodes of the split
+
+        :return: metrics averaged over the episodes
+        """
         env_config = parse_config(self.config_file)
 
         task = env_config['task']
@@ -80,6 +85,8 @@ class Challenge:
             metrics[key] /= total_num_episodes
             print('Avg {}: {}'.format(key, metrics[key]))
 
+        return metrics
+
 
 if __name__ == '__main__':
     challenge = Challenge()
@@ -0,0 +1,55 @@
+import time
+
+import numpy as np
+import torch
+
+from agent.common.common import batch_obs, ObservationBatchingCache
+from agent.common.obs_transformers import apply_obs_transforms_batch
+
+
+class PolicyAgent:
+    """
+    Agent of Challenge.submit running a policy on the observations of one environment
+    """
+
+    def __init__(self, policy, obs_transforms, sensors=('task_obs', 'depth'), device='cpu',
+                 record_observations=False):
+        """
+        :param policy: Policy in eval mode, float or quantized, or an ExportedPolicy
+        :param obs_transforms: observation transforms of the agent config, applied before the policy
+        :param sensors: observations of the environment passed to the policy
+        :param device: device of the policy
+        :param record_observations: keep the transformed observations, e.g. to calibrate a quantized policy
+        """
+        self.policy = policy
+        self.obs_transforms = obs_transforms
+        self.device = torch.device(device)
+        self.sensors = sensors
+        # an ExportedPolicy has the recurrent state sizes of the Net itself
+        net = getattr(policy, 'net', policy)
+        self.hidden_shape = (net.num_recurrent_layers, net._hidden_size)
+        self.record_observations = record_observations
+        self.observations = []
+        self.act_times = []
+        self._obs_batching_cache = ObservationBatchingCache()
+        self.reset()
+
+    def reset(self):
+        self.rnn_hidden_states = torch.zeros(1, *self.hidden_shape, device=self.device)
+        self.prev_actions = torch.zeros(1, 2, device=self.device)
+        self.masks = torch.zeros(1, 1, dtype=torch.bool, device=self.device)
+
+    def act(self, state):
+        start = time.perf_counter()
+        observations = {key: np.asarray(state[key], dtype=np.float32) for key in self.sensors if key in state}
+        batch = batch_obs([observations], device=self.device, cache=self._obs_batching_cache)
+        batch = apply_obs_transforms_batch(batch, self.obs_transforms)
+        if self.record_observations:
+            self.observations.append({key: value.clone() for key, value in batch.items()})
+        with torch.no_grad():
+            _, action, _, self.rnn_hidden_states = self.policy.act(
+                batch, self.rnn_hidden_states, self.prev_actions, self.masks)
+        self.prev_actions.copy_(action)
+        self.masks.fill_(True)
+        self.act_times.append(time.perf_counter() - start)
+        return action[0].cpu().numpy()
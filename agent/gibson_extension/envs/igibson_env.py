@@ -1,4 +1,4 @@
-from igibson.utils.utils import quatToXYZW
+from igibson.utils.utils import quatToXYZW, parse_config
 from igibson.envs.env_base import BaseEnv
 from igibson.tasks.room_rearrangement_task import RoomRearrangementTask
 from agent.gibson_extension.tasks.point_nav_fixed_task import PointNavFixedTask
@@ -7,6 +7,9 @@ from igibson.tasks.interactive_nav_random_task import InteractiveNavRandomTask
 from igibson.tasks.dynamic_nav_random_task import DynamicNavRandomTask
 from igibson.tasks.reaching_random_task import ReachingRandomTask
 from agent.gibson_extension.sensors.scan_sensor import ScanSensor
+from agent.gibson_extension.utils.render_utils import derive_render_config
+from agent.gibson_extension.utils.state_utils import KinematicState
+from agent.gibson_extension.utils.trav_map_cache import TravMapCache
 from igibson.sensors.vision_sensor import VisionSensor
 from igibson.robots.robot_base import BaseRobot
 from igibson.external.pybullet_tools.utils import stable_z_on_aabb
@@ -36,6 +39,8 @@ class iGibsonEnv(BaseEnv):
         device_idx=0,
         render_to_tensor=False,
         automatic_reset=False,
+        render_modalities=None,
+        render_shortest_edge=None,
     ):
         """
         :param config_file: config_file path
@@ -46,7 +51,14 @@ class iGibsonEnv(BaseEnv):
         :param device_idx: which GPU to run the simulation and rendering on
         :param render_to_tensor: whether to render directly to pytorch tensors
         :param automatic_reset: whether to automatic reset after an episode finishes
-        """
+        :param render_modalities: vision modalities the policy consumes, others in output are not rendered
+        :param render_shortest_edge: shortest image edge the policy consumes, images are rendered at most this size
+        """
+        if render_modalities is not None or render_shortest_edge is not None:
+            # the renderer is created in BaseEnv.__init__ from image_width / image_height
+            config_file = derive_render_config(
+                parse_config(config_file), render_modalities, render_shortest_edge)
+        self.kinematic_state = None
         super(iGibsonEnv, self).__init__(config_file=config_file,
                                          scene_id=scene_id,
                                          mode=mode,
@@ -74,6 +86,7 @@ class iGibsonEnv(BaseEnv):
         # ignore the agent's collision with these link ids of itself
         self.collision_ignore_link_a_ids = set(
             self.config.get('collision_ignore_link_a_ids', []))
+        self.robot_body_id = self.robots[0].get_body_ids()[0]
 
         # discount factor
         self.discount_factor = self.config.get('discount_factor', 0.99)
@@ -85,6 +98,7 @@ class iGibsonEnv(BaseEnv):
             'object_randomization_freq', None)
 
         # task
+        self.close_task()
         if self.config['task'] == 'point_nav_fixed':
             self.task = PointNavFixedTask(self)
         elif self.config['task'] == 'point_nav_random':
@@ -175,18 +189,56 @@ class iGibsonEnv(BaseEnv):
             scan_modalities.append('scan')
         if 'occupancy_grid' in self.output:
             self.grid_resolution = self.config.get('grid_resolution', 512)
-            self.occupancy_grid_space = gym.spaces.Box(low=0.0,
-                                                       high=1.0,
-                                                       shape=(self.grid_resolution,
-                                                              self.grid_resolution, 1))
-            observation_space['global_occupancy_grid'] = self.occupancy_grid_space
+            self.occupancy_grid_mode = self.config.get('occupancy_grid_mode', 'worker')
+            assert self.occupancy_grid_mode in ['worker', 'learner'], \
+                'occupancy_grid_mode must be worker or learner'
+            if self.occupancy_grid_mode == 'learner':
+                # raw scan, target and laser extrinsic, rasterized by OccupancyGridRasterizer
+                n_horizontal_rays = self.config.get('n_horizontal_rays', 128)
+                observation_space['occupancy_scan'] = self.build_obs_space(
+                    shape=(n_horizontal_rays, 1), low=0.0, high=1.0)
+                observation_space['occupancy_target'] = self.build_obs_space(
+                    shape=(2,), low=-np.inf, high=np.inf)
+                observation_space['occupancy_extrinsic'] = self.build_obs_space(
+                    shape=(2, 3), low=-np.inf, high=np.inf)
+            else:
+                # uint8 OccupancyGridState * 2 (0: obstacles, 1: unknown, 2: free space)
+                self.occupancy_grid_space = gym.spaces.Box(low=0,
+                                                           high=2,
+                                                           shape=(self.grid_resolution,
+                                                                  self.grid_resolution, 1),
+                                                           dtype=np.uint8)
+                observation_space['global_occupancy_grid'] = self.occupancy_grid_space
             scan_modalities.append('occupancy_grid')
-
-        if len(vision_modalities) > 0:
-            sensors['vision'] = VisionSensor(self, vision_modalities)
-
-        if len(scan_modalities) > 0:
-            sensors['scan_occ'] = ScanSensor(self, scan_modalities)
+        if 'occupancy_map' in self.output:
+            # ego-centric crop of the global map accumulated over the episode, same layout as the local grid
+            map_crop_resolution = self.config.get('grid_resolution', 128)
+            observation_space['occupancy_map'] = gym.spaces.Box(low=0,
+                                                                high=2,
+                                                                shape=(map_crop_resolution,
+                                                                       map_crop_resolution, 1),
+                                                                dtype=np.uint8)
+            scan_modalities.append('occupancy_map')
+
+        # outputs with an update period > 1 get their own sensor, refreshed every period steps
+        # and reused in between
+        self.sensor_update_periods = self.config.get('sensor_update_periods', None) or {}
+        self.sensor_periods = OrderedDict()
+        self.sensor_modalities = OrderedDict()
+        for sensor_name, sensor_class, modalities in [('vision', VisionSensor, vision_modalities),
+                                                      ('scan_occ', ScanSensor, scan_modalities)]:
+            periods = OrderedDict()
+            for modality in modalities:
+                period = int(self.sensor_update_periods.get(modality, 1))
+                assert period >= 1, 'sensor_update_periods must be at least 1'
+                periods.setdefault(period, []).append(modality)
+            for period, group in periods.items():
+                name = sensor_name if period == 1 else '{}_every_{}'.format(sensor_name, period)
+                sensors[name] = sensor_class(self, group)
+                self.sensor_periods[name] = period
+                self.sensor_modalities[name] = group
+        self.sensor_cache = {}
+        self.sensor_staleness = {}
 
         self.observation_space = gym.spaces.Dict(observation_space)
         self.sensors = sensors
@@ -205,12 +257,47 @@ class iGibsonEnv(BaseEnv):
         self.collision_step = 0
         self.current_episode = 0
         self.collision_links = []
+        # renderer syncs avoided by physics_step during the last reset
+        self.reset_render_syncs_skipped = 0
+
+    def close_task(self):
+        """
+        Stop the background work of the current task (e.g. episode presampling),
+        before it is replaced by a reload or the environment is closed
+        """
+        task = getattr(self, 'task', None)
+        if task is not None and hasattr(task, 'close'):
+            task.close()
+
+    def close(self):
+        """
+        Close the task, then disconnect the simulator
+        """
+        self.close_task()
+        super(iGibsonEnv, self).close()
 
     def load(self):
         """
         Load environment
         """
-        super(iGibsonEnv, self).load()
+        trav_map_cache_dir = self.config.get('trav_map_cache_dir', None)
+        if trav_map_cache_dir is None:
+            super(iGibsonEnv, self).load()
+        else:
+            # BaseEnv.load creates the scene and imports it right away: hook the cache in between
+            trav_map_cache = TravMapCache(trav_map_cache_dir)
+            import_scene = self.simulator.import_scene
+
+            def import_scene_with_cache(scene, *args, **kwargs):
+                if hasattr(scene, 'load_trav_map'):
+                    trav_map_cache.attach(scene)
+                return import_scene(scene, *args, **kwargs)
+
+            self.simulator.import_scene = import_scene_with_cache
+            try:
+                super(iGibsonEnv, self).load()
+            finally:
+                del self.simulator.import_scene
         self.load_task_setup()
         self.load_observation_space()
         self.load_action_space()
@@ -226,17 +313,50 @@ class iGibsonEnv(BaseEnv):
         state = OrderedDict()
         if 'task_obs' in self.output:
             state['task_obs'] = self.task.get_task_obs(self)
-        if 'vision' in self.sensors:
-            vision_obs = self.sensors['vision'].get_obs(self)
-            for modality in vision_obs:
-                state[modality] = vision_obs[modality]
-        if 'scan_occ' in self.sensors:
-            scan_obs = self.sensors['scan_occ'].get_obs(self)
-            for modality in scan_obs:
-                state[modality] = scan_obs[modality]
+        for name, sensor in self.sensors.items():
+            if name not in self.sensor_cache or self.sensor_staleness[name] + 1 >= self.sensor_periods[name]:
+                self.sensor_cache[name] = sensor.get_obs(self)
+                self.sensor_staleness[name] = 0
+            else:
+                self.sensor_staleness[name] += 1
+            state.update(self.sensor_cache[name])
 
         return state
 
+    def simulator_step(self):
+        """
+        Step the simulation and drop the kinematic state of the previous step
+        """
+        self.kinematic_state = None
+        super(iGibsonEnv, self).simulator_step()
+
+    def physics_step(self):
+        """
+        Step the physics for one action timestep without syncing the renderer.
+        Used while resetting, landing and checking validity, where only contacts are read;
+        reset syncs the renderer once at the end. In gui modes this is a full simulator_step
+        so that the viewer stays up to date
+        """
+        if self.mode in ['gui', 'iggui']:
+            self.simulator_step()
+            return
+        self.kinematic_state = None
+        for _ in range(self.simulator.physics_timestep_num):
+            p.stepSimulation()
+        self.simulator._non_physics_step()
+        self.simulator.frame_count += 1
+        self.reset_render_syncs_skipped += 1
+
+    def get_kinematic_state(self):
+        """
+        Get the kinematic state of the robot at the current simulator step, captured on first use
+
+        :return: KinematicState shared by the task, reward functions, termination conditions and sensors
+        """
+        if self.kinematic_state is None:
+            self.kinematic_state = KinematicState(self.robots[0])
+        return self.kinematic_state
+
     def run_simulation(self):
         """
         Run simulation for one action timestep (same as one render timestep in Simulator class)
@@ -244,32 +364,29 @@ class iGibsonEnv(BaseEnv):
         :return: collision_links: collisions from last physics timestep
         """
         self.simulator_step()
-        collision_links = list(p.getContactPoints(
-            bodyA=self.robots[0].get_body_ids()[0]))
-        return self.filter_collision_links(collision_links)
+        return self.filter_collision_links(p.getContactPoints(bodyA=self.robot_body_id))
 
     def filter_collision_links(self, collision_links):
         """
-        Filter out collisions that should be ignored
-
-        :param collision_links: original collisions, a list of collisions
-        :return: filtered collisions
-        """
-        new_collision_links = []
-        for item in collision_links:
-            # ignore collision with body b
-            if item[2] in self.collision_ignore_body_b_ids:
-                continue
-
-            # ignore collision with robot link a
-            if item[3] in self.collision_ignore_link_a_ids:
-                continue
-
-            # ignore self collision with robot link a (body b is also robot itself)
-            if item[2] == self.robots[0].get_body_ids()[0] and item[4] in self.collision_ignore_link_a_ids:
-                continue
-            new_collision_links.append(item)
-        return new_collision_links
+        Filter out collisions that should be ignored, in one pass over the contact points.
+        A step has few contacts: set lookups on the contact tuples are faster than building
+        numpy arrays from them
+
+        :param collision_links: original collisions, a sequence of pybullet contact points
+        :return: filtered collisions, a list of collisions
+        """
+        ignore_body_b_ids = self.collision_ignore_body_b_ids
+        ignore_link_a_ids = self.collision_ignore_link_a_ids
+        if len(ignore_body_b_ids) == 0 and len(ignore_link_a_ids) == 0:
+            return list(collision_links)
+        robot_body_id = self.robot_body_id
+        return [item for item in collision_links
+                # ignore collision with body b
+                if item[2] not in ignore_body_b_ids
+                # ignore collision with robot link a
+                and item[3] not in ignore_link_a_ids
+                # ignore self collision with robot link a (body b is also robot itself)
+                and not (item[2] == robot_body_id and item[4] in ignore_link_a_ids)]
 
     def populate_info(self, info):
         """
@@ -277,6 +394,12 @@ class iGibsonEnv(BaseEnv):
         """
         info['episode_length'] = self.current_step
         info['collision_step'] = self.collision_step
+        info['reset_render_syncs_skipped'] = self.reset_render_syncs_skipped
+        # steps since the decimated outputs were last refreshed
+        for name, period in self.sensor_periods.items():
+            if period > 1:
+                for modality in self.sensor_modalities[name]:
+                    info['{}_staleness'.format(modality)] = self.sensor_staleness[name]
 
     def step(self, action):
         """
@@ -319,7 +442,7 @@ class iGibsonEnv(BaseEnv):
         :param body_id: pybullet body id
         :return: whether the given body_id has no collision
         """
-        self.simulator_step()
+        self.physics_step()
         collisions = list(p.getContactPoints(bodyA=body_id))
 
         if logging.root.level <= logging.DEBUG:  # Only going into this if it is for logging --> efficiency
@@ -397,7 +520,7 @@ class iGibsonEnv(BaseEnv):
         # land for maximum 1 second, should fall down ~5 meters
         max_simulator_step = int(1.0 / self.action_timestep)
         for _ in range(max_simulator_step):
-            self.simulator_step()
+            self.physics_step()
             if len(p.getContactPoints(bodyA=body_id)) > 0:
                 land_success = True
                 break
@@ -408,6 +531,7 @@ class iGibsonEnv(BaseEnv):
         if is_robot:
             obj.reset()
             obj.keep_still()
+            self.kinematic_state = None
 
     def reset_variables(self):
         """
@@ -436,11 +560,18 @@ class iGibsonEnv(BaseEnv):
         Reset episode
         """
         self.randomize_domain()
+        self.reset_render_syncs_skipped = 0
         # move robot away from the scene
         self.robots[0].set_position([100.0, 100.0, 100.0])
+        self.kinematic_state = None
         self.task.reset_scene(self)
         self.task.reset_agent(self)
         self.simulator.sync()
+        for sensor in self.sensors.values():
+            if isinstance(sensor, ScanSensor):
+                sensor.reset(self)
+        # refresh all outputs at the start of an episode
+        self.sensor_cache = {}
         state = self.get_state()
         self.reset_variables()
 
@@ -0,0 +1,23 @@
+from igibson.reward_functions.point_goal_reward import PointGoalReward as BasePointGoalReward
+from igibson.utils.utils import l2_distance
+
+
+class PointGoalReward(BasePointGoalReward):
+    """
+    Point goal reward
+    Success reward for reaching the goal with the robot's base.
+    Reads the robot position from the env's per-step kinematic state
+    """
+
+    def get_reward(self, task, env):
+        """
+        Check if the distance between the robot's base and the goal
+        is below the distance threshold
+
+        :param task: task instance
+        :param env: environment instance
+        :return: reward
+        """
+        success = l2_distance(env.get_kinematic_state().get_position()[:2], task.target_pos[:2]) < self.dist_tol
+        reward = self.success_reward if success else 0.0
+        return reward
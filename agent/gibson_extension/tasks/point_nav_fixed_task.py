@@ -4,12 +4,13 @@ from igibson.scenes.igibson_indoor_scene import InteractiveIndoorScene
 from igibson.scenes.gibson_indoor_scene import StaticIndoorScene
 from igibson.termination_conditions.max_collision import MaxCollision
 from igibson.termination_conditions.timeout import Timeout
-from igibson.termination_conditions.out_of_bound import OutOfBound
-from igibson.termination_conditions.point_goal import PointGoal
+from agent.gibson_extension.termination_conditions.out_of_bound import OutOfBound
+from agent.gibson_extension.termination_conditions.point_goal import PointGoal
 from igibson.reward_functions.potential_reward import PotentialReward
 from igibson.reward_functions.collision_reward import CollisionReward
-from igibson.reward_functions.point_goal_reward import PointGoalReward
+from agent.gibson_extension.reward_functions.point_goal_reward import PointGoalReward
 from agent.gibson_extension.reward_functions.slack_reward import SlackReward
+from agent.gibson_extension.utils.geodesic_utils import FloorGraphIndex, DistanceFieldCache, path_waypoints
 
 from igibson.utils.utils import l2_distance, rotate_vector_3d, cartesian_to_polar
 from igibson.objects.visual_marker import VisualMarker
@@ -52,6 +53,15 @@ class PointNavFixedTask(BaseTask):
         )
         self.floor_num = 0
 
+        # sparse traversability graph per floor and LRU cache of per-target distance fields
+        self.floor_graph_index = {}
+        self.distance_field_cache = DistanceFieldCache(
+            self.config.get('distance_field_cache_size', 16))
+        # computed on first use in an episode: only the geodesic reward, SPL and
+        # shortest paths need them
+        self.target_distance_field = None
+        self.geodesic_dist = None
+
         self.load_visualization(env)
 
     def load_visualization(self, env):
@@ -96,6 +106,41 @@ class PointNavFixedTask(BaseTask):
             for waypoint in self.waypoints_vis:
                 waypoint.load()
 
+    def get_floor_graph_index(self, env):
+        """
+        Get the (cached) sparse traversability graph of the current floor
+
+        :param env: environment instance
+        :return: FloorGraphIndex of the current floor
+        """
+        if self.floor_num not in self.floor_graph_index:
+            self.floor_graph_index[self.floor_num] = FloorGraphIndex(
+                env.scene, self.floor_num)
+        return self.floor_graph_index[self.floor_num]
+
+    def get_target_distance_field(self, env):
+        """
+        Get the distance field of the current target position, computed once per target
+
+        :param env: environment instance
+        :return: GeodesicDistanceField of the target position
+        """
+        if self.target_distance_field is None:
+            self.target_distance_field = self.distance_field_cache.get(
+                env.scene, self.floor_num, self.get_floor_graph_index(env), self.target_pos)
+        return self.target_distance_field
+
+    def get_geodesic_dist(self, env):
+        """
+        Get the geodesic distance from the initial position to the target position, for SPL
+
+        :param env: environment instance
+        :return: geodesic distance of the episode
+        """
+        if self.geodesic_dist is None:
+            self.geodesic_dist = self.get_target_distance_field(env).distance(self.initial_pos)
+        return self.geodesic_dist
+
     def get_geodesic_potential(self, env):
         """
         Get potential based on geodesic distance
@@ -103,8 +148,7 @@ class PointNavFixedTask(BaseTask):
         :param env: environment instance
         :return: geodesic distance to the target position
         """
-        _, geodesic_dist = self.get_shortest_path(env)
-        return geodesic_dist
+        return self.get_target_distance_field(env).distance(env.get_kinematic_state().get_position())
 
     def get_l2_potential(self, env):
         """
@@ -113,7 +157,7 @@ class PointNavFixedTask(BaseTask):
         :param env: environment instance
         :return: L2 distance to the target position
         """
-        return l2_distance(env.robots[0].get_position()[:2],
+        return l2_distance(env.get_kinematic_state().get_position()[:2],
                            self.target_pos[:2])
 
     def get_potential(self, env):
@@ -148,7 +192,8 @@ class PointNavFixedTask(BaseTask):
         env.land(env.robots[0], self.initial_pos, self.initial_orn)
         self.path_length = 0.0
         self.robot_pos = self.initial_pos[:2]
-        self.geodesic_dist = self.get_geodesic_potential(env)
+        self.target_distance_field = None
+        self.geodesic_dist = None
         for reward_function in self.reward_functions:
             reward_function.reset(self, env)
 
@@ -160,9 +205,9 @@ class PointNavFixedTask(BaseTask):
             env, collision_links, action, info)
 
         info['path_length'] = self.path_length
-        if done:
-            info['spl'] = float(info['success']) * \
-                min(1.0, self.geodesic_dist / self.path_length)
+        # SPL is 0 unless the episode succeeds, the distance field is not needed then
+        if done and info['success']:
+            info['spl'] = min(1.0, self.get_geodesic_dist(env) / self.path_length)
         else:
             info['spl'] = 0.0
 
@@ -176,8 +221,9 @@ class PointNavFixedTask(BaseTask):
         :param pos: a 3D point in global frame
         :return: the same 3D point in agent's local frame
         """
-        return rotate_vector_3d(pos - env.robots[0].get_position(),
-                                *env.robots[0].get_rpy())
+        kinematic_state = env.get_kinematic_state()
+        return rotate_vector_3d(pos - kinematic_state.get_position(),
+                                *kinematic_state.get_rpy())
 
     def get_task_obs(self, env):
         """
@@ -190,14 +236,15 @@ class PointNavFixedTask(BaseTask):
         if self.goal_format == 'polar':
             task_obs = np.array(cartesian_to_polar(task_obs[0], task_obs[1]))
 
+        kinematic_state = env.get_kinematic_state()
         # linear velocity along the x-axis
         linear_velocity = rotate_vector_3d(
-            env.robots[0].get_linear_velocity(),
-            *env.robots[0].get_rpy())[0]
+            kinematic_state.get_linear_velocity(),
+            *kinematic_state.get_rpy())[0]
         # angular velocity along the z-axis
         angular_velocity = rotate_vector_3d(
-            env.robots[0].get_angular_velocity(),
-            *env.robots[0].get_rpy())[2]
+            kinematic_state.get_angular_velocity(),
+            *kinematic_state.get_rpy())[2]
         task_obs = np.append(
             task_obs, [linear_velocity, angular_velocity])
 
@@ -208,7 +255,8 @@ class PointNavFixedTask(BaseTask):
                           from_initial_pos=False,
                           entire_path=False):
         """
-        Get the shortest path and geodesic distance from the robot or the initial position to the target position
+        Get the shortest path and geodesic distance from the robot or the initial position to the target position,
+        read from the cached distance field of the target
 
         :param env: environment instance
         :param from_initial_pos: whether source is initial position rather than current position
@@ -218,10 +266,11 @@ class PointNavFixedTask(BaseTask):
         if from_initial_pos:
             source = self.initial_pos[:2]
         else:
-            source = env.robots[0].get_position()[:2]
-        target = self.target_pos[:2]
-        return env.scene.get_shortest_path(
-            self.floor_num, source, target, entire_path=entire_path)
+            source = env.get_kinematic_state().get_position()[:2]
+        path_world, geodesic_distance = \
+            self.get_target_distance_field(env).shortest_path(env.scene, source)
+        path_world = path_waypoints(env.scene, path_world, self.target_pos[:2], entire_path)
+        return path_world, geodesic_distance
 
     def step_visualization(self, env):
         """
@@ -255,6 +304,6 @@ class PointNavFixedTask(BaseTask):
         :param env: environment instance
         """
         self.step_visualization(env)
-        new_robot_pos = env.robots[0].get_position()[:2]
+        new_robot_pos = env.get_kinematic_state().get_position()[:2]
         self.path_length += l2_distance(self.robot_pos, new_robot_pos)
         self.robot_pos = new_robot_pos
@@ -1,10 +1,12 @@
 from agent.gibson_extension.tasks.point_nav_fixed_task import PointNavFixedTask
-from igibson.utils.utils import l2_distance
-import pybullet as p
+from agent.gibson_extension.utils.state_utils import StateSnapshot
+from agent.gibson_extension.utils.geodesic_utils import sample_cell_in_range, FloorGraphIndex, FootprintMap
+from agent.gibson_extension.utils.episode_sampler import EpisodePresampler
 import logging
 import numpy as np
 import json
 import os
+import threading
 
 
 class PointNavRandomTask(PointNavFixedTask):
@@ -17,36 +19,187 @@ class PointNavRandomTask(PointNavFixedTask):
         super(PointNavRandomTask, self).__init__(env)
         self.target_dist_min = self.config.get('target_dist_min', 1.0)
         self.target_dist_max = self.config.get('target_dist_max', 10.0)
+        # 'robot' only snapshots the robot bodies during validity tests,
+        # 'world' snapshots the entire pybullet world (needed if objects can move)
+        self.reset_state_snapshot = self.config.get('reset_state_snapshot', 'robot')
+        # candidates whose footprint does not fit in the traversability map are rejected
+        # without a physics check; None disables the prefilter
+        self.reset_footprint_radius = self.config.get('reset_footprint_radius', None)
+        self.footprint_map = {}
+        # sample the next episode in a background thread from the floor maps only, so that
+        # reset_agent skips the search; the presampled poses still get one physics validity check
+        self.episode_presampler = None
+        self.presampled_episode = None
+        self.floor_maps_lock = threading.Lock()
+        if self.config.get('presample_episodes', False) and not self.config.get('test', False):
+            self.episode_presampler = EpisodePresampler(
+                lambda rng, floor: self.sample_episode_from_map(env, floor, rng))
         self.test = self.config.get('test', False)
         if self.test:
-            scene_episode_config_name = self.config.get('scene_episode_config_name')
-            self.episode_data = json.load(open(scene_episode_config_name + '/' + env.scene.scene_id + ".json", 'r'))["episode"] if not scene_episode_config_name.endswith("json") else \
-                json.load(open(scene_episode_config_name, 'r'))["episode"]
+            self.episode_data = self.load_episode_data(env)
             self.total_episodes = len(self.episode_data)
+            self.invalid_episodes = []
+            if self.config.get('validate_episodes', False):
+                self.invalid_episodes = self.validate_episode_data(env)
+
+    def load_episode_data(self, env):
+        """
+        Load precomputed episodes (initial pose and target position) for the current scene
+
+        :param env: environment instance
+        :return: list of episode dictionaries
+        """
+        scene_episode_config_name = self.config.get('scene_episode_config_name')
+        if not scene_episode_config_name.endswith("json"):
+            scene_episode_config_name = os.path.join(
+                scene_episode_config_name, env.scene.scene_id + ".json")
+        with open(scene_episode_config_name, 'r') as f:
+            return json.load(f)["episode"]
+
+    def validate_episode_data(self, env):
+        """
+        Check once, when the episode file is loaded, that every stored initial pose
+        and target position can be occupied by the robot without collision.
+        Invalid episodes are reported but kept so that episode indices stay stable.
+
+        :param env: environment instance
+        :return: indices of the invalid episodes
+        """
+        invalid_episodes = []
+        snapshot = StateSnapshot(env.robots, self.reset_state_snapshot)
+        for episode_idx, episode in enumerate(self.episode_data):
+            valid = env.test_valid_position(
+                env.robots[0],
+                np.array(episode["initial_pos"]),
+                np.array(episode["initial_orn"])) and \
+                env.test_valid_position(
+                    env.robots[0], np.array(episode["target_pos"]))
+            snapshot.restore()
+            if not valid:
+                invalid_episodes.append(episode_idx)
+        snapshot.remove()
+
+        if len(invalid_episodes) > 0:
+            logging.warning("{} of {} episodes in scene {} collide at their initial or target pose: {}".format(
+                len(invalid_episodes), self.total_episodes, env.scene.scene_id, invalid_episodes))
+        return invalid_episodes
+
+    def close(self):
+        """
+        Stop the presampling thread, which holds the environment and its scene
+        """
+        if self.episode_presampler is not None:
+            self.episode_presampler.close()
+            self.episode_presampler = None
+        self.presampled_episode = None
+
+    def get_floor_graph_index(self, env):
+        """
+        Get the (cached) sparse traversability graph of the current floor.
+        The cache is shared with the presampling thread
+
+        :param env: environment instance
+        :return: FloorGraphIndex of the current floor
+        """
+        with self.floor_maps_lock:
+            return super(PointNavRandomTask, self).get_floor_graph_index(env)
+
+    def get_footprint_map(self, env):
+        """
+        Get the (cached) footprint map of the current floor.
+        The cache is shared with the presampling thread
+
+        :param env: environment instance
+        :return: FootprintMap of the current floor, or None if the prefilter is disabled
+        """
+        if self.reset_footprint_radius is None:
+            return None
+        with self.floor_maps_lock:
+            if self.floor_num not in self.footprint_map:
+                self.footprint_map[self.floor_num] = FootprintMap(
+                    env.scene, self.floor_num, self.reset_footprint_radius)
+            return self.footprint_map[self.floor_num]
+
+    def get_floor_maps(self, env, floor):
+        """
+        Get the (cached) graph index and footprint map of a floor, safe to call from the presampling thread.
+        Without reset_footprint_radius, the footprint map is the traversability map itself
+
+        :param env: environment instance
+        :param floor: floor number
+        :return: FloorGraphIndex and FootprintMap of the floor
+        """
+        with self.floor_maps_lock:
+            if floor not in self.floor_graph_index:
+                self.floor_graph_index[floor] = FloorGraphIndex(env.scene, floor)
+            if floor not in self.footprint_map:
+                self.footprint_map[floor] = FootprintMap(env.scene, floor, self.reset_footprint_radius or 0.0)
+            return self.floor_graph_index[floor], self.footprint_map[floor]
+
+    def sample_episode_from_map(self, env, floor, rng):
+        """
+        Sample initial pose and target position on a floor from the floor maps only (no pybullet),
+        as sample_initial_pose_and_target_pos with the footprint map as the validity check.
+        Runs in the presampling thread.
+
+        :param env: environment instance
+        :param floor: floor number
+        :param rng: np.random.RandomState
+        :return: floor, initial pose and target position, or None if sampling failed
+        """
+        graph_index, footprint_map = self.get_floor_maps(env, floor)
+        if footprint_map.cells.shape[0] == 0:
+            return None
+        max_trials = 100
+        for _ in range(max_trials):
+            initial_map = footprint_map.cells[rng.randint(0, footprint_map.cells.shape[0])]
+            field = graph_index.distance_field(initial_map)
+            field[~footprint_map.fits] = np.inf
+            target_map = sample_cell_in_range(
+                field, self.target_dist_min, self.target_dist_max, rng)
+            if target_map is not None:
+                floor_height = env.scene.floor_heights[floor]
+                initial_pos = np.append(env.scene.map_to_world(initial_map), floor_height)
+                target_pos = np.append(env.scene.map_to_world(target_map), floor_height)
+                initial_orn = np.array([0, 0, rng.uniform(0, np.pi * 2)])
+                return floor, initial_pos, initial_orn, target_pos
+        return None
 
     def sample_initial_pose_and_target_pos(self, env):
         """
-        Sample robot initial pose and target position
+        Sample robot initial pose and target position.
+        A single search from the initial position gives the geodesic distance to every
+        reachable cell, so the target is drawn directly from the cells whose distance
+        is within [target_dist_min, target_dist_max].
+        With reset_footprint_radius, initial positions where the footprint does not fit
+        are rejected before the search and the target is drawn only from cells where it fits.
 
         :param env: environment instance
         :return: initial pose and target position
         """
-        _, initial_pos = env.scene.get_random_point(floor=self.floor_num)
+        graph_index = self.get_floor_graph_index(env)
+        footprint_map = self.get_footprint_map(env)
         max_trials = 100
-        dist = 0.0
+        target_map = None
         for _ in range(max_trials):
-            _, target_pos = env.scene.get_random_point(floor=self.floor_num)
-            if env.scene.build_graph:
-                _, dist = env.scene.get_shortest_path(
-                    self.floor_num,
-                    initial_pos[:2],
-                    target_pos[:2], entire_path=False)
-            else:
-                dist = l2_distance(initial_pos, target_pos)
-            if self.target_dist_min < dist < self.target_dist_max:
+            _, initial_pos = env.scene.get_random_point(floor=self.floor_num)
+            initial_map = env.scene.world_to_map(initial_pos[:2])
+            if footprint_map is not None and not footprint_map.contains(initial_map)[0]:
+                continue
+            field = graph_index.distance_field(initial_map)
+            if footprint_map is not None:
+                field[~footprint_map.fits] = np.inf
+            target_map = sample_cell_in_range(
+                field, self.target_dist_min, self.target_dist_max)
+            if target_map is not None:
                 break
-        if not (self.target_dist_min < dist < self.target_dist_max):
+        if target_map is None:
             print("WARNING: Failed to sample initial and target positions")
+            _, target_pos = env.scene.get_random_point(floor=self.floor_num)
+        else:
+            target_pos = np.append(
+                env.scene.map_to_world(target_map),
+                env.scene.floor_heights[self.floor_num])
         initial_orn = np.array([0, 0, np.random.uniform(0, np.pi * 2)])
         return initial_pos, initial_orn, target_pos
 
@@ -56,30 +209,45 @@ class PointNavRandomTask(PointNavFixedTask):
 
         :param env: environment instance
         """
-        self.floor_num = env.scene.get_random_floor()
+        self.presampled_episode = None
+        if self.episode_presampler is not None:
+            self.presampled_episode = self.episode_presampler.get()
+        if self.presampled_episode is not None:
+            self.floor_num = self.presampled_episode[0]
+        else:
+            self.floor_num = env.scene.get_random_floor()
         super(PointNavRandomTask, self).reset_scene(env)
 
     def reset_agent(self, env):
         """
         Reset robot initial pose.
         Sample initial pose and target position, check validity, and land it.
+        In test mode the precomputed episode is landed directly. With presample_episodes,
+        the episode sampled in the background during the previous episode is the first
+        candidate: the footprint map only prefilters, so it still gets the physics check.
 
         :param env: environment instance
         """
+        if self.test:
+            self.reset_agent_from_episode_data(env)
+            return
+
         reset_success = False
         max_trials = 100
 
-        # cache pybullet state
-        # TODO: p.saveState takes a few seconds, need to speed up
-        state_id = p.saveState()
+        # cache pybullet state (robot-scoped unless reset_state_snapshot is 'world')
+        snapshot = StateSnapshot(env.robots, self.reset_state_snapshot)
         for i in range(max_trials):
-            initial_pos, initial_orn, target_pos = \
-                self.sample_initial_pose_and_target_pos(env)
+            if i == 0 and self.presampled_episode is not None:
+                _, initial_pos, initial_orn, target_pos = self.presampled_episode
+            else:
+                initial_pos, initial_orn, target_pos = \
+                    self.sample_initial_pose_and_target_pos(env)
             reset_success = env.test_valid_position(
                 env.robots[0], initial_pos, initial_orn) and \
                 env.test_valid_position(
                     env.robots[0], target_pos)
-            p.restoreState(state_id)
+            snapshot.restore()
             if reset_success:
                 break
 
@@ -87,17 +255,29 @@ class PointNavRandomTask(PointNavFixedTask):
             logging.warning("WARNING: Failed to reset robot without collision")
 
         # removed cached state to prevent memory leak
-        p.removeState(state_id)
+        snapshot.remove()
+        self.presampled_episode = None
 
-        if not self.test:
-            self.target_pos = target_pos
-            self.initial_pos = initial_pos
-            self.initial_orn = initial_orn
-        else:
-            # 根据env.current_episode读取episode_data的数据
-            episode_idx = int(env.current_episode)
-            self.target_pos = np.array(self.episode_data[episode_idx]["target_pos"])
-            self.initial_pos = np.array(self.episode_data[episode_idx]["initial_pos"])
-            self.initial_orn = np.array(self.episode_data[episode_idx]["initial_orn"])
+        self.target_pos = target_pos
+        self.initial_pos = initial_pos
+        self.initial_orn = initial_orn
+        if self.episode_presampler is not None:
+            self.episode_presampler.request(env.scene.get_random_floor())
+
+        super(PointNavRandomTask, self).reset_agent(env)
+
+    def reset_agent_from_episode_data(self, env):
+        """
+        Reset robot initial pose from the precomputed episode data.
+        The stored poses are trusted (see validate_episode_data), so no sampling
+        or collision trials are run: the reset costs a single landing.
+
+        :param env: environment instance
+        """
+        # 根据env.current_episode读取episode_data的数据
+        episode_idx = int(env.current_episode)
+        self.target_pos = np.array(self.episode_data[episode_idx]["target_pos"])
+        self.initial_pos = np.array(self.episode_data[episode_idx]["initial_pos"])
+        self.initial_orn = np.array(self.episode_data[episode_idx]["initial_orn"])
 
         super(PointNavRandomTask, self).reset_agent(env)
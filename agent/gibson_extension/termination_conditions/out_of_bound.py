@@ -0,0 +1,28 @@
+from igibson.scenes.igibson_indoor_scene import InteractiveIndoorScene
+from igibson.termination_conditions.out_of_bound import OutOfBound as BaseOutOfBound
+
+
+class OutOfBound(BaseOutOfBound):
+    """
+    OutOfBound used for navigation tasks in InteractiveIndoorScene
+    Episode terminates if the robot goes outside the valid region.
+    Reads the robot position from the env's per-step kinematic state
+    """
+
+    def get_termination(self, task, env):
+        """
+        Return whether the episode should terminate.
+        Terminate if the robot goes outside the valid region
+
+        :param task: task instance
+        :param env: environment instance
+        :return: done, info
+        """
+        done = False
+        # fall off the cliff of valid region
+        if isinstance(env.scene, InteractiveIndoorScene):
+            robot_z = env.get_kinematic_state().get_position()[2]
+            if robot_z < (env.scene.get_floor_height() - self.fall_off_thresh):
+                done = True
+        success = False
+        return done, success
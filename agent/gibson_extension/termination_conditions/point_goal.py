@@ -0,0 +1,23 @@
+from igibson.termination_conditions.point_goal import PointGoal as BasePointGoal
+from igibson.utils.utils import l2_distance
+
+
+class PointGoal(BasePointGoal):
+    """
+    PointGoal used for PointNavFixed/RandomTask
+    Episode terminates if point goal is reached.
+    Reads the robot position from the env's per-step kinematic state
+    """
+
+    def get_termination(self, task, env):
+        """
+        Return whether the episode should terminate.
+        Terminate if point goal is reached (distance below threshold)
+
+        :param task: task instance
+        :param env: environment instance
+        :return: done, info
+        """
+        done = l2_distance(env.get_kinematic_state().get_position()[:2], task.target_pos[:2]) < self.dist_tol
+        success = done
+        return done, success
@@ -0,0 +1,70 @@
+import queue
+import threading
+
+import numpy as np
+
+
+class EpisodePresampler(object):
+    """
+    Samples the next episode in a background thread while the current one runs, so that
+    a reset only has to land the robot. The sampling function must not touch pybullet:
+    it runs next to the simulation and may only read the scene's maps.
+    Each request draws its seed from np.random on the calling thread, so runs seeded
+    with np.random.seed stay reproducible.
+    """
+
+    def __init__(self, sample_fn):
+        """
+        :param sample_fn: function of a np.random.RandomState and the request arguments,
+            returning an episode, or None on failure
+        """
+        self.sample_fn = sample_fn
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.pending = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            seed, args = request
+            try:
+                result = self.sample_fn(np.random.RandomState(seed), *args)
+            except Exception as e:
+                result = e
+            self.results.put(result)
+
+    def request(self, *args):
+        """
+        Start sampling the next episode in the background
+
+        :param args: arguments passed on to sample_fn
+        """
+        assert not self.pending, 'the previous episode has not been collected'
+        self.requests.put((np.random.randint(2 ** 31 - 1), args))
+        self.pending = True
+
+    def get(self):
+        """
+        Collect the requested episode, waiting for it if it is not ready yet
+
+        :return: the sampled episode, or None if nothing was requested or sampling failed
+        """
+        if not self.pending:
+            return None
+        self.pending = False
+        result = self.results.get()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self):
+        """
+        Stop the background thread, waiting for the episode being sampled if any
+        """
+        self.requests.put(None)
+        self.thread.join()
+        self.pending = False
@@ -0,0 +1,320 @@
+from collections import OrderedDict
+import logging
+import cv2
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+
+def graph_to_arrays(graph):
+    """
+    Flatten a traversability graph into arrays
+
+    :param graph: networkx graph whose nodes are (row, col) map cells
+    :return: (n, 2) int32 nodes, (m, 2) int32 edges as node indices and (m,) float64 edge weights
+    """
+    nodes = np.array(list(graph.nodes), dtype=np.int32).reshape(-1, 2)
+    node_idx = {node: i for i, node in enumerate(graph.nodes)}
+    edges = np.empty((graph.number_of_edges(), 2), dtype=np.int32)
+    weights = np.empty(graph.number_of_edges(), dtype=np.float64)
+    for i, (a, b, w) in enumerate(graph.edges(data='weight', default=1.0)):
+        edges[i] = node_idx[a], node_idx[b]
+        weights[i] = w
+    return nodes, edges, weights
+
+
+class FloorGraphIndex(object):
+    """
+    Sparse (CSR) view of a scene's traversability graph for one floor.
+    Built once per floor so that single-source searches run in scipy instead of networkx.
+    """
+
+    def __init__(self, scene, floor):
+        """
+        :param scene: iGibson indoor scene
+        :param floor: floor number
+        """
+        self.map_size = scene.floor_map[floor].shape
+        self.resolution = scene.trav_map_resolution
+        self.has_graph = bool(getattr(scene, 'build_graph', False))
+        if self.has_graph:
+            # arrays of the graph are provided by TravMapCache, no need to walk the networkx graph
+            graph_arrays = getattr(scene, 'floor_graph_arrays', None)
+            if graph_arrays is not None:
+                nodes, edges, weights = graph_arrays[floor]
+            else:
+                nodes, edges, weights = graph_to_arrays(scene.floor_graph[floor])
+            self.nodes = np.asarray(nodes, dtype=np.int64)
+            num_nodes = self.nodes.shape[0]
+            self.csgraph = csr_matrix(
+                (np.asarray(weights, dtype=np.float64),
+                 (np.asarray(edges[:, 0], dtype=np.int64), np.asarray(edges[:, 1], dtype=np.int64))),
+                shape=(num_nodes, num_nodes))
+        else:
+            # without a graph, geodesic distance falls back to L2 distance over free space
+            self.free_cells = np.stack(np.where(scene.floor_map[floor] == 255), axis=1)
+
+    def nearest_node(self, source_map):
+        """
+        Snap a map cell to the closest graph node
+
+        :param source_map: cell in map coordinates
+        :return: node index and distance to it (in cells)
+        """
+        dist = np.linalg.norm(self.nodes - np.asarray(source_map), axis=1)
+        idx = int(np.argmin(dist))
+        return idx, dist[idx]
+
+    def distance_field(self, source_map):
+        """
+        Compute the distance from one source cell to every cell of the floor map
+
+        :param source_map: source cell in map coordinates
+        :return: dense array of distances in meters, inf where unreachable
+        """
+        field = np.full(self.map_size, np.inf, dtype=np.float32)
+        if self.has_graph:
+            idx, offset = self.nearest_node(source_map)
+            dist = dijkstra(self.csgraph, directed=False, indices=idx)
+            field[self.nodes[:, 0], self.nodes[:, 1]] = dist + offset
+        else:
+            field[self.free_cells[:, 0], self.free_cells[:, 1]] = np.linalg.norm(
+                self.free_cells - np.asarray(source_map), axis=1)
+        field *= self.resolution
+        return field
+
+
+def sample_cell_in_range(field, dist_min, dist_max, rng=np.random):
+    """
+    Uniformly sample a cell whose distance lies in (dist_min, dist_max)
+
+    :param field: distance field in meters
+    :param dist_min: minimum distance (exclusive)
+    :param dist_max: maximum distance (exclusive)
+    :param rng: random number generator (np.random or a RandomState)
+    :return: sampled cell in map coordinates, or None if no cell is in range
+    """
+    candidates = np.flatnonzero((field > dist_min) & (field < dist_max))
+    if candidates.shape[0] == 0:
+        return None
+    idx = candidates[rng.randint(0, candidates.shape[0])]
+    return np.array(np.unravel_index(idx, field.shape))
+
+
+class FootprintMap(object):
+    """
+    Cells of a floor map where a robot footprint disk fits in traversable space.
+    Used to reject reset candidates with a lookup before the physics validity check.
+    The floor map is already eroded by trav_map_erosion, so only the remaining radius
+    is eroded here, rounded up to whole cells: every cell within the footprint radius
+    of non-traversable space is rejected.
+    """
+
+    def __init__(self, scene, floor, footprint_radius):
+        """
+        :param scene: iGibson indoor scene
+        :param floor: floor number
+        :param footprint_radius: robot footprint radius in meters
+        """
+        fits = (scene.floor_map[floor] == 255).astype(np.uint8)
+        # cv2.erode with a k x k kernel removes at most k // 2 cells on each side
+        radius = int(np.ceil(footprint_radius / scene.trav_map_resolution - 1e-6)) - \
+            int(getattr(scene, 'trav_map_erosion', 0)) // 2
+        logging.info('Footprint map of floor {}: {} m footprint, {} cells eroded on top of trav_map_erosion'.format(
+            floor, footprint_radius, max(radius, 0)))
+        if radius > 0:
+            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * radius + 1, 2 * radius + 1))
+            fits = cv2.erode(fits, kernel, borderType=cv2.BORDER_CONSTANT, borderValue=0)
+        self.fits = fits.astype(bool)
+        self.cells = np.argwhere(self.fits)
+
+    def contains(self, cells):
+        """
+        Check whether the footprint fits at the given cells
+
+        :param cells: (n, 2) or (2,) cells in map coordinates
+        :return: (n,) boolean array, False outside the map
+        """
+        cells = np.asarray(cells, dtype=np.int64).reshape(-1, 2)
+        rows, cols = self.fits.shape
+        inside = (cells[:, 0] >= 0) & (cells[:, 0] < rows) & (cells[:, 1] >= 0) & (cells[:, 1] < cols)
+        result = np.zeros(cells.shape[0], dtype=bool)
+        result[inside] = self.fits[cells[inside, 0], cells[inside, 1]]
+        return result
+
+
+class GeodesicDistanceField(object):
+    """
+    Distance field from a fixed target position over the floor traversability map.
+    Computed once per target; distances and shortest paths from any position are then
+    read from the field instead of running a graph search.
+    """
+
+    def __init__(self, scene, graph_index, target_pos):
+        """
+        :param scene: iGibson indoor scene
+        :param graph_index: FloorGraphIndex of the target's floor
+        :param target_pos: target position in world coordinates
+        """
+        self.resolution = graph_index.resolution
+        self.trav_map_size = scene.trav_map_size
+        self.has_graph = graph_index.has_graph
+        self.target_pos = np.array(target_pos[:2], dtype=np.float64)
+        self.target_map = scene.world_to_map(self.target_pos)
+        self.field = graph_index.distance_field(self.target_map)
+        self.finite_cells = None
+
+    def world_to_map_continuous(self, pos):
+        """
+        Same transform as scene.world_to_map, without rounding to a cell
+
+        :param pos: 2D position in world coordinates
+        :return: continuous (row, col) map coordinates
+        """
+        return np.flip(np.asarray(pos[:2], dtype=np.float64) / self.resolution + self.trav_map_size / 2.0)
+
+    def nearest_finite(self, pos_map):
+        """
+        Distance from a position that lies outside the traversable area:
+        snap to the closest reachable cell and add the offset to it
+
+        :param pos_map: continuous map coordinates
+        :return: geodesic distance in meters
+        """
+        if self.finite_cells is None:
+            self.finite_cells = np.argwhere(np.isfinite(self.field))
+        if self.finite_cells.shape[0] == 0:
+            return np.inf
+        dist = np.linalg.norm(self.finite_cells - pos_map, axis=1)
+        idx = int(np.argmin(dist))
+        cell = self.finite_cells[idx]
+        return float(self.field[cell[0], cell[1]]) + dist[idx] * self.resolution
+
+    def distance(self, pos):
+        """
+        Geodesic distance from a continuous position to the target, using bilinear
+        interpolation over the neighbouring reachable cells
+
+        :param pos: position in world coordinates
+        :return: geodesic distance in meters
+        """
+        if not self.has_graph:
+            # same as scene.get_shortest_path without a graph
+            return float(np.linalg.norm(np.asarray(pos[:2]) - self.target_pos))
+
+        pos_map = self.world_to_map_continuous(pos)
+        base = np.floor(pos_map).astype(np.int64)
+        frac = pos_map - base
+        value = 0.0
+        weight = 0.0
+        for dr, dc in ((0, 0), (0, 1), (1, 0), (1, 1)):
+            r, c = base[0] + dr, base[1] + dc
+            if not (0 <= r < self.field.shape[0] and 0 <= c < self.field.shape[1]):
+                continue
+            d = self.field[r, c]
+            if not np.isfinite(d):
+                continue
+            w = (frac[0] if dr else 1.0 - frac[0]) * (frac[1] if dc else 1.0 - frac[1])
+            value += w * d
+            weight += w
+        if weight <= 1e-6:
+            return self.nearest_finite(pos_map)
+        return float(value / weight)
+
+    def shortest_path(self, scene, pos):
+        """
+        Extract the shortest path from a position to the target by steepest descent
+        on the distance field
+
+        :param scene: iGibson indoor scene
+        :param pos: source position in world coordinates
+        :return: shortest path in world coordinates and geodesic distance
+        """
+        geodesic_distance = self.distance(pos)
+        if not self.has_graph:
+            return np.array([pos[:2], self.target_pos]), geodesic_distance
+
+        cell = np.array(scene.world_to_map(pos[:2]))
+        if not (0 <= cell[0] < self.field.shape[0] and 0 <= cell[1] < self.field.shape[1]) or \
+                not np.isfinite(self.field[cell[0], cell[1]]):
+            if self.finite_cells is None:
+                self.finite_cells = np.argwhere(np.isfinite(self.field))
+            if self.finite_cells.shape[0] == 0:
+                return np.array([pos[:2], self.target_pos]), geodesic_distance
+            cell = self.finite_cells[np.argmin(np.linalg.norm(self.finite_cells - cell, axis=1))]
+
+        path_map = [cell]
+        neighbours = np.array([(-1, -1), (-1, 0), (-1, 1), (0, -1),
+                               (0, 1), (1, -1), (1, 0), (1, 1)])
+        rows, cols = self.field.shape
+        while True:
+            candidates = cell + neighbours
+            candidates = candidates[(candidates[:, 0] >= 0) & (candidates[:, 0] < rows) &
+                                    (candidates[:, 1] >= 0) & (candidates[:, 1] < cols)]
+            values = self.field[candidates[:, 0], candidates[:, 1]]
+            best = int(np.argmin(values))
+            if values[best] >= self.field[cell[0], cell[1]]:
+                break
+            cell = candidates[best]
+            path_map.append(cell)
+
+        path_world = scene.map_to_world(np.array(path_map))
+        return path_world, geodesic_distance
+
+
+def path_waypoints(scene, path_world, target_world, entire_path=False):
+    """
+    Subsample a shortest path into waypoints, as IndoorScene.get_shortest_path does: every
+    waypoint_interval-th point, and unless entire_path, exactly num_waypoints of them, padded
+    with the target
+
+    :param scene: iGibson indoor scene
+    :param path_world: shortest path in world coordinates
+    :param target_world: 2D target position in world coordinates
+    :param entire_path: whether to return the entire subsampled path
+    :return: waypoints in world coordinates
+    """
+    path_world = path_world[::scene.waypoint_interval]
+    if not entire_path:
+        path_world = path_world[:scene.num_waypoints]
+        num_remaining_waypoints = scene.num_waypoints - path_world.shape[0]
+        if num_remaining_waypoints > 0:
+            remaining_waypoints = np.tile(target_world, (num_remaining_waypoints, 1))
+            path_world = np.concatenate((path_world, remaining_waypoints), axis=0)
+    return path_world
+
+
+class DistanceFieldCache(object):
+    """
+    LRU cache of GeodesicDistanceField keyed by (scene id, floor, target position).
+    The exact position is part of the key: a field also answers distances with the L2
+    fallback and ends shortest paths at its own target position
+    """
+
+    def __init__(self, max_size=16):
+        """
+        :param max_size: maximum number of cached distance fields
+        """
+        self.max_size = max_size
+        self.fields = OrderedDict()
+
+    def get(self, scene, floor, graph_index, target_pos):
+        """
+        Get the distance field of the given target, computing it on a cache miss
+
+        :param scene: iGibson indoor scene
+        :param floor: floor number
+        :param graph_index: FloorGraphIndex of the floor
+        :param target_pos: target position in world coordinates
+        :return: GeodesicDistanceField
+        """
+        key = (scene.scene_id, floor, tuple(float(x) for x in target_pos[:2]))
+        if key in self.fields:
+            self.fields.move_to_end(key)
+            return self.fields[key]
+
+        field = GeodesicDistanceField(scene, graph_index, target_pos)
+        self.fields[key] = field
+        if len(self.fields) > self.max_size:
+            self.fields.popitem(last=False)
+        return field
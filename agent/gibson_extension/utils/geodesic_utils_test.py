@@ -0,0 +1,171 @@
+import unittest
+
+import networkx as nx
+import numpy as np
+
+from agent.gibson_extension.utils.geodesic_utils import (
+    DistanceFieldCache, FloorGraphIndex, FootprintMap, GeodesicDistanceField, path_waypoints)
+
+
+class FakeScene(object):
+    """
+    Floor map of a 4 m x 4 m room split by a wall at column 20, as loaded by iGibson
+    (already eroded by trav_map_erosion)
+    """
+
+    def __init__(self):
+        floor_map = np.full((40, 40), 255, dtype=np.uint8)
+        floor_map[[0, -1], :] = 0
+        floor_map[:, [0, -1]] = 0
+        floor_map[:, 20] = 0
+        self.floor_map = [floor_map]
+        self.trav_map_resolution = 0.1
+        self.trav_map_erosion = 2
+
+
+class FakeGraphScene(FakeScene):
+    """
+    FakeScene with the map transforms and traversability graph of IndoorScene: the wall
+    at column 20 has a door at rows 30 to 35
+    """
+
+    def __init__(self, build_graph=True):
+        super(FakeGraphScene, self).__init__()
+        self.floor_map[0][30:36, 20] = 255
+        self.scene_id = 'fake'
+        self.trav_map_size = 40
+        # IndoorScene defaults: waypoint_resolution 0.2
+        self.num_waypoints = 10
+        self.waypoint_interval = 2
+        self.build_graph = build_graph
+        if build_graph:
+            self.floor_graph = [self.build_trav_graph(self.floor_map[0])]
+
+    @staticmethod
+    def build_trav_graph(trav_map):
+        # as IndoorScene.build_trav_graph: 8-connected free cells, L2 edge weights
+        graph = nx.Graph()
+        rows, cols = trav_map.shape
+        for i in range(rows):
+            for j in range(cols):
+                if trav_map[i, j] == 0:
+                    continue
+                graph.add_node((i, j))
+                for n in ((i - 1, j - 1), (i, j - 1), (i + 1, j - 1), (i - 1, j)):
+                    if 0 <= n[0] < rows and 0 <= n[1] < cols and trav_map[n] > 0:
+                        graph.add_edge(n, (i, j), weight=np.linalg.norm(np.subtract(n, (i, j))))
+        return graph
+
+    def world_to_map(self, xy):
+        return np.flip((np.asarray(xy) / self.trav_map_resolution + self.trav_map_size / 2.0)).astype(int)
+
+    def map_to_world(self, xy):
+        axis = 0 if len(xy.shape) == 1 else 1
+        return np.flip((xy - self.trav_map_size / 2.0) * self.trav_map_resolution, axis=axis)
+
+
+class GeodesicDistanceFieldTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scene = FakeGraphScene()
+        self.graph_index = FloorGraphIndex(self.scene, 0)
+
+    def world(self, row, col):
+        return self.scene.map_to_world(np.array([row, col], dtype=np.float64))
+
+    def test_distances_match_graph_search(self):
+        target = self.world(10, 5)
+        field = GeodesicDistanceField(self.scene, self.graph_index, target)
+        # straight line in the same room
+        self.assertAlmostEqual(field.distance(self.world(10, 15)), 1.0, places=5)
+        # through the door
+        source = self.world(10, 30)
+        expected = nx.dijkstra_path_length(
+            self.scene.floor_graph[0], (10, 30), (10, 5)) * self.scene.trav_map_resolution
+        self.assertAlmostEqual(field.distance(source), expected, places=4)
+        self.assertGreater(field.distance(source), np.linalg.norm(source - target) + 1.0)
+
+    def test_shortest_path_descends_to_target(self):
+        target = self.world(10, 5)
+        field = GeodesicDistanceField(self.scene, self.graph_index, target)
+        path, distance = field.shortest_path(self.scene, self.world(10, 30))
+        cells = [tuple(self.scene.world_to_map(point)) for point in path]
+        self.assertEqual(cells[-1], (10, 5))
+        self.assertTrue(all(30 <= row < 36 for row, col in cells if col == 20))
+        values = [field.field[cell] for cell in cells]
+        self.assertTrue(np.all(np.diff(values) < 0))
+        path_length = np.sum(np.linalg.norm(np.diff(path, axis=0), axis=1))
+        self.assertAlmostEqual(path_length, distance, places=4)
+
+    def test_waypoints(self):
+        target = self.world(10, 5)
+        field = GeodesicDistanceField(self.scene, self.graph_index, target)
+        interval, num_waypoints = self.scene.waypoint_interval, self.scene.num_waypoints
+        # through the door: truncated to num_waypoints
+        path, _ = field.shortest_path(self.scene, self.world(10, 30))
+        waypoints = path_waypoints(self.scene, path, target)
+        self.assertEqual(waypoints.shape, (num_waypoints, 2))
+        np.testing.assert_array_equal(waypoints, path[::interval][:num_waypoints])
+        np.testing.assert_array_equal(
+            path_waypoints(self.scene, path, target, entire_path=True), path[::interval])
+        # next to the target: padded with the target
+        path, _ = field.shortest_path(self.scene, self.world(10, 8))
+        waypoints = path_waypoints(self.scene, path, target)
+        self.assertEqual(waypoints.shape, (num_waypoints, 2))
+        np.testing.assert_array_equal(waypoints[:2], path[::interval])
+        np.testing.assert_array_equal(waypoints[2:], np.tile(target, (num_waypoints - 2, 1)))
+
+    def test_without_graph_is_l2(self):
+        scene = FakeGraphScene(build_graph=False)
+        field = GeodesicDistanceField(scene, FloorGraphIndex(scene, 0), self.world(10, 5))
+        source = self.world(10, 30)
+        self.assertAlmostEqual(field.distance(source), 2.5)
+
+
+class DistanceFieldCacheTest(unittest.TestCase):
+
+    def test_targets_in_the_same_cell_are_distinct(self):
+        scene = FakeGraphScene(build_graph=False)
+        graph_index = FloorGraphIndex(scene, 0)
+        cache = DistanceFieldCache(max_size=2)
+        source = np.array([0.0, -1.0])
+        first = cache.get(scene, 0, graph_index, np.array([0.51, 0.51, 0.0]))
+        second = cache.get(scene, 0, graph_index, np.array([0.59, 0.59, 0.0]))
+        self.assertEqual(tuple(scene.world_to_map(first.target_pos)), tuple(scene.world_to_map(second.target_pos)))
+        self.assertAlmostEqual(second.distance(source), np.linalg.norm([0.59, 1.59]))
+        self.assertIs(cache.get(scene, 0, graph_index, np.array([0.51, 0.51, 0.0])), first)
+        cache.get(scene, 0, graph_index, np.array([1.5, 1.5, 0.0]))
+        self.assertEqual(len(cache.fields), 2)
+
+
+class FootprintMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scene = FakeScene()
+
+    def test_rejects_cells_within_footprint_of_obstacles(self):
+        footprint_map = FootprintMap(self.scene, 0, 0.32)
+        # the map is eroded by 1 cell already, ceil(0.32 / 0.1) - 1 cells remain
+        for col in (17, 18, 19, 21, 22, 23):
+            self.assertFalse(footprint_map.contains([10, col])[0], col)
+        self.assertTrue(footprint_map.contains([10, 16])[0])
+        self.assertTrue(footprint_map.contains([10, 24])[0])
+
+        radius = 3
+        obstacles = np.argwhere(self.scene.floor_map[0] == 0)
+        for cell in footprint_map.cells:
+            self.assertGreater(np.linalg.norm(obstacles - cell, axis=1).min(), radius)
+
+    def test_rounds_partial_cells_up(self):
+        footprint_map = FootprintMap(self.scene, 0, 0.15)
+        self.assertFalse(footprint_map.contains([10, 19])[0])
+        self.assertTrue(footprint_map.contains([10, 18])[0])
+
+    def test_contains_outside_map(self):
+        footprint_map = FootprintMap(self.scene, 0, 0.0)
+        np.testing.assert_array_equal(
+            footprint_map.contains([[-1, 5], [5, 40], [5, 5], [5, 20]]), [False, False, True, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
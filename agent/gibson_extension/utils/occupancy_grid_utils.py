@@ -0,0 +1,259 @@
+import cv2
+import numpy as np
+
+from igibson.utils.constants import OccupancyGridState
+
+OBSTACLES = int(OccupancyGridState.OBSTACLES * 2.0)
+UNKNOWN = int(OccupancyGridState.UNKNOWN * 2.0)
+FREESPACE = int(OccupancyGridState.FREESPACE * 2.0)
+
+# observations sent instead of the grid when it is rasterized on the learner
+# (occupancy_grid_mode: learner): scan hit fractions, target in the base frame
+# and the planar laser to base transform [R | t]
+RAW_SCAN_KEYS = ('occupancy_scan', 'occupancy_target', 'occupancy_extrinsic')
+
+
+def disk_stencil(radius):
+    """
+    Pixel offsets covered by a filled cv2.circle of the given radius.
+    Drawn once with cv2 so that stamping the stencil is pixel-identical to cv2.circle.
+
+    :param radius: circle radius in pixels
+    :return: (k, 2) array of (x, y) offsets
+    """
+    size = 2 * radius + 1
+    canvas = np.zeros((size, size), dtype=np.uint8)
+    cv2.circle(img=canvas, center=(radius, radius), radius=radius, color=1, thickness=-1)
+    ys, xs = np.nonzero(canvas)
+    return np.stack([xs - radius, ys - radius], axis=1).astype(np.int32)
+
+
+def stamp_stencil(grid, centers, stencil, value):
+    """
+    Stamp a stencil at many centers with one scatter, clipping at the grid border
+
+    :param grid: 2D grid, modified in place
+    :param centers: (n, 2) integer (x, y) centers
+    :param stencil: (k, 2) integer (x, y) offsets
+    :param value: value to write
+    """
+    pixels = (centers[:, None, :] + stencil[None, :, :]).reshape(-1, 2)
+    height, width = grid.shape[:2]
+    valid = (pixels[:, 0] >= 0) & (pixels[:, 0] < width) & (pixels[:, 1] >= 0) & (pixels[:, 1] < height)
+    pixels = pixels[valid]
+    grid[pixels[:, 1], pixels[:, 0]] = value
+
+
+def static_overlay(grid_resolution, robot_footprint_radius_in_map, heading_end_point):
+    """
+    Robot footprint and heading arrow, which do not depend on the scan
+
+    :param grid_resolution: grid size in cells
+    :param robot_footprint_radius_in_map: robot footprint radius in cells
+    :param heading_end_point: (x, y) end point of the heading arrow
+    :return: mask of the drawn pixels and their values
+    """
+    # 255 marks untouched pixels
+    overlay = np.full((grid_resolution, grid_resolution), 255, dtype=np.uint8)
+    center = (grid_resolution // 2, grid_resolution // 2)
+    cv2.circle(
+        img=overlay,
+        center=center,
+        radius=int(robot_footprint_radius_in_map),
+        color=OBSTACLES,
+        thickness=-1,
+    )
+    cv2.arrowedLine(overlay, center, heading_end_point, color=UNKNOWN, thickness=2)
+    overlay_mask = overlay != 255
+    return overlay_mask, overlay[overlay_mask]
+
+
+class LocalOccupancyGrid(object):
+    """
+    Rasterizer of the ego-centric occupancy grid built from a 1D scan.
+    Values are OccupancyGridState * 2 (0: obstacles, 1: unknown, 2: free space) stored as uint8;
+    consumers divide by 2.0 to get the normalized grid.
+    """
+
+    def __init__(self, grid_resolution, occupancy_range, robot_footprint_radius_in_map, heading_end_point,
+                 point_radius=2):
+        """
+        :param grid_resolution: grid size in cells
+        :param occupancy_range: side length of the grid in meters
+        :param robot_footprint_radius_in_map: robot footprint radius in cells
+        :param heading_end_point: (x, y) end point of the heading arrow
+        :param point_radius: radius of the scan and target points in cells
+        """
+        self.grid_resolution = grid_resolution
+        self.occupancy_range = occupancy_range
+        self.point_stencil = disk_stencil(point_radius)
+        self.buffer = np.full((grid_resolution, grid_resolution), UNKNOWN, dtype=np.uint8)
+
+        # robot footprint and heading arrow do not depend on the scan: draw them once
+        # and copy them over each grid
+        self.overlay_mask, self.overlay_values = static_overlay(
+            grid_resolution, robot_footprint_radius_in_map, heading_end_point)
+
+    def to_map(self, points_local):
+        """
+        Base-frame points (x forward, y left) to grid coordinates, y axis flipped
+
+        :param points_local: (n, 2) points in meters
+        :return: (n, 2) float grid coordinates
+        """
+        points_in_map = points_local / self.occupancy_range * self.grid_resolution
+        points_in_map[:, 1] *= -1
+        return points_in_map + (self.grid_resolution / 2)
+
+    def rasterize_scan(self, scan_local):
+        """
+        Rasterize the scan only: scan points and the free space polygon, without the
+        robot footprint, heading arrow and target
+
+        :param scan_local: (n, 2) scan end points in the base frame
+        :return: (grid_resolution, grid_resolution) uint8 grid; this is the reused buffer,
+            valid until the next call
+        """
+        grid = self.buffer
+        grid.fill(UNKNOWN)
+
+        scan_local = np.concatenate([np.zeros((1, 2)), scan_local, np.zeros((1, 2))], axis=0)
+        scan_in_map = self.to_map(scan_local).astype(np.int32)
+        stamp_stencil(grid, scan_in_map, self.point_stencil, OBSTACLES)
+        cv2.fillPoly(img=grid, pts=scan_in_map.reshape((1, -1, 1, 2)), color=FREESPACE, lineType=1)
+        return grid
+
+    def draw_overlay(self, target_local):
+        """
+        Draw the robot footprint, heading arrow and target over the last rasterize_scan grid
+
+        :param target_local: (2,) target position in the base frame
+        :return: (grid_resolution, grid_resolution, 1) uint8 occupancy grid
+        """
+        grid = self.buffer
+        grid[self.overlay_mask] = self.overlay_values
+
+        target_in_map = self.to_map(np.array(target_local[:2], dtype=np.float64).reshape(1, 2))
+        target_in_map = np.array([[int(target_in_map[0, 0]), int(target_in_map[0, 1])]], dtype=np.int32)
+        stamp_stencil(grid, target_in_map, self.point_stencil, OBSTACLES)
+
+        # copy so that the returned observation does not alias the reused buffer
+        return grid[:, :, None].copy()
+
+    def rasterize(self, scan_local, target_local):
+        """
+        Rasterize the occupancy grid
+
+        :param scan_local: (n, 2) scan end points in the base frame
+        :param target_local: (2,) target position in the base frame
+        :return: (grid_resolution, grid_resolution, 1) uint8 occupancy grid
+        """
+        self.rasterize_scan(scan_local)
+        return self.draw_overlay(target_local)
+
+
+class GlobalOccupancyMap(object):
+    """
+    Occupancy map in a fixed world-aligned frame, accumulated from local occupancy grids.
+    Each update warps the local grid into a window of the map around the robot with one
+    affine transform (nearest neighbour) and copies its observed cells (free space and
+    obstacles) over the map; unknown cells keep the previous value.
+    Same cell values and image convention as LocalOccupancyGrid (x right, y up).
+    """
+
+    def __init__(self, map_size, map_resolution, grid_resolution, occupancy_range, origin=(0.0, 0.0)):
+        """
+        :param map_size: map size in cells
+        :param map_resolution: map cell size in meters
+        :param grid_resolution: local grid size in cells
+        :param occupancy_range: side length of the local grid in meters
+        :param origin: (x, y) world position of the map center
+        """
+        self.map_size = map_size
+        self.map_resolution = map_resolution
+        self.grid_resolution = grid_resolution
+        self.grid_cell_size = occupancy_range / float(grid_resolution)
+        self.map = np.full((map_size, map_size), UNKNOWN, dtype=np.uint8)
+        # local grid pixel (col, row) to base frame (x, y), at pixel centers
+        offset = (0.5 - grid_resolution / 2.0) * self.grid_cell_size
+        self.grid_to_base = np.array([[self.grid_cell_size, 0.0, offset],
+                                      [0.0, -self.grid_cell_size, -offset],
+                                      [0.0, 0.0, 1.0]])
+        # side of the map window covered by a rotated local grid, in cells
+        self.window_size = int(np.ceil(occupancy_range * np.sqrt(2.0) / map_resolution)) + 2
+        self.set_origin(origin)
+
+    def set_origin(self, origin):
+        """
+        Set the world-to-map transform: the map is centered at origin
+
+        :param origin: (x, y) world position of the map center
+        """
+        self.origin = np.asarray(origin[:2], dtype=np.float64)
+        offset = self.map_size / 2.0 - 0.5
+        self.world_to_map = np.array([[1.0 / self.map_resolution, 0.0, offset - self.origin[0] / self.map_resolution],
+                                      [0.0, -1.0 / self.map_resolution, offset + self.origin[1] / self.map_resolution],
+                                      [0.0, 0.0, 1.0]])
+
+    def reset(self, origin=None):
+        """
+        Clear the map
+
+        :param origin: optional new (x, y) world position of the map center
+        """
+        self.map.fill(UNKNOWN)
+        if origin is not None:
+            self.set_origin(origin)
+
+    def grid_to_map(self, position, rotation):
+        """
+        Affine transform from local grid pixels to map pixels
+
+        :param position: (2,) robot xy position in the world frame
+        :param rotation: 2x2 robot yaw rotation
+        :return: 2x3 matrix
+        """
+        base_to_world = np.eye(3)
+        base_to_world[:2, :2] = rotation
+        base_to_world[:2, 2] = position
+        return self.world_to_map.dot(base_to_world).dot(self.grid_to_base)[:2]
+
+    def update(self, local_grid, position, rotation):
+        """
+        Merge a local occupancy grid into the map
+
+        :param local_grid: (grid_resolution, grid_resolution) uint8 grid, without overlays
+        :param position: (2,) robot xy position in the world frame
+        :param rotation: 2x2 robot yaw rotation
+        """
+        transform = self.grid_to_map(position, rotation)
+        center = transform.dot([self.grid_resolution / 2.0, self.grid_resolution / 2.0, 1.0])
+        col0 = int(np.floor(center[0])) - self.window_size // 2
+        row0 = int(np.floor(center[1])) - self.window_size // 2
+        transform[:, 2] -= (col0, row0)
+        window = cv2.warpAffine(local_grid, transform, (self.window_size, self.window_size),
+                                flags=cv2.INTER_NEAREST, borderMode=cv2.BORDER_CONSTANT, borderValue=UNKNOWN)
+
+        # clip the window to the map
+        map_col0, map_row0 = max(col0, 0), max(row0, 0)
+        map_col1 = min(col0 + self.window_size, self.map_size)
+        map_row1 = min(row0 + self.window_size, self.map_size)
+        if map_col0 >= map_col1 or map_row0 >= map_row1:
+            return
+        window = window[map_row0 - row0:map_row1 - row0, map_col0 - col0:map_col1 - col0]
+        observed = window != UNKNOWN
+        self.map[map_row0:map_row1, map_col0:map_col1][observed] = window[observed]
+
+    def crop(self, position, rotation):
+        """
+        Ego-centric crop of the map, aligned with the local occupancy grid
+
+        :param position: (2,) robot xy position in the world frame
+        :param rotation: 2x2 robot yaw rotation
+        :return: (grid_resolution, grid_resolution, 1) uint8 grid
+        """
+        transform = self.grid_to_map(position, rotation)
+        crop = cv2.warpAffine(self.map, transform, (self.grid_resolution, self.grid_resolution),
+                              flags=cv2.INTER_NEAREST | cv2.WARP_INVERSE_MAP,
+                              borderMode=cv2.BORDER_CONSTANT, borderValue=UNKNOWN)
+        return crop[:, :, None]
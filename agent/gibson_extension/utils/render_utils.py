@@ -0,0 +1,39 @@
+import copy
+import logging
+
+# outputs rendered by the VisionSensor
+VISION_MODALITIES = ('rgb', 'depth', 'pc', 'optical_flow', 'scene_flow', 'normal', 'seg', 'rgb_filled')
+
+
+def derive_render_config(config, render_modalities=None, render_shortest_edge=None):
+    """
+    Restrict rendering to what the consumer of the observations uses
+
+    :param config: env config dict, not modified
+    :param render_modalities: vision modalities to render; other vision outputs are dropped.
+        None keeps the configured output
+    :param render_shortest_edge: render so that the shortest image edge is at most this many pixels,
+        keeping the aspect ratio and vertical_fov. None keeps image_width and image_height
+    :return: new env config dict
+    """
+    config = copy.deepcopy(config)
+    if render_modalities is not None:
+        output = config['output']
+        config['output'] = [modality for modality in output
+                            if modality not in VISION_MODALITIES or modality in render_modalities]
+        dropped = [modality for modality in output if modality not in config['output']]
+        if len(dropped) > 0:
+            logging.info('Not rendering unused vision outputs: {}'.format(dropped))
+
+    if render_shortest_edge is not None:
+        width, height = config.get('image_width', 128), config.get('image_height', 128)
+        if render_shortest_edge < min(width, height):
+            scale = render_shortest_edge / float(min(width, height))
+            if width <= height:
+                width, height = render_shortest_edge, int(round(height * scale))
+            else:
+                width, height = int(round(width * scale)), render_shortest_edge
+            logging.info('Rendering at {}x{} instead of {}x{}'.format(
+                width, height, config.get('image_width', 128), config.get('image_height', 128)))
+            config['image_width'], config['image_height'] = width, height
+    return config
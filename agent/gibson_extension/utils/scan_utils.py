@@ -0,0 +1,89 @@
+import numpy as np
+from transforms3d.quaternions import quat2mat
+
+
+def quat_xyzw_to_mat(orn):
+    """
+    Rotation matrix of a pybullet quaternion
+
+    :param orn: quaternion in [x, y, z, w] order
+    :return: 3x3 rotation matrix
+    """
+    return quat2mat([orn[3], orn[0], orn[1], orn[2]])
+
+
+def laser_unit_vectors(n_horizontal_rays, laser_angular_range):
+    """
+    Ray directions of a 1D LiDAR in the laser frame
+
+    :param n_horizontal_rays: number of rays
+    :param laser_angular_range: angular range in degrees
+    :return: (n_horizontal_rays, 3) array of unit vectors
+    """
+    laser_angular_half_range = laser_angular_range / 2.0
+    angle = np.arange(
+        -np.radians(laser_angular_half_range),
+        np.radians(laser_angular_half_range),
+        np.radians(laser_angular_range) / n_horizontal_rays,
+    )[:n_horizontal_rays]
+    return np.stack([np.cos(angle), np.sin(angle), np.zeros_like(angle)], axis=1)
+
+
+def ray_start_end(laser_position, laser_orientation, unit_vector_laser, min_laser_dist, laser_linear_range):
+    """
+    Start and end points of all rays in the world frame, with one batched rotation
+
+    :param laser_position: laser position in the world frame
+    :param laser_orientation: laser orientation in the world frame, [x, y, z, w]
+    :param unit_vector_laser: ray directions in the laser frame
+    :param min_laser_dist: minimum laser distance
+    :param laser_linear_range: maximum laser distance
+    :return: start and end points, each of shape (n_rays, 3)
+    """
+    unit_vector_world = unit_vector_laser.dot(quat_xyzw_to_mat(laser_orientation).T)
+    laser_position = np.asarray(laser_position)
+    start_pose = laser_position + unit_vector_world * min_laser_dist
+    end_pose = laser_position + unit_vector_world * laser_linear_range
+    return start_pose, end_pose
+
+
+def laser_to_base_transform(laser_position, laser_orientation, base_position, base_orientation):
+    """
+    Planar transform from the laser frame to the robot base frame
+
+    :return: 2x3 rotation (laser to base, xy rows only) and 2D translation
+    """
+    laser_rotation = quat_xyzw_to_mat(laser_orientation)
+    base_rotation = quat_xyzw_to_mat(base_orientation)
+    rotation = base_rotation.T.dot(laser_rotation)
+    translation = base_rotation.T.dot(np.asarray(laser_position) - np.asarray(base_position))
+    return rotation[:2], translation[:2]
+
+
+def scan_to_base_points(scan, unit_vector_base, translation_base, min_laser_dist, laser_linear_range):
+    """
+    Scan end points in the robot base frame
+
+    :param scan: hit fractions, shape (n_rays,) or (n_rays, 1)
+    :param unit_vector_base: ray directions rotated into the base frame, (n_rays, 2)
+    :param translation_base: laser origin in the base frame, (2,)
+    :param min_laser_dist: minimum laser distance
+    :param laser_linear_range: maximum laser distance
+    :return: (n_rays, 2) points
+    """
+    dist = np.reshape(scan, (-1, 1)) * (laser_linear_range - min_laser_dist) + min_laser_dist
+    return unit_vector_base * dist + translation_base
+
+
+def planar_pose(position, orientation):
+    """
+    Planar pose of a body from its position and pybullet orientation
+
+    :param position: body position
+    :param orientation: body orientation, [x, y, z, w]
+    :return: (2,) xy position and 2x2 yaw rotation
+    """
+    x, y, z, w = orientation
+    yaw = np.arctan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z))
+    rotation = np.array([[np.cos(yaw), -np.sin(yaw)], [np.sin(yaw), np.cos(yaw)]])
+    return np.asarray(position[:2], dtype=np.float64), rotation
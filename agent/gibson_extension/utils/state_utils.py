@@ -0,0 +1,145 @@
+import numpy as np
+import pybullet as p
+
+
+def save_body_state(body_id):
+    """
+    Capture the kinematic state of a single pybullet body
+
+    :param body_id: pybullet body id
+    :return: tuple of base pose, base velocity and joint states
+    """
+    pos, orn = p.getBasePositionAndOrientation(body_id)
+    lin_vel, ang_vel = p.getBaseVelocity(body_id)
+    num_joints = p.getNumJoints(body_id)
+    joint_states = p.getJointStates(body_id, range(num_joints)) if num_joints > 0 else []
+    joint_states = [(state[0], state[1]) for state in joint_states]
+    return pos, orn, lin_vel, ang_vel, joint_states
+
+
+def restore_body_state(body_id, body_state):
+    """
+    Restore the kinematic state captured by save_body_state
+
+    :param body_id: pybullet body id
+    :param body_state: state returned by save_body_state
+    """
+    pos, orn, lin_vel, ang_vel, joint_states = body_state
+    p.resetBasePositionAndOrientation(body_id, pos, orn)
+    p.resetBaseVelocity(body_id, lin_vel, ang_vel)
+    for joint_idx, (joint_pos, joint_vel) in enumerate(joint_states):
+        p.resetJointState(body_id, joint_idx, joint_pos, targetVelocity=joint_vel)
+
+
+class StateSnapshot(object):
+    """
+    Snapshot of the simulation state used to undo validity tests.
+    With mode 'robot', only the robots' bodies are captured (base pose, base velocity and
+    joint states), which is enough for point-nav where nothing else moves.
+    With mode 'world', the entire pybullet world is captured with p.saveState,
+    which is required for interactive tasks where objects can be pushed.
+    """
+
+    def __init__(self, robots, mode='robot'):
+        """
+        :param robots: list of robots to capture in 'robot' mode
+        :param mode: 'robot' or 'world'
+        """
+        assert mode in ['robot', 'world'], 'unknown snapshot mode: {}'.format(mode)
+        self.mode = mode
+        if self.mode == 'world':
+            self.state_id = p.saveState()
+        else:
+            self.body_states = [(body_id, save_body_state(body_id))
+                                for robot in robots
+                                for body_id in robot.get_body_ids()]
+
+    def restore(self):
+        """
+        Restore the captured state
+        """
+        if self.mode == 'world':
+            p.restoreState(self.state_id)
+        else:
+            for body_id, body_state in self.body_states:
+                restore_body_state(body_id, body_state)
+
+    def remove(self):
+        """
+        Release the captured state (removes the cached pybullet state to prevent memory leak)
+        """
+        if self.mode == 'world':
+            p.removeState(self.state_id)
+        else:
+            self.body_states = []
+
+
+class KinematicState(object):
+    """
+    Kinematic state of a robot at one simulator step: base pose, roll / pitch / yaw, base velocities
+    and link poses, each queried from pybullet at most once and shared by the task, reward functions,
+    termination conditions and sensors. iGibsonEnv drops the snapshot whenever the simulation advances
+    or the robot is moved, so a snapshot is never read across steps.
+    The returned arrays are shared between the readers and must not be modified in place.
+    """
+
+    def __init__(self, robot):
+        """
+        :param robot: robot to capture
+        """
+        self.robot = robot
+        self.cache = {}
+
+    def _get(self, key, query):
+        if key not in self.cache:
+            self.cache[key] = query()
+        return self.cache[key]
+
+    def get_position_orientation(self):
+        """
+        :return: robot position and orientation, as robot.get_position_orientation
+        """
+        return self._get('pose', self.robot.get_position_orientation)
+
+    def get_position(self):
+        """
+        :return: robot position, as robot.get_position
+        """
+        return self.get_position_orientation()[0]
+
+    def get_base_pose(self):
+        """
+        :return: base link position and orientation, as robot.base_link.get_position_orientation
+        """
+        return self._get('base_pose', self.robot.base_link.get_position_orientation)
+
+    def get_rpy(self):
+        """
+        :return: base link roll, pitch, yaw, as robot.get_rpy
+        """
+        return self._get('rpy', lambda: np.array(p.getEulerFromQuaternion(self.get_base_pose()[1])))
+
+    def get_velocity(self):
+        """
+        :return: base link linear and angular velocities, as robot.base_link.get_velocity
+        """
+        return self._get('velocity', self.robot.base_link.get_velocity)
+
+    def get_linear_velocity(self):
+        """
+        :return: base link linear velocity, as robot.get_linear_velocity
+        """
+        return self.get_velocity()[0]
+
+    def get_angular_velocity(self):
+        """
+        :return: base link angular velocity, as robot.get_angular_velocity
+        """
+        return self.get_velocity()[1]
+
+    def get_link_pose(self, link_name):
+        """
+        :param link_name: robot link name
+        :return: link position and orientation, as robot.links[link_name].get_position_orientation
+        """
+        return self._get(('link', link_name), self.robot.links[link_name].get_position_orientation)
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import networkx as nx
+import numpy as np
+
+from agent.gibson_extension.utils.geodesic_utils import graph_to_arrays
+
+# bump when the layout of a cache entry or the map processing changes
+CACHE_VERSION = 2
+
+
+class TravMapCache(object):
+    """
+    On-disk cache of the eroded traversability maps and traversability graphs of a scene,
+    replacing IndoorScene.load_trav_map. One entry per floor, addressed by the content of the
+    source map images and the map processing parameters (scene id, floor, trav_map_resolution,
+    trav_map_erosion, trav_map_type, build_graph), so a warm cache is shared by every worker,
+    restart and reload_model. Arrays are stored as .npy files and memory-mapped on load.
+    """
+
+    def __init__(self, cache_dir):
+        """
+        :param cache_dir: directory of the cache entries, created if needed
+        """
+        self.cache_dir = os.path.expanduser(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def attach(self, scene):
+        """
+        Make the scene load its traversability maps through the cache
+
+        :param scene: iGibson indoor scene, before it is imported into the simulator
+        """
+        build_trav_map = scene.load_trav_map
+        scene.load_trav_map = lambda maps_path: self.load_trav_map(scene, maps_path, build_trav_map)
+
+    def source_paths(self, scene, maps_path, floor):
+        """
+        Images IndoorScene.load_trav_map reads for one floor: the traversability map and
+        the obstacle map whose obstacles are removed from it
+
+        :param scene: iGibson indoor scene
+        :param maps_path: folder of the traversability map images
+        :param floor: floor number
+        :return: image paths
+        """
+        if scene.trav_map_type == 'with_obj':
+            names = ['floor_trav_{}.png', 'floor_{}.png']
+        else:
+            names = ['floor_trav_no_obj_{}.png', 'floor_no_obj_{}.png']
+        return [os.path.join(maps_path, name.format(floor)) for name in names]
+
+    def entry_dir(self, scene, maps_path, floor):
+        """
+        Cache entry of one floor
+
+        :param scene: iGibson indoor scene
+        :param maps_path: folder of the traversability map images
+        :param floor: floor number
+        :return: entry directory
+        """
+        digest = hashlib.sha1()
+        for path in self.source_paths(scene, maps_path, floor):
+            digest.update(os.path.basename(path).encode())
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+        key = [CACHE_VERSION, scene.scene_id, floor, scene.trav_map_resolution,
+               scene.trav_map_erosion, scene.trav_map_type, bool(scene.build_graph)]
+        digest.update(json.dumps(key).encode())
+        return os.path.join(self.cache_dir, '{}_{}_{}'.format(scene.scene_id, floor, digest.hexdigest()[:16]))
+
+    def load_trav_map(self, scene, maps_path, build_trav_map):
+        """
+        Load the traversability maps of all floors from the cache,
+        building them with build_trav_map and storing them on a miss
+
+        :param scene: iGibson indoor scene
+        :param maps_path: folder of the traversability map images
+        :param build_trav_map: the scene's own load_trav_map
+        """
+        if not os.path.exists(maps_path):
+            build_trav_map(maps_path)
+            return
+
+        entries = [self.entry_dir(scene, maps_path, floor) for floor in range(len(scene.floor_heights))]
+        if all(os.path.isdir(entry) for entry in entries):
+            self.read(scene, entries)
+            logging.info('Loaded traversability maps of {} from {}'.format(scene.scene_id, self.cache_dir))
+            return
+
+        build_trav_map(maps_path)
+        if scene.build_graph:
+            scene.floor_graph_arrays = [graph_to_arrays(graph) for graph in scene.floor_graph]
+        for floor, entry in enumerate(entries):
+            self.write(scene, floor, entry)
+
+    def read(self, scene, entries):
+        scene.floor_map = []
+        scene.floor_graph = []
+        scene.floor_graph_arrays = [] if scene.build_graph else None
+        for entry in entries:
+            with open(os.path.join(entry, 'meta.json'), 'r') as f:
+                meta = json.load(f)
+            if scene.trav_map_original_size is None:
+                scene.trav_map_original_size = meta['trav_map_original_size']
+                scene.trav_map_size = meta['trav_map_size']
+            # copy-on-write: the map can be modified in place without touching the cache
+            scene.floor_map.append(np.load(os.path.join(entry, 'floor_map.npy'), mmap_mode='c'))
+            if scene.build_graph:
+                nodes, edges, weights = [np.load(os.path.join(entry, name + '.npy'), mmap_mode='r')
+                                         for name in ('nodes', 'edges', 'weights')]
+                scene.floor_graph_arrays.append((nodes, edges, weights))
+                graph = nx.Graph()
+                node_list = [tuple(node) for node in nodes.tolist()]
+                graph.add_nodes_from(node_list)
+                graph.add_weighted_edges_from(
+                    (node_list[a], node_list[b], w) for (a, b), w in zip(edges.tolist(), weights.tolist()))
+                scene.floor_graph.append(graph)
+
+    def write(self, scene, floor, entry):
+        if os.path.isdir(entry):
+            return
+        # write to a temporary directory and rename it, so that concurrent workers never read a partial entry
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir)
+        np.save(os.path.join(tmp_dir, 'floor_map.npy'), np.ascontiguousarray(scene.floor_map[floor]))
+        if scene.build_graph:
+            for name, array in zip(('nodes', 'edges', 'weights'), scene.floor_graph_arrays[floor]):
+                np.save(os.path.join(tmp_dir, name + '.npy'), array)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump({'trav_map_original_size': int(scene.trav_map_original_size),
+                       'trav_map_size': int(scene.trav_map_size)}, f)
+        try:
+            os.rename(tmp_dir, entry)
+        except OSError:
+            # another worker stored the same entry first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import networkx as nx
+import numpy as np
+
+from agent.gibson_extension.utils.trav_map_cache import TravMapCache
+
+
+class FakeScene(object):
+    """
+    Scene attributes read and written by IndoorScene.load_trav_map, with a load_trav_map
+    that counts its calls instead of processing the images
+    """
+
+    def __init__(self, build_graph=True):
+        self.scene_id = 'Rs'
+        self.floor_heights = [0.0]
+        self.trav_map_resolution = 0.1
+        self.trav_map_erosion = 2
+        self.trav_map_type = 'with_obj'
+        self.build_graph = build_graph
+        self.trav_map_original_size = None
+        self.trav_map_size = None
+        self.num_builds = 0
+
+    def load_trav_map(self, maps_path):
+        self.num_builds += 1
+        self.trav_map_original_size = 100
+        self.trav_map_size = 10
+        floor_map = np.zeros((10, 10), dtype=np.uint8)
+        floor_map[2:8, 2:8] = 255
+        self.floor_map = [floor_map]
+        graph = nx.Graph()
+        graph.add_edge((2, 2), (2, 3), weight=1.0)
+        graph.add_edge((2, 3), (3, 3), weight=1.0)
+        self.floor_graph = [graph]
+
+
+class TravMapCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.maps_path = tempfile.mkdtemp()
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.maps_path)
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.cache = TravMapCache(cache_dir)
+        for name in ('floor_trav_0.png', 'floor_0.png'):
+            self.write_image(name, b'image')
+
+    def write_image(self, name, content):
+        with open(os.path.join(self.maps_path, name), 'wb') as f:
+            f.write(content)
+
+    def test_entry_depends_on_every_source_image(self):
+        scene = FakeScene()
+        entry = self.cache.entry_dir(scene, self.maps_path, 0)
+        self.assertEqual(entry, self.cache.entry_dir(scene, self.maps_path, 0))
+        self.write_image('floor_0.png', b'moved obstacles')
+        obstacles_changed = self.cache.entry_dir(scene, self.maps_path, 0)
+        self.assertNotEqual(entry, obstacles_changed)
+        self.write_image('floor_trav_0.png', b'new traversability')
+        self.assertNotEqual(obstacles_changed, self.cache.entry_dir(scene, self.maps_path, 0))
+        scene.trav_map_erosion = 3
+        self.assertNotEqual(obstacles_changed, self.cache.entry_dir(scene, self.maps_path, 0))
+
+    def test_round_trip(self):
+        built = FakeScene()
+        self.cache.attach(built)
+        built.load_trav_map(self.maps_path)
+        self.assertEqual(built.num_builds, 1)
+
+        cached = FakeScene()
+        self.cache.attach(cached)
+        cached.load_trav_map(self.maps_path)
+        self.assertEqual(cached.num_builds, 0)
+        self.assertEqual(cached.trav_map_size, 10)
+        np.testing.assert_array_equal(cached.floor_map[0], built.floor_map[0])
+        self.assertEqual(sorted(cached.floor_graph[0].edges(data='weight')),
+                         sorted(built.floor_graph[0].edges(data='weight')))
+
+
+if __name__ == '__main__':
+    unittest.main()
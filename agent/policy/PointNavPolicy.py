@@ -29,6 +29,7 @@ class PointNavResNetPolicy(Policy):
         normalize_visual_inputs: bool = False,
         force_blind_policy: bool = False,
         num_envs: int = 1,
+        optimized_visual_encoder: bool = False,
         **kwargs
     ):
         super().__init__(
@@ -42,6 +43,7 @@ class PointNavResNetPolicy(Policy):
                 resnet_baseplanes=resnet_baseplanes,
                 normalize_visual_inputs=normalize_visual_inputs,
                 force_blind_policy=force_blind_policy,
+                optimized_visual_encoder=optimized_visual_encoder,
             ),
             2,
             num_envs = num_envs
@@ -58,9 +60,14 @@ class PointNavResNetPolicy(Policy):
             rnn_type=config.RL.DDPPO.rnn_type,
             num_recurrent_layers=config.RL.DDPPO.num_recurrent_layers,
             backbone=config.RL.DDPPO.backbone,
-            normalize_visual_inputs="rgb" in observation_space.spaces,
+            normalize_visual_inputs=(
+                "rgb" in observation_space.spaces
+                if config.RL.POLICY.NORMALIZE_VISUAL_INPUTS is None
+                else config.RL.POLICY.NORMALIZE_VISUAL_INPUTS
+            ),
             force_blind_policy=config.FORCE_BLIND_POLICY,
-            num_envs = config.NUM_ENVIRONMENTS
+            num_envs = config.NUM_ENVIRONMENTS,
+            optimized_visual_encoder=config.RL.POLICY.OPTIMIZED_VISUAL_ENCODER,
         )
     
 
@@ -75,6 +82,7 @@ class ResNetEncoder(nn.Module):
         spatial_size: int = 128,
         make_backbone=None,
         normalize_visual_inputs: bool = False,
+        optimized: bool = False,
     ):
         super().__init__()
 
@@ -128,10 +136,28 @@ class ResNetEncoder(nn.Module):
                 final_spatial,
             )
 
+        # optimized execution: channels last memory layout, which NHWC
+        # observations already have once permuted, and the input average
+        # pool folded into the first conv
+        self.optimized = optimized and not self.is_blind
+        if self.optimized:
+            self.backbone.to(memory_format=torch.channels_last)
+            self.compression.to(memory_format=torch.channels_last)
+
     @property
     def is_blind(self):
         return self._n_input_rgb + self._n_input_depth == 0
 
+    @property
+    def visual_keys(self):
+        r"""Observations read by the encoder."""
+        keys = []
+        if self._n_input_rgb > 0:
+            keys.append("rgb")
+        if self._n_input_depth > 0:
+            keys.append("depth")
+        return keys
+
     def layer_init(self):
         for layer in self.modules():
             if isinstance(layer, (nn.Conv2d, nn.Linear)):
@@ -164,10 +190,22 @@ class ResNetEncoder(nn.Module):
             cnn_input.append(depth_observations)
 
         x = torch.cat(cnn_input, dim=1)
-        x = F.avg_pool2d(x, 2)
+        # the normalization is a per-channel affine map, which commutes with
+        # the pool, but its running statistics are of the pooled inputs
+        fold_input_pool = self.optimized and not (
+            self.training
+            and isinstance(self.running_mean_and_var, RunningMeanAndVar)
+        )
+        if self.optimized:
+            x = x.contiguous(memory_format=torch.channels_last)
 
-        x = self.running_mean_and_var(x)
-        x = self.backbone(x)
+        if fold_input_pool:
+            x = self.running_mean_and_var(x)
+            x = self.backbone(x, input_pool=2)
+        else:
+            x = F.avg_pool2d(x, 2)
+            x = self.running_mean_and_var(x)
+            x = self.backbone(x)
         x = self.compression(x)
         return x
 
@@ -177,6 +215,10 @@ class PointNavResNetNet(Net):
     goal vector with CNN's output and passes that through RNN.
     """
 
+    # observation with the output of the visual encoder, computed ahead of
+    # time, e.g. by a trainer with a frozen encoder
+    PRETRAINED_VISUAL_FEATURES_KEY = "visual_features"
+
     def __init__(
         self,
         observation_space: spaces.Dict,
@@ -188,6 +230,7 @@ class PointNavResNetNet(Net):
         resnet_baseplanes,
         normalize_visual_inputs: bool,
         force_blind_policy: bool = False,
+        optimized_visual_encoder: bool = False,
     ):
         super().__init__()
 
@@ -217,6 +260,7 @@ class PointNavResNetNet(Net):
             ngroups=resnet_baseplanes // 2,
             make_backbone=getattr(resnet, backbone),
             normalize_visual_inputs=normalize_visual_inputs,
+            optimized=optimized_visual_encoder,
         )
 
         if not self.visual_encoder.is_blind:
@@ -257,8 +301,8 @@ class PointNavResNetNet(Net):
     ) -> Tuple[torch.Tensor, torch.Tensor]:
         x = []
         if not self.is_blind:
-            if "visual_features" in observations:
-                visual_feats = observations["visual_features"]
+            if self.PRETRAINED_VISUAL_FEATURES_KEY in observations:
+                visual_feats = observations[self.PRETRAINED_VISUAL_FEATURES_KEY]
             else:
                 visual_feats = self.visual_encoder(observations)
 
@@ -0,0 +1,251 @@
+import json
+import os
+from typing import Dict, Optional, Tuple
+
+import torch
+from absl import logging
+from torch import nn as nn
+
+from agent.gibson_extension.utils.common import CustomFixedNormal
+
+BACKENDS = ("script", "compile")
+
+
+class ActNet(nn.Module):
+    r"""Act path of a policy as one module with tensor inputs: visual encoder,
+    goal and previous action embeddings, one RNN step, action mean and value
+    heads. The action distribution is built and sampled by the caller.
+    """
+
+    def __init__(self, policy):
+        super().__init__()
+        self.net = policy.net
+        self.action_mean = policy.action_distribution.mean
+        self.critic = policy.critic
+
+    def forward(
+        self,
+        observations: Dict[str, torch.Tensor],
+        rnn_hidden_states: torch.Tensor,
+        prev_actions: torch.Tensor,
+        masks: torch.Tensor,
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        features, rnn_hidden_states = self.net(
+            observations, rnn_hidden_states, prev_actions, masks
+        )
+        mean = torch.clamp(self.action_mean(features), -1, 1)
+        value = self.critic(features)
+        return value, mean, rnn_hidden_states
+
+
+class PolicyInference:
+    r"""Compiled act path of a policy, a drop-in replacement of Policy.act
+    during rollouts and eval.
+
+    The "script" backend traces the act path with TorchScript, once per
+    input signature (batch size, observation shapes, device). Traced modules
+    share the parameters and buffers of the policy, so they follow its
+    in-place updates (optimizer steps, RunningMeanAndVar statistics). The
+    "compile" backend uses torch.compile (PyTorch 2) and keeps the Inductor
+    kernels in cache_dir across runs.
+
+    Calls fall back to the eager policy when it is in training mode (the
+    running mean of the visual inputs would not be updated), when the
+    observations are not batched tensors, and for signatures whose
+    compilation failed or did not match the eager policy.
+    """
+
+    def __init__(
+        self,
+        policy,
+        backend: str = "script",
+        cache_dir: Optional[str] = None,
+        atol: float = 1e-4,
+    ):
+        r"""
+        Args:
+            policy: Policy whose act path is compiled
+            backend: "script" or "compile"
+            cache_dir: persistent compilation cache of the "compile" backend
+            atol: tolerance of the check against the eager policy done
+                for every new signature
+        """
+        assert backend in BACKENDS, "unknown inference backend: {}".format(
+            backend
+        )
+        if backend == "compile" and not hasattr(torch, "compile"):
+            logging.warning(
+                "torch.compile needs PyTorch 2, using TorchScript"
+            )
+            backend = "script"
+        self.policy = policy
+        self.backend = backend
+        self.atol = atol
+        self.act_net = ActNet(policy)
+        self._modules: Dict[Tuple, Optional[nn.Module]] = {}
+        if backend == "compile" and cache_dir is not None:
+            enable_compile_cache(cache_dir)
+
+    @staticmethod
+    def signature(observations, rnn_hidden_states, prev_actions, masks) -> Tuple:
+        return tuple(
+            (key, tuple(value.shape), value.dtype, value.device)
+            for key, value in sorted(observations.items())
+        ) + tuple(
+            (tuple(t.shape), t.dtype, t.device)
+            for t in (rnn_hidden_states, prev_actions, masks)
+        )
+
+    def compile(self, observations, rnn_hidden_states, prev_actions, masks):
+        r"""Compile the act path for the signature of the given inputs and
+        check it against the eager policy on them.
+
+        Returns:
+            compiled module, or None if compilation failed or does not match
+        """
+        inputs = (dict(observations), rnn_hidden_states, prev_actions, masks)
+        try:
+            with torch.no_grad():
+                if self.backend == "script":
+                    module = torch.jit.trace(
+                        self.act_net, inputs, check_trace=False
+                    )
+                else:
+                    module = torch.compile(self.act_net, dynamic=False)
+                max_error = check_equivalence(self.act_net, module, inputs)
+        except Exception as e:  # noqa: B902
+            logging.warning(
+                "Compiling the act path failed, running it eagerly: {}".format(e)
+            )
+            return None
+        if max_error > self.atol:
+            logging.warning(
+                "Compiled act path differs from the eager policy by {:.3g}, "
+                "running it eagerly".format(max_error)
+            )
+            return None
+        return module
+
+    def act(
+        self,
+        observations,
+        rnn_hidden_states,
+        prev_actions,
+        masks,
+        deterministic=False,
+    ):
+        if self.policy.training or not self.policy.is_transformed(observations):
+            return self.policy.act(
+                observations, rnn_hidden_states, prev_actions, masks, deterministic
+            )
+        key = self.signature(observations, rnn_hidden_states, prev_actions, masks)
+        if key not in self._modules:
+            self._modules[key] = self.compile(
+                observations, rnn_hidden_states, prev_actions, masks
+            )
+        module = self._modules[key]
+        if module is None:
+            return self.policy.act(
+                observations, rnn_hidden_states, prev_actions, masks, deterministic
+            )
+
+        value, mean, rnn_hidden_states = module(
+            dict(observations), rnn_hidden_states, prev_actions, masks
+        )
+        return sample_action(
+            value, mean, self.policy.action_distribution.log_std, rnn_hidden_states
+        )
+
+    def export(self, path, observations, rnn_hidden_states, prev_actions, masks):
+        r"""Save the act path traced on the given inputs as a TorchScript
+        module, loadable with load_exported without the policy code.
+        """
+        with torch.no_grad():
+            module = torch.jit.trace(
+                self.act_net,
+                (dict(observations), rnn_hidden_states, prev_actions, masks),
+            )
+        net = self.policy.net
+        meta = {
+            "log_std": self.policy.action_distribution.log_std.tolist(),
+            "num_recurrent_layers": net.num_recurrent_layers,
+            "hidden_size": net._hidden_size,
+        }
+        torch.jit.save(module, path, _extra_files={"policy.json": json.dumps(meta)})
+
+
+class ExportedPolicy:
+    r"""Act path saved by PolicyInference.export, with the act interface of
+    Policy and the recurrent state sizes of its Net. The deployable form of
+    policies that do not pickle, e.g. after int8 quantization
+    (agent.policy.quantization).
+    """
+
+    def __init__(self, module, log_std, num_recurrent_layers, hidden_size):
+        self.module = module
+        self.log_std = log_std
+        self.num_recurrent_layers = num_recurrent_layers
+        self._hidden_size = hidden_size
+
+    def act(
+        self,
+        observations,
+        rnn_hidden_states,
+        prev_actions,
+        masks,
+        deterministic=False,
+    ):
+        value, mean, rnn_hidden_states = self.module(
+            dict(observations), rnn_hidden_states, prev_actions, masks
+        )
+        return sample_action(value, mean, self.log_std, rnn_hidden_states)
+
+
+def load_exported(path, map_location="cpu") -> ExportedPolicy:
+    extra_files = {"policy.json": ""}
+    module = torch.jit.load(path, map_location=map_location, _extra_files=extra_files)
+    meta = json.loads(extra_files["policy.json"])
+    return ExportedPolicy(
+        module,
+        torch.tensor(meta["log_std"], device=map_location),
+        meta["num_recurrent_layers"],
+        meta["hidden_size"],
+    )
+
+
+def sample_action(value, mean, log_std, rnn_hidden_states):
+    # sampled like Policy.act, which also ignores deterministic
+    dist = CustomFixedNormal(mean, torch.exp(log_std))
+    action = dist.sample()
+    action_log_prob = dist.log_prob(action)
+    return value, action, action_log_prob, rnn_hidden_states
+
+
+@torch.no_grad()
+def check_equivalence(eager, compiled, inputs) -> float:
+    r"""Largest absolute difference between the outputs of two act paths on
+    the same inputs.
+    """
+    expected = eager(*inputs)
+    actual = compiled(*inputs)
+    return max(
+        (e.float() - a.float()).abs().max().item()
+        for e, a in zip(expected, actual)
+    )
+
+
+def enable_compile_cache(cache_dir: str) -> None:
+    r"""Keep the kernels compiled by torch.compile in cache_dir, so that
+    later runs of the same model skip the compilation.
+    """
+    cache_dir = os.path.expanduser(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", cache_dir)
+    os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+    try:
+        from torch._inductor import config as inductor_config
+
+        inductor_config.fx_graph_cache = True
+    except (ImportError, AttributeError):
+        pass
+
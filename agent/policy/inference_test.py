@@ -0,0 +1,117 @@
+import os
+import unittest
+from collections import OrderedDict
+
+import numpy as np
+import torch
+from gym import spaces
+
+import agent
+from agent.policy.PointNavPolicy import PointNavResNetPolicy
+from agent.policy.inference import PolicyInference
+from agent.ppo.config.default import get_config
+
+IMAGE_SIZE = 64
+NUM_ENVS = 2
+
+
+def make_policy():
+    config = get_config(
+        os.path.join(os.path.dirname(agent.__file__), "configs", "agent.yaml"),
+        ["RL.DDPPO.backbone", "resnet18", "RL.PPO.hidden_size", "32"],
+    )
+    observation_space = spaces.Dict(
+        OrderedDict(
+            [
+                ("task_obs", spaces.Box(-np.inf, np.inf, (4,), np.float32)),
+                (
+                    "depth",
+                    spaces.Box(0.0, 1.0, (IMAGE_SIZE, IMAGE_SIZE, 1), np.float32),
+                ),
+            ]
+        )
+    )
+    action_space = spaces.Box(-1.0, 1.0, (2,), np.float32)
+    torch.manual_seed(0)
+    policy = PointNavResNetPolicy.from_config(
+        config, observation_space, action_space
+    )
+    return policy.eval()
+
+
+def make_inputs(policy, seed):
+    generator = torch.Generator().manual_seed(seed)
+    net = policy.net
+    observations = {
+        "task_obs": torch.randn(NUM_ENVS, 4, generator=generator),
+        "depth": torch.rand(NUM_ENVS, IMAGE_SIZE, IMAGE_SIZE, 1, generator=generator),
+    }
+    rnn_hidden_states = torch.randn(
+        NUM_ENVS, net.num_recurrent_layers, net._hidden_size, generator=generator
+    )
+    prev_actions = torch.rand(NUM_ENVS, 2, generator=generator) * 2 - 1
+    masks = torch.tensor([[True], [False]])
+    return observations, rnn_hidden_states, prev_actions, masks
+
+
+class PolicyInferenceTest(unittest.TestCase):
+    def setUp(self):
+        self.policy = make_policy()
+        self.inference = PolicyInference(self.policy, backend="script")
+
+    def assertActEqual(self, seed):
+        inputs = make_inputs(self.policy, seed)
+        with torch.no_grad():
+            torch.manual_seed(seed)
+            expected = self.policy.act(*inputs)
+            torch.manual_seed(seed)
+            actual = self.inference.act(*inputs)
+        for e, a in zip(expected, actual):
+            np.testing.assert_allclose(a.numpy(), e.numpy(), atol=1e-4)
+
+    def test_matches_eager_policy(self):
+        self.assertActEqual(0)
+        self.assertEqual(len(self.inference._modules), 1)
+        self.assertIsNotNone(next(iter(self.inference._modules.values())))
+
+    def test_follows_parameter_updates(self):
+        self.assertActEqual(0)
+        # an optimizer step updates the parameters in place
+        with torch.no_grad():
+            for param in self.policy.parameters():
+                param.add_(torch.randn_like(param) * 1e-2)
+        self.assertActEqual(1)
+
+    def test_follows_running_mean_and_var_updates(self):
+        running_mean_and_var = self.policy.net.visual_encoder.running_mean_and_var
+        self.assertActEqual(0)
+        mean = running_mean_and_var._mean.clone()
+        # the PPO update runs the policy in train mode, updating the
+        # normalization statistics of the visual inputs
+        self.policy.train()
+        observations, rnn_hidden_states, prev_actions, masks = make_inputs(
+            self.policy, 1
+        )
+        observations["depth"] = observations["depth"] * 5 + 2
+        with torch.no_grad():
+            self.policy.evaluate_actions(
+                observations,
+                rnn_hidden_states,
+                prev_actions,
+                masks,
+                prev_actions,
+            )
+        self.policy.eval()
+        self.assertFalse(torch.equal(mean, running_mean_and_var._mean))
+        self.assertActEqual(2)
+
+    def test_falls_back_in_training_mode(self):
+        self.policy.train()
+        inputs = make_inputs(self.policy, 0)
+        with torch.no_grad():
+            self.inference.act(*inputs)
+        self.assertEqual(len(self.inference._modules), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import copy
+import io
+from typing import Iterable, Optional
+
+import torch
+from torch import nn as nn
+
+#: submodules of a PointNavResNetPolicy quantized dynamically (int8 weights,
+#: activations quantized on the fly): the LSTM/GRU and the Linear heads
+DYNAMIC_MODULES = (
+    "net.state_encoder",
+    "net.visual_fc",
+    "net.tgt_embeding",
+    "net.prev_action_embedding",
+    "action_distribution.mean",
+    "critic",
+)
+
+
+def quantize_dynamic_layers(policy: nn.Module) -> nn.Module:
+    r"""Dynamic int8 quantization, in place, of the recurrent layers and
+    Linear heads of a policy (DYNAMIC_MODULES). Their cost is dominated by
+    loading weights at the batch size of one environment.
+    """
+    from torch.ao.quantization import default_dynamic_qconfig, quantize_dynamic
+
+    modules = dict(policy.named_modules())
+    qconfig_spec = {
+        name: default_dynamic_qconfig for name in DYNAMIC_MODULES if name in modules
+    }
+    return quantize_dynamic(policy, qconfig_spec, dtype=torch.qint8, inplace=True)
+
+
+def quantize_visual_encoder(
+    encoder: nn.Module,
+    calibration_observations: Iterable,
+    backend: str = "fbgemm",
+) -> nn.Module:
+    r"""Static post-training int8 quantization, in place, of the conv
+    backbone and compression layers of a ResNetEncoder.
+
+    The backbone is traced with FX, observers are calibrated on the
+    activations of calibration_observations and the convolutions are
+    converted to quantized kernels. The input pooling and normalization of
+    the encoder stay in float.
+
+    Args:
+        encoder: ResNetEncoder in eval mode, on CPU
+        calibration_observations: batches of transformed observations, e.g.
+            recorded depth frames
+        backend: quantized engine, "fbgemm" (x86) or "qnnpack" (ARM)
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    # the quantized convs run on explicitly pooled inputs
+    encoder.optimized = False
+    convs = nn.Sequential(encoder.backbone, encoder.compression)
+    num_channels = encoder.backbone.conv1[0].in_channels
+    example_inputs = (torch.zeros(1, num_channels, 64, 64),)
+    prepared = prepare_fx(
+        convs, get_default_qconfig_mapping(backend), example_inputs
+    )
+
+    # calibrate through the encoder, so that the observers see the
+    # pooled and normalized inputs
+    encoder.backbone, encoder.compression = prepared, nn.Sequential()
+    num_batches = 0
+    with torch.no_grad():
+        for observations in calibration_observations:
+            encoder(observations)
+            num_batches += 1
+    assert num_batches > 0, "no calibration observations"
+
+    encoder.backbone = convert_fx(prepared)
+    return encoder
+
+
+def quantize_policy(
+    policy: nn.Module,
+    calibration_observations: Optional[Iterable] = None,
+    backend: str = "fbgemm",
+    dynamic: bool = True,
+) -> nn.Module:
+    r"""Int8 copy of a policy for CPU inference.
+
+    Args:
+        policy: PointNavResNetPolicy, left unchanged
+        calibration_observations: batches of transformed observations
+            calibrating the static quantization of the visual encoder. The
+            encoder stays in float if None
+        backend: quantized engine, "fbgemm" (x86) or "qnnpack" (ARM)
+        dynamic: also quantize the recurrent layers and Linear heads
+
+    Returns:
+        quantized policy in eval mode, on CPU
+    """
+    assert (
+        backend in torch.backends.quantized.supported_engines
+    ), "quantized engine {} is not supported on this machine".format(backend)
+    torch.backends.quantized.engine = backend
+
+    quantized = copy.deepcopy(policy).to("cpu").eval()
+    quantized.device = torch.device("cpu")
+    encoder = quantized.net.visual_encoder
+    if calibration_observations is not None and not encoder.is_blind:
+        quantize_visual_encoder(encoder, calibration_observations, backend)
+    if dynamic:
+        quantize_dynamic_layers(quantized)
+    return quantized
+
+
+def model_size(module: nn.Module) -> int:
+    r"""Bytes of the serialized state dict of a module."""
+    buffer = io.BytesIO()
+    torch.save(module.state_dict(), buffer)
+    return buffer.tell()
@@ -8,6 +8,7 @@ from typing import List, Optional, Type, Union, cast
 
 from torch import Tensor
 from torch import nn as nn
+from torch.nn import functional as F
 from torch.nn.modules.container import Sequential
 from torch.nn.modules.conv import Conv2d
 
@@ -269,8 +270,43 @@ class ResNet(nn.Module):
 
         return nn.Sequential(*layers)
 
-    def forward(self, x) -> Tensor:
-        x = self.conv1(x)
+    def pooled_stem(self, x: Tensor, input_pool: int) -> Tensor:
+        r"""conv1 after average pooling by input_pool, as one conv: the conv
+        kernel dilated by input_pool and box filtered, with input_pool times
+        its stride and padding.
+        """
+        conv = self.conv1[0]
+        p = input_pool
+        out_channels, in_channels, kh, kw = conv.weight.shape
+        weight = F.conv_transpose2d(
+            conv.weight.reshape(out_channels * in_channels, 1, kh, kw),
+            conv.weight.new_full((1, 1, p, p), 1.0 / (p * p)),
+            stride=p,
+        ).reshape(out_channels, in_channels, kh * p, kw * p)
+        # rows and columns the pool would drop
+        h, w = x.shape[-2:]
+        x = x[..., : h - h % p, : w - w % p]
+        x = F.conv2d(
+            x,
+            weight,
+            conv.bias,
+            stride=(conv.stride[0] * p, conv.stride[1] * p),
+            padding=(conv.padding[0] * p, conv.padding[1] * p),
+        )
+        for module in self.conv1[1:]:
+            x = module(x)
+        return x
+
+    def forward(self, x: Tensor, input_pool: int = 1) -> Tensor:
+        r"""Args:
+            x: input images, NCHW
+            input_pool: average pooling of x by this factor, folded into the
+                stride of the first conv
+        """
+        if input_pool > 1:
+            x = self.pooled_stem(x, input_pool)
+        else:
+            x = self.conv1(x)
         x = self.maxpool(x)
         x = cast(Tensor, x)
         x = self.layer1(x)
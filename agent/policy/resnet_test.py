@@ -0,0 +1,73 @@
+import unittest
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from gym import spaces
+
+from agent.policy import resnet
+from agent.policy.PointNavPolicy import ResNetEncoder
+
+
+class PooledStemTest(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.backbone = resnet.resnet18(1, 32, 16).eval()
+
+    def assertClose(self, actual, expected):
+        np.testing.assert_allclose(
+            actual.detach().numpy(), expected.detach().numpy(), atol=1e-4
+        )
+
+    def test_matches_pool_then_conv(self):
+        # odd sizes: the pool drops the last row and column
+        for size in ((64, 64), (65, 67), (90, 160)):
+            x = torch.rand(2, 1, *size)
+            for memory_format in (torch.contiguous_format, torch.channels_last):
+                x = x.contiguous(memory_format=memory_format)
+                with torch.no_grad():
+                    self.assertClose(
+                        self.backbone.pooled_stem(x, 2),
+                        self.backbone.conv1(F.avg_pool2d(x, 2)),
+                    )
+
+    def test_forward_input_pool(self):
+        x = torch.rand(2, 1, 66, 66)
+        with torch.no_grad():
+            self.assertClose(
+                self.backbone(x, input_pool=2),
+                self.backbone(F.avg_pool2d(x, 2)),
+            )
+
+
+class OptimizedResNetEncoderTest(unittest.TestCase):
+    def make_encoder(self, optimized, normalize_visual_inputs=True):
+        observation_space = spaces.Dict(
+            {"depth": spaces.Box(0.0, 1.0, (64, 64, 1), np.float32)}
+        )
+        torch.manual_seed(0)
+        return ResNetEncoder(
+            observation_space,
+            baseplanes=32,
+            ngroups=16,
+            make_backbone=resnet.resnet18,
+            normalize_visual_inputs=normalize_visual_inputs,
+            optimized=optimized,
+        )
+
+    def test_matches_default_encoder(self):
+        default, optimized = self.make_encoder(False), self.make_encoder(True)
+        observations = {"depth": torch.rand(2, 64, 64, 1)}
+        for training in (True, False):
+            default.train(training)
+            optimized.train(training)
+            with torch.no_grad():
+                expected = default(observations)
+                actual = optimized(observations)
+            np.testing.assert_allclose(
+                actual.numpy(), expected.numpy(), atol=1e-4
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -56,10 +56,13 @@ class RunningMeanAndVar(nn.Module):
                 / (self._count + new_count)
             )
 
-            self._var = M2 / (self._count + new_count)
-            self._mean = (self._count * self._mean + new_count * new_mean) / (
-                self._count + new_count
+            # update the buffers in place: modules traced for the act path
+            # (agent.policy.inference) hold references to these tensors
+            self._mean.copy_(
+                (self._count * self._mean + new_count * new_mean)
+                / (self._count + new_count)
             )
+            self._var.copy_(M2 / (self._count + new_count))
 
             self._count += new_count
 
@@ -33,6 +33,9 @@ _C.EVAL_CKPT_PATH_DIR = "data/checkpoints"  # path to ckpt or path to ckpts dir
 _C.NUM_ENVIRONMENTS = 16
 _C.NUM_PROCESSES = -1  # depricated
 _C.SENSORS = ["RGB_SENSOR", "DEPTH_SENSOR"]
+# envs only render the vision outputs in SENSORS (plus rgb for eval videos), at
+# the size ResizeShortestEdge resizes to
+_C.RENDER_CONSUMED_ONLY = True
 _C.CHECKPOINT_FOLDER = "data/checkpoints"
 _C.NUM_UPDATES = 10000
 _C.NUM_CHECKPOINTS = 10
@@ -72,6 +75,18 @@ _C.RL.SLACK_REWARD = -0.01
 # -----------------------------------------------------------------------------
 _C.RL.POLICY = CN()
 _C.RL.POLICY.name = "PointNavResNetPolicy"
+# normalize the visual encoder inputs; None: only if rgb is observed. Set it
+# explicitly when RENDER_CONSUMED_ONLY drops rgb from the observations
+_C.RL.POLICY.NORMALIZE_VISUAL_INPUTS = None
+# compile the act path used during rollouts and eval (agent.policy.inference),
+# with "script" (TorchScript) or "compile" (torch.compile, PyTorch 2)
+_C.RL.POLICY.COMPILED_INFERENCE = True
+_C.RL.POLICY.INFERENCE_BACKEND = "script"
+# persistent cache of the kernels compiled by the "compile" backend
+_C.RL.POLICY.INFERENCE_CACHE_DIR = "~/.cache/agent/inference"
+# run the visual encoder channels last, with its input average pool folded
+# into the first conv (ResNetEncoder)
+_C.RL.POLICY.OPTIMIZED_VISUAL_ENCODER = False
 # -----------------------------------------------------------------------------
 # OBS_TRANSFORMS CONFIG
 # -----------------------------------------------------------------------------
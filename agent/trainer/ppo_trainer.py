@@ -16,6 +16,7 @@ from absl import flags
 from absl import logging
 import contextlib
 import copy
+import functools
 import imageio
 import torch.nn as nn
 import gin
@@ -23,18 +24,20 @@ import tqdm
 import numpy as np
 from agent.ppo.ppo import PPO
 from agent.rollout.rollout_storage import RolloutStorage
-from agent.common.common import batch_obs, ObservationBatchingCache
-from agent.environments import suite_gibson
+from agent.common.common import batch_obs, ObservationBatchingCache, TensorDict
 from agent.environments import tf_py_environment
 from agent.environments import parallel_py_environment
 from agent.utils import common
-from agent.policy.PointNavPolicy import PointNavResNetPolicy
+from agent.policy.PointNavPolicy import PointNavResNetNet, PointNavResNetPolicy
+from agent.policy.inference import PolicyInference
 from agent.common.obs_transformers import (
+    OccupancyGridRasterizer,
     get_active_obs_transforms,
     apply_obs_transforms_obs_space,
     apply_obs_transforms_batch
     
 )
+from agent.gibson_extension.utils.occupancy_grid_utils import RAW_SCAN_KEYS
 import gym.spaces as spaces
 from agent.utils.common import (load_interrupted_state,
                                     rank0_only,
@@ -51,6 +54,10 @@ from absl import flags
 import os
 
 
+# agent config SENSORS to the env outputs they read
+SENSOR_MODALITIES = {"RGB_SENSOR": "rgb", "DEPTH_SENSOR": "depth"}
+
+
 class PPOTrainer(BaseRLTrainer):
 
     def __init__(self, FLAGS) -> None:
@@ -62,7 +69,35 @@ class PPOTrainer(BaseRLTrainer):
 
         super().__init__(config=self.agent_config, FLAGS=FLAGS)
 
-    def init_envs(self, env_load_fn=None) -> None:
+    def get_render_spec(self, render_video: bool = False) -> Dict[str, Any]:
+        r"""Vision modalities and image size consumed by the policy pipeline,
+        passed to env_load_fn so that the envs render nothing more.
+
+        Args:
+            render_video: also render rgb for the eval videos
+
+        Returns:
+            render_modalities and render_shortest_edge keyword arguments
+        """
+        if not self.agent_config.RENDER_CONSUMED_ONLY:
+            return {}
+        render_modalities = [
+            SENSOR_MODALITIES[sensor]
+            for sensor in self.agent_config.SENSORS
+            if sensor in SENSOR_MODALITIES
+        ]
+        if render_video and "rgb" not in render_modalities:
+            render_modalities.append("rgb")
+        obs_transforms_config = self.agent_config.RL.POLICY.OBS_TRANSFORMS
+        render_shortest_edge = None
+        if "ResizeShortestEdge" in obs_transforms_config.ENABLED_TRANSFORMS:
+            render_shortest_edge = obs_transforms_config.RESIZE_SHORTEST_EDGE.SIZE
+        return dict(
+            render_modalities=render_modalities,
+            render_shortest_edge=render_shortest_edge,
+        )
+
+    def init_envs(self, env_load_fn=None, render_video: bool = False) -> None:
         self.num_parallel_environments = self.FLAGS.num_parallel_environments
         if self.model_ids is None:
             self.model_ids = [None] * self.num_parallel_environments
@@ -70,11 +105,16 @@ class PPOTrainer(BaseRLTrainer):
             assert len(self.model_ids) == self.num_parallel_environments, \
                 'model ids provided, but length not equal to num_parallel_environments'
 
-        self.tf_py_env = [lambda model_id=self.model_ids[i]: env_load_fn(model_id, 'headless', self.gpu)
+        render_spec = self.get_render_spec(render_video)
+        # partials rather than closures over the trainer, so that the constructors can be
+        # pickled for the 'forkserver' and 'spawn' start methods
+        self.tf_py_env = [functools.partial(env_load_fn, self.model_ids[i], 'headless', self.gpu, **render_spec)
                         for i in range(self.num_parallel_environments)]
         
         self.tf_env = tf_py_environment.TFPyEnvironment(
             parallel_py_environment.ParallelPyEnvironment(self.tf_py_env))
+        # remote environments (ParallelPyEnvironment.remote_endpoints) are batched after the local ones
+        self.num_parallel_environments = self.tf_env.batch_size
 
         self.time_step_spec = self.tf_env.time_step_spec()
 
@@ -87,25 +127,65 @@ class PPOTrainer(BaseRLTrainer):
         self.action_spec = to_spaces_Dict(self.action_spec)
 
         self.obs_transforms = get_active_obs_transforms(self.agent_config)
+        if RAW_SCAN_KEYS[0] in self.observation_spec.spaces:
+            # occupancy_grid_mode: learner, the envs send the raw scans and the
+            # grid is rasterized here with their scan parameters
+            self.obs_transforms.append(
+                OccupancyGridRasterizer.from_env_config(self.tf_env._env._envs[0].config)
+            )
         self.observation_spec = apply_obs_transforms_obs_space(
             self.observation_spec, self.obs_transforms
         )
 
     def set_agent(self) -> None:
-        self.device = torch.device('cuda:'+ str(0))
+        self.device = (
+            torch.device("cuda", 0)
+            if torch.cuda.is_available()
+            else torch.device("cpu")
+        )
         self.policy = PointNavResNetPolicy.from_config(config=self.agent_config, observation_space= self.observation_spec, action_space= self.action_spec)
         self.policy.to(device=self.device)
         if self.agent_config.RL.DDPPO.reset_critic:
             nn.init.orthogonal_(self.policy.critic.fc.weight)
             nn.init.constant_(self.policy.critic.fc.bias, 0)
         self.ppo_cfg = self.agent_config.RL.PPO
-        if (
+        self.load_pretrained_weights()
+
+        if not self.config.RL.DDPPO.train_encoder:
+            self._static_encoder = True
+            for param in self.policy.net.visual_encoder.parameters():
+                param.requires_grad_(False)
+
+        if self.config.RL.DDPPO.reset_critic:
+            nn.init.orthogonal_(self.policy.critic.fc.weight)
+            nn.init.constant_(self.policy.critic.fc.bias, 0)
+        self.agent = PPO(
+            actor_critic=self.policy,
+            clip_param=self.ppo_cfg.clip_param,
+            ppo_epoch=self.ppo_cfg.ppo_epoch,
+            num_mini_batch=self.ppo_cfg.num_mini_batch,
+            value_loss_coef=self.ppo_cfg.value_loss_coef,
+            entropy_coef=self.ppo_cfg.entropy_coef,
+            lr=self.ppo_cfg.lr,
+            eps=self.ppo_cfg.eps,
+            max_grad_norm=self.ppo_cfg.max_grad_norm,
+            use_normalized_advantage=self.ppo_cfg.use_normalized_advantage,
+        )
+        self.inference = self.build_inference()
+
+    def load_pretrained_weights(self) -> None:
+        r"""Initialize the policy, or only its visual encoder, from
+        RL.DDPPO.pretrained_weights when RL.DDPPO.pretrained or
+        RL.DDPPO.pretrained_encoder is set.
+        """
+        if not (
             self.config.RL.DDPPO.pretrained_encoder
             or self.config.RL.DDPPO.pretrained
         ):
-            pretrained_state = torch.load(
-                self.config.RL.DDPPO.pretrained_weights, map_location="cpu"
-            )
+            return
+        pretrained_state = torch.load(
+            self.config.RL.DDPPO.pretrained_weights, map_location="cpu"
+        )
 
         if self.config.RL.DDPPO.pretrained:
             self.policy.load_state_dict(
@@ -124,34 +204,50 @@ class PPOTrainer(BaseRLTrainer):
                 }
             )
 
-        if not self.config.RL.DDPPO.train_encoder:
-            self._static_encoder = True
-            for param in self.policy.net.visual_encoder.parameters():
-                param.requires_grad_(False)
-
-        if self.config.RL.DDPPO.reset_critic:
-            nn.init.orthogonal_(self.policy.critic.fc.weight)
-            nn.init.constant_(self.policy.critic.fc.bias, 0)
-        self.agent = PPO(
-            actor_critic=self.policy,
-            clip_param=self.ppo_cfg.clip_param,
-            ppo_epoch=self.ppo_cfg.ppo_epoch,
-            num_mini_batch=self.ppo_cfg.num_mini_batch,
-            value_loss_coef=self.ppo_cfg.value_loss_coef,
-            entropy_coef=self.ppo_cfg.entropy_coef,
-            lr=self.ppo_cfg.lr,
-            eps=self.ppo_cfg.eps,
-            max_grad_norm=self.ppo_cfg.max_grad_norm,
-            use_normalized_advantage=self.ppo_cfg.use_normalized_advantage,
+    def build_inference(self) -> Optional[PolicyInference]:
+        r"""Compiled act path of the policy used during rollouts and eval,
+        or None to run it eagerly.
+        """
+        policy_cfg = self.agent_config.RL.POLICY
+        if not policy_cfg.COMPILED_INFERENCE:
+            return None
+        return PolicyInference(
+            self.policy,
+            backend=policy_cfg.INFERENCE_BACKEND,
+            cache_dir=policy_cfg.INFERENCE_CACHE_DIR,
         )
 
     def init_ppo_training(self) -> None:
-        self.device = torch.device('cuda:'+ str(0))
+        self.device = (
+            torch.device("cuda", 0)
+            if torch.cuda.is_available()
+            else torch.device("cpu")
+        )
         self.policy = PointNavResNetPolicy.from_config(config=self.agent_config, observation_space= self.observation_spec, action_space= self.action_spec)
         self.policy.to(device=self.device)
+        self.load_pretrained_weights()
         if self.agent_config.RL.DDPPO.reset_critic:
             nn.init.orthogonal_(self.policy.critic.fc.weight)
             nn.init.constant_(self.policy.critic.fc.bias, 0)
+        # a frozen visual encoder runs once per step when the observations are
+        # collected, the rollouts store its features instead of the images
+        self._static_encoder = (
+            not self.agent_config.RL.DDPPO.train_encoder
+            and not self.policy.net.is_blind
+        )
+        if self._static_encoder and not (
+            self.config.RL.DDPPO.pretrained
+            or self.config.RL.DDPPO.pretrained_encoder
+        ):
+            raise ValueError(
+                "RL.DDPPO.train_encoder is False, but the visual encoder is "
+                "not initialized from RL.DDPPO.pretrained_weights: set "
+                "RL.DDPPO.pretrained or RL.DDPPO.pretrained_encoder"
+            )
+        if self._static_encoder:
+            self._encoder = self.policy.net.visual_encoder
+            for param in self._encoder.parameters():
+                param.requires_grad_(False)
         self.ppo_cfg = self.agent_config.RL.PPO
         self.agent = PPO(
             actor_critic=self.policy,
@@ -165,6 +261,7 @@ class PPOTrainer(BaseRLTrainer):
             max_grad_norm=self.ppo_cfg.max_grad_norm,
             use_normalized_advantage=self.ppo_cfg.use_normalized_advantage,
         )
+        self.inference = self.build_inference()
 
         logging.info(
         "agent number of parameters: {}".format(
@@ -172,11 +269,27 @@ class PPOTrainer(BaseRLTrainer):
             )
         )
         self._nbuffers = 2 if self.ppo_cfg.use_double_buffered_sampler else 1
-        self.observation_spec.spaces.pop('global_occupancy_grid')
+        # the rollouts store a subset of the observations, the policy and eval
+        # keep the full observation spec
+        rollout_spec = spaces.Dict(copy.copy(self.observation_spec.spaces))
+        # the occupancy grid (or its raw scan inputs) is only used for eval videos
+        for key in ('global_occupancy_grid',) + RAW_SCAN_KEYS:
+            rollout_spec.spaces.pop(key, None)
+        if self._static_encoder:
+            for key in self._encoder.visual_keys:
+                rollout_spec.spaces.pop(key)
+            rollout_spec.spaces[
+                PointNavResNetNet.PRETRAINED_VISUAL_FEATURES_KEY
+            ] = spaces.Box(
+                low=np.finfo(np.float32).min,
+                high=np.finfo(np.float32).max,
+                shape=self._encoder.output_shape,
+                dtype=np.float32,
+            )
         self.rollouts = RolloutStorage(
             self.ppo_cfg.num_steps,
             self.num_parallel_environments,
-            self.observation_spec,
+            rollout_spec,
             self.action_spec,
             self.ppo_cfg.hidden_size,
             num_recurrent_layers=self.policy.net.num_recurrent_layers,
@@ -185,7 +298,8 @@ class PPOTrainer(BaseRLTrainer):
         self.rollouts.to(self.device)
 
         observations = self.tf_env.reset().observation
-        observations.pop('global_occupancy_grid')
+        for key in ('global_occupancy_grid',) + RAW_SCAN_KEYS:
+            observations.pop(key, None)
         # 获取批次大小
         batch_size = next(iter(observations.values())).shape[0]
 
@@ -205,6 +319,8 @@ class PPOTrainer(BaseRLTrainer):
             observations, device=self.device, cache=self._obs_batching_cache
         )
         batch = apply_obs_transforms_batch(batch, self.obs_transforms)
+        if self._static_encoder:
+            batch = self._encode_visual_observations(batch)
 
         self.rollouts.buffers["observations"][0] = batch
 
@@ -219,6 +335,8 @@ class PPOTrainer(BaseRLTrainer):
 
         self.env_time = 0.0
         self.pth_time = 0.0
+        # seconds spent in each phase of the collection and update loop
+        self.phase_time = defaultdict(float)
         self.t_start = time.time()
         self.count_checkpoints = 0
         self.prev_time = 0
@@ -306,34 +424,7 @@ class PPOTrainer(BaseRLTrainer):
 
                 """收集训练data"""
                 # TODO: 因为这里map是一部分，这里如何去处理global goal，这里用相对距离可能可以
-                self.agent.eval()
-                count_steps_delta = 0
-                for buffer_index in range(self._nbuffers):
-                    self._compute_actions_and_step_envs(buffer_index)
-
-                for step in range(self.ppo_cfg.num_steps):
-                    is_last_step = (
-                        False
-                        or (step + 1) == self.ppo_cfg.num_steps
-                    )
-
-                    for buffer_index in range(self._nbuffers):
-                        count_steps_delta += self._collect_environment_result(
-                            buffer_index
-                        )
-
-                        if (buffer_index + 1) == self._nbuffers:
-                            pass
-
-                        if not is_last_step:
-                            if (buffer_index + 1) == self._nbuffers:
-                                pass
-
-                            self._compute_actions_and_step_envs(buffer_index)
-
-                    if is_last_step:
-                        break
-
+                count_steps_delta = self._collect_rollout()
 
                 (
                     value_loss,
@@ -422,7 +513,7 @@ class PPOTrainer(BaseRLTrainer):
             logging.info(f"env config: {config}")
         self.model_ids = model_ids
         self.env_to_pause = []
-        self.init_envs(env_load_fn)
+        self.init_envs(env_load_fn, render_video=len(self.config.VIDEO_OPTION) > 0)
         self.set_agent()
 
         self.agent.load_state_dict(ckpt_dict["state_dict"])
@@ -502,7 +593,7 @@ class PPOTrainer(BaseRLTrainer):
                     actions,
                     _,
                     test_recurrent_hidden_states,
-                ) = self.actor_critic.act(
+                ) = (self.inference or self.actor_critic).act(
                     batch,
                     test_recurrent_hidden_states,
                     prev_actions,
@@ -608,7 +699,12 @@ class PPOTrainer(BaseRLTrainer):
 
                 # episode continues
                 elif len(self.config.VIDEO_OPTION) > 0:
-                    info[envs_to_pause_for_pop_idx]['occupancy_grid'] = observations[envs_to_pause_for_pop_idx]["global_occupancy_grid"]
+                    # taken from the batch so that grids rasterized on the learner
+                    # (OccupancyGridRasterizer) are shown too; values are OccupancyGridState * 2
+                    if "global_occupancy_grid" in batch:
+                        info[envs_to_pause_for_pop_idx]['occupancy_grid'] = (
+                            batch["global_occupancy_grid"][envs_to_pause_for_pop_idx].cpu().numpy().astype(np.float32) / 2.0
+                        )
                     # TODO move normalization / channel changing out of the policy and undo it here
                     frame = observations_to_image(
                         {k: v for k, v in observations[envs_to_pause_for_pop_idx].items() if k != 'task_obs'}, info[envs_to_pause_for_pop_idx]
@@ -672,6 +768,20 @@ class PPOTrainer(BaseRLTrainer):
     def is_done(self) -> bool:
         return self.percent_done() >= 1.0
         
+    def _encode_visual_observations(self, batch: TensorDict) -> TensorDict:
+        r"""Replace the observations read by the frozen visual encoder with
+        its features, which the policy uses instead of running the encoder.
+        """
+        with torch.no_grad():
+            # the running mean and var of a frozen encoder are not updated
+            self._encoder.eval()
+            batch[
+                PointNavResNetNet.PRETRAINED_VISUAL_FEATURES_KEY
+            ] = self._encoder(batch)
+        for key in self._encoder.visual_keys:
+            batch.pop(key)
+        return batch
+
     def _compute_actions_and_step_envs(self, buffer_index: int = 0):
         num_envs = self.num_parallel_environments
         env_slice = slice(
@@ -680,6 +790,7 @@ class PPOTrainer(BaseRLTrainer):
         )
 
 
+        t_sample_action = time.time()
         # sample actions
         with torch.no_grad():
             step_batch = self.rollouts.buffers[
@@ -692,7 +803,7 @@ class PPOTrainer(BaseRLTrainer):
                 actions,
                 actions_log_probs,
                 recurrent_hidden_states
-            ) = self.policy.act(
+            ) = (self.inference or self.policy).act(
                 step_batch["observations"],
                 step_batch["recurrent_hidden_states"],
                 step_batch["prev_actions"],
@@ -715,6 +826,33 @@ class PPOTrainer(BaseRLTrainer):
             buffer_index=buffer_index,
         )
 
+        self.phase_time["act"] += time.time() - t_sample_action
+        self.pth_time += time.time() - t_sample_action
+
+    def _collect_rollout(self) -> int:
+        r"""Fill the rollout storage with num_steps steps of every env.
+
+        Returns:
+            number of env steps collected
+        """
+        self.agent.eval()
+        count_steps_delta = 0
+        for buffer_index in range(self._nbuffers):
+            self._compute_actions_and_step_envs(buffer_index)
+
+        for step in range(self.ppo_cfg.num_steps):
+            is_last_step = (step + 1) == self.ppo_cfg.num_steps
+
+            for buffer_index in range(self._nbuffers):
+                count_steps_delta += self._collect_environment_result(
+                    buffer_index
+                )
+
+                if not is_last_step:
+                    self._compute_actions_and_step_envs(buffer_index)
+
+        return count_steps_delta
+
     def _extract_scalars_from_info(
         self, info: Dict[str, Any]
     ) -> Dict[str, float]:
@@ -775,6 +913,9 @@ class PPOTrainer(BaseRLTrainer):
 
         self.rollouts.after_update()
 
+        self.phase_time["update"] += time.time() - t_update_model
+        self.pth_time += time.time() - t_update_model
+
         return (
             value_loss,
             action_loss,
@@ -803,9 +944,15 @@ class PPOTrainer(BaseRLTrainer):
         actions = step_batch['actions'].to(device="cpu")
 
 
+        t_step_env = time.time()
         outputs = self.tf_env.step(actions)
+        self.phase_time["env"] += time.time() - t_step_env
+        self.env_time += time.time() - t_step_env
+
+        t_update_stats = time.time()
         step_type, rewards_l, discount, observations, info = outputs.step_type, outputs.reward, outputs.discount, outputs.observation, outputs.info
-        observations.pop('global_occupancy_grid')
+        for key in ('global_occupancy_grid',) + RAW_SCAN_KEYS:
+            observations.pop(key, None)
         # 获取批次大小
         batch_size = next(iter(observations.values())).shape[0]
 
@@ -833,11 +980,12 @@ class PPOTrainer(BaseRLTrainer):
         for i in range(batch_size):
             dones.append(False) if info[i]['done'] == False else dones.append(True)
 
-        t_update_stats = time.time()
         batch = batch_obs(
             observations, device=self.device, cache=self._obs_batching_cache
         )
         batch = apply_obs_transforms_batch(batch, self.obs_transforms)
+        if self._static_encoder:
+            batch = self._encode_visual_observations(batch)
 
         rewards = torch.tensor(
             rewards_l,
@@ -883,6 +1031,9 @@ class PPOTrainer(BaseRLTrainer):
 
         self.rollouts.advance_rollout(buffer_index)
 
+        self.phase_time["batch"] += time.time() - t_update_stats
+        self.pth_time += time.time() - t_update_stats
+
         return env_slice.stop - env_slice.start
     
     def _all_reduce(self, t: torch.Tensor) -> torch.Tensor:
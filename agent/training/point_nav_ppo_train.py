@@ -2,6 +2,7 @@
 from agent.trainer.ppo_trainer import PPOTrainer
 from absl import flags, app
 from agent.environments import suite_gibson
+import functools
 import os
 
 flags.DEFINE_string('root_dir', os.getenv('TEST_UNDECLARED_OUTPUTS_DIR'),
@@ -81,45 +82,43 @@ flags.DEFINE_integer('num_episodes', 5,
 FLAGS = flags.FLAGS
 
 
+def load_env(model_id, mode, device_idx, config_file, action_timestep, physics_timestep, **render_spec):
+    return suite_gibson.load(
+        config_file=config_file,
+        model_id=model_id,
+        env_mode=mode,
+        action_timestep=action_timestep,
+        physics_timestep=physics_timestep,
+        device_idx=device_idx,
+        **render_spec
+    )
+
+
 def main(argv):
     FLAGS(argv)
     trainer = PPOTrainer(FLAGS)
+    # module-level function and partial, picklable for every multiprocessing start method
+    env_load_fn = functools.partial(
+        load_env,
+        config_file=FLAGS.config_file,
+        action_timestep=FLAGS.action_timestep,
+        physics_timestep=FLAGS.physics_timestep,
+    )
 
     if FLAGS.generate_data == True:
         trainer.generate_data(
-            env_load_fn=lambda model_id, mode, device_idx: suite_gibson.load(
-                config_file=FLAGS.config_file,
-                model_id=model_id,
-                env_mode=mode,
-                action_timestep=FLAGS.action_timestep,
-                physics_timestep=FLAGS.physics_timestep,
-                device_idx=device_idx,
-            ),
+            env_load_fn=env_load_fn,
             model_ids=FLAGS.model_ids,
             num_episodes=FLAGS.num_episodes,
         )
 
     elif FLAGS.eval_only == False:
         trainer.train(
-            env_load_fn=lambda model_id, mode, device_idx: suite_gibson.load(
-                config_file=FLAGS.config_file,
-                model_id=model_id,
-                env_mode=mode,
-                action_timestep=FLAGS.action_timestep,
-                physics_timestep=FLAGS.physics_timestep,
-                device_idx=device_idx,
-            ),
+            env_load_fn=env_load_fn,
         )
     elif FLAGS.eval_only == True:
         trainer.eval(
-            env_load_fn=lambda model_id, mode, device_idx: suite_gibson.load(
-                config_file=FLAGS.config_file,
-                model_id=model_id,
-                env_mode=mode,
-                action_timestep=FLAGS.action_timestep,
-                physics_timestep=FLAGS.physics_timestep,
-                device_idx=device_idx,
-            ),
+            env_load_fn=env_load_fn,
             model_ids=FLAGS.model_ids
         )
 
@@ -101,6 +101,9 @@ def observations_to_image(observation: Dict, info: Dict) -> np.ndarray:
         top_down_map = info["occupancy_grid"]
         #top_down_map的shape是(128,128,1)，我想要去除最后一个维度
         top_down_map = top_down_map.squeeze()
+        if np.issubdtype(top_down_map.dtype, np.integer):
+            # occupancy grid is sent as uint8 OccupancyGridState * 2
+            top_down_map = top_down_map.astype(np.float32) / 2.0
         top_down_map = cv2.resize(
         top_down_map,
         (egocentric_view.shape[0], egocentric_view.shape[0]),